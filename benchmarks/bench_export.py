@@ -0,0 +1,41 @@
+"""Write 10k homeworks as JSON Lines, CSV and TSV, and as the rich table.
+
+Run with `python -m benchmarks.bench_export` from the repository root.
+"""
+import io
+import random
+import time
+from datetime import datetime, timezone
+
+from loguru import logger
+from rich.console import Console
+
+from benchmarks.bench_homework import HOMEWORK_COUNT, make_homework
+from prpr.export import OutputFormat, export_homeworks
+from prpr.filters import FilterMode
+from prpr.homework import Homework
+from prpr.table import print_issue_table
+
+
+def main():
+    logger.remove()
+    random.seed(0)
+    now = datetime.now(timezone.utc)
+    homeworks = [make_homework(number, now) for number in range(1, HOMEWORK_COUNT + 1)]
+
+    for output_format in (OutputFormat.JSONL, OutputFormat.CSV, OutputFormat.TSV):
+        started = time.perf_counter()
+        export_homeworks(homeworks, output_format, io.StringIO())
+        elapsed = time.perf_counter() - started
+        print(f"{output_format}: {elapsed:.3f}s ({elapsed / HOMEWORK_COUNT * 1e6:.1f} µs per row)")
+
+    started = time.perf_counter()
+    console = Console(file=io.StringIO(), width=200)
+    sorted_homeworks = sorted(homeworks, key=Homework.order_key)
+    print_issue_table(sorted_homeworks, mode=FilterMode.ALL, console=console, table_appearance={})
+    elapsed = time.perf_counter() - started
+    print(f"table: {elapsed:.3f}s ({elapsed / HOMEWORK_COUNT * 1e6:.1f} µs per row)")
+
+
+if __name__ == "__main__":
+    main()
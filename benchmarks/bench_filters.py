@@ -0,0 +1,92 @@
+"""Filter 50k homeworks with every combination of the filters.
+
+Compares the compiled filter with building a list per filter, as it used to be done,
+and with selecting through the index of the homeworks, the way a list filtered repeatedly is.
+Run with `python -m benchmarks.bench_filters` from the repository root.
+"""
+import datetime as dt
+import itertools
+import random
+import time
+from datetime import datetime, timezone
+
+from loguru import logger
+
+from benchmarks.bench_homework import make_homework
+from prpr.config import Config
+from prpr.filters import FilterMode, HomeworkIndex, filter_homeworks, get_date_range, get_statuses
+from prpr.homework import Homework
+
+HOMEWORK_COUNT = 50_000
+MODES = [FilterMode.STANDARD, FilterMode.ALL, FilterMode.OPEN, FilterMode.CLOSED, FilterMode.CLOSED_THIS_MONTH]
+FILTERS = {
+    "problems": [3, 7],
+    "student": "ХАРМС12",
+    "cohorts": ["5", "6", "7"],
+    "from_date": dt.date.today() - dt.timedelta(days=2),
+    "to_date": dt.date.today() - dt.timedelta(days=1),
+}
+
+
+def filter_list_per_filter(homeworks: list[Homework], mode: FilterMode, config: Config, **filters) -> list[Homework]:
+    statuses, exclude = get_statuses(mode)
+    result = homeworks
+    if statuses is not None:
+        result = [h for h in result if (h.status in statuses) != exclude]
+    from_date, to_date = get_date_range(mode, config, filters.get("from_date"), filters.get("to_date"))
+    if problems := filters.get("problems"):
+        result = [h for h in result if h.problem in problems]
+    if student := filters.get("student"):
+        result = [h for h in result if student.lower() in h.student.lower()]
+    if cohorts := filters.get("cohorts"):
+        result = [h for h in result if h.cohort in cohorts]
+    if from_date:
+        from_date = dt.datetime.combine(from_date, dt.time.min).astimezone()
+        result = [h for h in result if from_date <= h.status_updated]
+    if to_date:
+        to_date = dt.datetime.combine(to_date, dt.time.max).astimezone()
+        result = [h for h in result if h.status_updated <= to_date]
+    return result
+
+
+def main():
+    logger.remove()
+    random.seed(0)
+    now = datetime.now(timezone.utc)
+    homeworks = [make_homework(number, now) for number in range(1, HOMEWORK_COUNT + 1)]
+    config = Config(startrek_token="token")
+    combinations = [
+        (mode, dict(filters))
+        for mode in MODES
+        for size in range(len(FILTERS) + 1)
+        for filters in itertools.combinations(FILTERS.items(), size)
+    ]
+
+    started = time.perf_counter()
+    expected = [filter_list_per_filter(homeworks, mode, config, **filters) for mode, filters in combinations]
+    per_filter = time.perf_counter() - started
+
+    started = time.perf_counter()
+    compiled = [filter_homeworks(homeworks, mode=mode, config=config, **filters) for mode, filters in combinations]
+    compiled_filter = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = HomeworkIndex(homeworks)
+    index_built = time.perf_counter() - started
+    indexed = [
+        filter_homeworks(homeworks, mode=mode, config=config, index=index, **filters) for mode, filters in combinations
+    ]
+    indexed_filter = time.perf_counter() - started - index_built
+
+    assert compiled == expected
+    assert indexed == expected
+    count = len(combinations)
+    print(f"{count} combinations of filters over {HOMEWORK_COUNT} homeworks:")
+    print(f"list per filter: {per_filter:.3f}s ({per_filter / count * 1e3:.1f} ms per combination)")
+    print(f"compiled:        {compiled_filter:.3f}s ({compiled_filter / count * 1e3:.1f} ms per combination)")
+    print(f"indexed:         {indexed_filter:.3f}s ({indexed_filter / count * 1e3:.1f} ms per combination)")
+    print(f"index build:     {index_built:.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""Build and render 10k homeworks.
+
+Run with `python -m benchmarks.bench_homework` from the repository root.
+"""
+import io
+import random
+import time
+from datetime import datetime, timedelta, timezone
+
+from rich.console import Console
+
+from prpr.filters import FilterMode
+from prpr.homework import Homework, Status, StatusTransition
+from prpr.table import print_issue_table
+
+HOMEWORK_COUNT = 10_000
+STATUSES = ["open", "inReview", "onTheSideOfUser", "resolved", "closed"]
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S.000+0000"
+
+
+def make_homework(number: int, now: datetime) -> Homework:
+    status_updated = now - timedelta(minutes=random.randrange(3 * 24 * 60))
+    transitions = [
+        StatusTransition(Status.IN_REVIEW, Status.OPEN, status_updated - timedelta(days=iteration))
+        for iteration in range(random.randrange(1, 5))
+    ]
+    return Homework(
+        issue_key=f"PCR-{10_000 + number}",
+        lesson_name="Финальное задание спринта: служба доставки",
+        summary=f"[{random.randrange(1, 16)}] Даниил Хармс{number} (yuvachev{number}@yandex.ru)",
+        cohort=str(random.randrange(1, 40)),
+        status=random.choice(STATUSES),
+        status_updated=status_updated.strftime(TIMESTAMP_FORMAT),
+        description=(
+            f"Ревью: ==https://admin.praktikum.yandex-team.ru/office/revisor-review/{number}/abc{number}\n"
+            + "Текст задания. " * 20
+        ),
+        number=number,
+        course="backend-developer",
+        transitions=transitions,
+        sla={"id": "8126", "startedAt": status_updated.strftime(TIMESTAMP_FORMAT), "failAt": None},
+    )
+
+
+def main():
+    random.seed(0)
+    now = datetime.now(timezone.utc)
+
+    started = time.perf_counter()
+    homeworks = [make_homework(number, now) for number in range(1, HOMEWORK_COUNT + 1)]
+    built = time.perf_counter()
+
+    homeworks.sort(key=Homework.order_key)
+    sorted_ = time.perf_counter()
+
+    console = Console(file=io.StringIO(), width=200)
+    print_issue_table(homeworks, mode=FilterMode.ALL, console=console, table_appearance={})
+    rendered = time.perf_counter()
+
+    print(f"build:  {built - started:.3f}s ({(built - started) / HOMEWORK_COUNT * 1e6:.1f} µs per homework)")
+    print(f"sort:   {sorted_ - built:.3f}s")
+    print(f"render: {rendered - sorted_:.3f}s ({(rendered - sorted_) / HOMEWORK_COUNT * 1e6:.1f} µs per row)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+"""Parse a synthetic corpus of PCR tickets.
+
+Compares prpr.parsing with passing the raw patterns to re.* on every call, as it used to be done,
+separately for what's parsed when a Homework is built and for the Revisor url, which is parsed on the first access.
+Then reads the Revisor urls of built homeworks several times, as a listing followed by downloads does.
+Run with `python -m benchmarks.bench_parsing` from the repository root.
+"""
+import random
+import re
+import time
+
+from loguru import logger
+
+from prpr.homework import Homework
+from prpr.parsing import parse_lesson_name, parse_revisor_url, parse_summary, split_student_info
+
+TICKET_COUNT = 50_000
+ACCESS_COUNT = 5
+NAMES = ["Даниил Хармс", "Александр Введенский", "Николай Олейников", "Игорь Бахтерев", "Константин Вагинов"]
+LESSONS = ["Финальное задание спринта: служба доставки", "Проект спринта: Yatube", "API для Yatube"]
+
+
+def make_ticket(number: int) -> tuple[str, str, str, str]:
+    name = random.choice(NAMES)
+    summary = f"[{random.randrange(1, 16)}] {name} (student{number}@yandex.ru)"
+    if random.random() < 0.1:
+        summary = summary.replace("] ", f" (back_cohort_{random.randrange(1, 30)})] ", 1)
+    description = (
+        "Студент отправил работу на проверку.\n" * random.randrange(1, 10)
+        + f"Ревью: ==https://admin.praktikum.yandex-team.ru/office/revisor-review/{number}/abc{number}\n"
+        + "Критерии оценки: ...\n" * random.randrange(1, 30)
+    )
+    if random.random() < 0.01:
+        description = "Ссылка потерялась."
+    return f"PCR-{number}", summary, description, random.choice(LESSONS)
+
+
+def parse_with_raw_patterns(summary, lesson_name):
+    m = re.match(r"\[(?P<problem>\d+)( \(back_cohort_(?P<cohort>\d+)\))?\] (?P<student>.*)", summary)
+    student = m.group("student")
+    re.match(r"^(?P<name>.*?) \((?P<email>.*)\)$", student)
+    re.search(r"спринта: (.+)$", lesson_name)
+
+
+def parse_with_prpr(summary, lesson_name):
+    _, student = parse_summary(summary)
+    split_student_info(student)
+    parse_lesson_name(lesson_name)
+
+
+def parse_revisor_url_with_raw_pattern(description):
+    re.search(
+        r"==(?P<url>https://(?:admin\.praktikum|pra(c|k)ti(k|c)um-admin)\.yandex-team\.ru"
+        r"/office/revisor-review/(\d+)/(\w+))\b",
+        description,
+    )
+
+
+def make_homework(ticket: tuple[str, str, str, str]) -> Homework:
+    issue_key, summary, description, lesson_name = ticket
+    return Homework(
+        issue_key=issue_key,
+        lesson_name=lesson_name,
+        summary=summary,
+        cohort="1",
+        status="open",
+        status_updated="2021-05-11T02:13:00.000+0000",
+        description=description,
+        number=Homework.to_issue_key_number(issue_key),
+        course="backend-developer",
+    )
+
+
+def measure(parse, arguments) -> float:
+    started = time.perf_counter()
+    for args in arguments:
+        parse(*args)
+    return time.perf_counter() - started
+
+
+def report(name: str, elapsed: float, count: int, unit: str):
+    print(f"{name:>32}: {elapsed:.3f}s ({elapsed / count * 1e6:.2f} µs per {unit})")
+
+
+def main():
+    random.seed(0)
+    logger.remove()
+    corpus = [make_ticket(number) for number in range(1, TICKET_COUNT + 1)]
+    build_args = [(summary, lesson_name) for _, summary, _, lesson_name in corpus]
+    description_args = [(description,) for _, _, description, _ in corpus]
+    for name, parse, arguments in [
+        ("build, raw patterns", parse_with_raw_patterns, build_args),
+        ("build, prpr.parsing", parse_with_prpr, build_args),
+        ("Revisor url, raw pattern", parse_revisor_url_with_raw_pattern, description_args),
+        ("Revisor url, prpr.parsing", parse_revisor_url, description_args),
+    ]:
+        report(name, measure(parse, arguments), TICKET_COUNT, "ticket")
+
+    homeworks = [make_homework(ticket) for ticket in corpus]
+    started = time.perf_counter()
+    for _ in range(ACCESS_COUNT):
+        for homework in homeworks:
+            homework.revisor_url
+    report(f"Homework.revisor_url x{ACCESS_COUNT}", time.perf_counter() - started, TICKET_COUNT * ACCESS_COUNT, "read")
+
+
+if __name__ == "__main__":
+    main()
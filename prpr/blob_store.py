@@ -0,0 +1,104 @@
+"""Content-addressed storage of the extracted files, shared by all the iterations of all the homeworks."""
+
+from __future__ import annotations
+
+import errno
+import hashlib
+import os
+import shutil
+import stat
+import tempfile
+import time
+from pathlib import Path
+from typing import BinaryIO
+
+from loguru import logger
+
+BLOB_STORE_DIRECTORY_NAME = ".blobs"
+TEMPORARY_SUFFIX = ".tmp"
+TEMPORARY_MAX_AGE = 60 * 60  # seconds, younger temporary files may still be written
+CHUNK_SIZE = 64 * 1024
+
+
+class BlobStore:
+    """Files named by the SHA-256 of their contents, hard-linked into the iteration directories.
+
+    The blobs are read-only, so that a file edited in one iteration doesn't change all of its copies.
+    A blob which is only linked from the store itself (st_nlink == 1) is garbage, see collect_garbage.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+
+    @staticmethod
+    def for_download_directory(download_directory: Path) -> BlobStore:
+        return BlobStore(download_directory / BLOB_STORE_DIRECTORY_NAME)
+
+    def put(self, source: BinaryIO, target: Path) -> None:
+        """Store the contents of source unless they are stored already, and link target to the blob."""
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, temporary = tempfile.mkstemp(dir=self.directory, suffix=TEMPORARY_SUFFIX)
+        try:
+            digest = hashlib.sha256()
+            with os.fdopen(fd, "wb") as f:
+                while chunk := source.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    f.write(chunk)
+            os.chmod(temporary, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            blob = self._get_blob_path(digest.hexdigest())
+            blob.parent.mkdir(exist_ok=True)
+            # The temporary file is kept until the target is linked, so that the new blob never has a single link
+            # and collect_garbage running meanwhile doesn't take it for garbage.
+            while True:
+                try:
+                    os.link(temporary, blob)  # atomic, unlike checking for the blob first
+                except FileExistsError:
+                    pass
+                try:
+                    _link_or_copy(blob, target)
+                    break
+                except FileNotFoundError:
+                    logger.debug(f"{blob} was collected meanwhile, storing it again...")
+        finally:
+            os.unlink(temporary)
+
+    def collect_garbage(self) -> tuple[int, int]:
+        """Remove the blobs no iteration links to and leftovers of interrupted writes; return their count and size.
+
+        The temporary files younger than TEMPORARY_MAX_AGE are kept, as they may belong to a running download.
+        """
+        removed, freed = 0, 0
+        if not self.directory.exists():
+            return removed, freed
+        now = time.time()
+        for path in self.directory.rglob("*"):
+            if path.is_dir():
+                continue
+            try:
+                status = path.stat()
+                if path.name.endswith(TEMPORARY_SUFFIX):
+                    garbage = now - status.st_mtime >= TEMPORARY_MAX_AGE
+                else:
+                    garbage = status.st_nlink == 1
+                if garbage:
+                    path.unlink()
+                    removed += 1
+                    freed += status.st_size
+            except FileNotFoundError:
+                pass  # a temporary file removed by a download meanwhile
+        logger.debug(f"Removed {removed} blobs ({freed} bytes) from {self.directory}.")
+        return removed, freed
+
+    def _get_blob_path(self, hexdigest: str) -> Path:
+        return self.directory / hexdigest[:2] / hexdigest[2:]
+
+
+def _link_or_copy(blob: Path, target: Path) -> None:
+    try:
+        os.link(blob, target)
+    except OSError as e:
+        if e.errno not in {errno.EMLINK, errno.EXDEV}:
+            raise
+        # Too many links to one inode, or the iteration directory is on another file system.
+        logger.debug(f"Failed to link {blob} to {target}: {e}, copying...")
+        shutil.copyfile(blob, target)
@@ -1,16 +1,27 @@
 import argparse
 import datetime as dt
 
-from prpr.download import DownloadMode
+from prpr.download_mode import DownloadMode
+from prpr.export import OutputFormat
 from prpr.filters import FilterMode
 
 DOWNLOAD = "--download"
 POST_PROCESS = "--post-process"
 INTERACTIVE = "--interactive"
+WATCH = "--watch"
+PREFETCH = "--prefetch"
+GC = "gc"
+DEFAULT_WATCH_INTERVAL = 60  # seconds
 
 
 def configure_arg_parser():
     arg_parser = argparse.ArgumentParser(formatter_class=argparse.RawTextHelpFormatter)
+    arg_parser.add_argument(
+        "command",
+        nargs="?",
+        choices=[GC],
+        help=f"{GC}: remove the files of download > blob_store no iteration links to, then exit",
+    )
     filters = arg_parser.add_argument_group(
         "filters",
         "these allow to specify the subset of homeworks to be displayed, can be composed",
@@ -18,6 +29,24 @@ def configure_arg_parser():
     configure_filter_arguments(filters)
 
     arg_parser.add_argument("-o", "--open", action="store_true", default=False, help="open homework pages in browser")
+    arg_parser.add_argument(
+        "--format",
+        type=OutputFormat,
+        choices=list(OutputFormat),
+        default=OutputFormat.TABLE,
+        help="table: the table for humans (default); "
+        "jsonl, csv, tsv: a record per homework as it arrives, for scripts",
+    )
+    arg_parser.add_argument(
+        "-W",
+        WATCH,
+        nargs="?",
+        type=int,
+        const=DEFAULT_WATCH_INTERVAL,
+        metavar="SECONDS",
+        help=f"keep the table on screen, checking the tracker for updates every SECONDS ({DEFAULT_WATCH_INTERVAL} "
+        "by default); new and reopened tickets are highlighted",
+    )
 
     download_options = arg_parser.add_argument_group(
         "download",
@@ -32,6 +61,10 @@ def configure_arg_parser():
     )
     process_options = arg_parser.add_argument_group("process")
     configure_process_arguments(process_options)
+    cache_options = arg_parser.add_argument_group("cache")
+    configure_cache_arguments(cache_options)
+    offline_options = arg_parser.add_argument_group("offline")
+    configure_offline_arguments(offline_options)
     return arg_parser
 
 
@@ -61,7 +94,7 @@ def configure_filter_arguments(filters):
         "-n",
         "--no",
         type=int,
-        help="the no of the homework to be shown, all other filters are ignored",
+        help="the no of the homework to be shown (100 for PCR-100), all other filters are ignored",
     )
     filters.add_argument(
         "-s",
@@ -122,6 +155,20 @@ def configure_download_arguments(download_options):
         action="store_true",
         default=False,
     )
+    download_options.add_argument(
+        "-w",
+        "--workers",
+        help="the number of browsers downloading homeworks in parallel (makes sense for `--download all`)",
+        type=int,
+        default=1,
+    )
+    download_options.add_argument(
+        PREFETCH,
+        help="while a homework is being chosen interactively, download the first K open ones in the background",
+        type=int,
+        default=0,
+        metavar="K",
+    )
     download_options.add_argument(
         "-i",
         INTERACTIVE,
@@ -137,3 +184,40 @@ def configure_process_arguments(process_options):
         action="store_true",
         default=False,
     )
+    process_options.add_argument(
+        "--force-steps",
+        action="store_true",
+        default=False,
+        help="run all the post-processing steps, even the ones whose inputs haven't changed since the last run",
+    )
+
+
+def configure_cache_arguments(cache_options):
+    cache_group = cache_options.add_mutually_exclusive_group()
+    cache_group.add_argument(
+        "--no-cache",
+        action="store_true",
+        default=False,
+        help="don't use the on-disk cache of tracker responses",
+    )
+    cache_group.add_argument(
+        "--refresh",
+        action="store_true",
+        default=False,
+        help="clear the on-disk cache of tracker responses before fetching",
+    )
+
+
+def configure_offline_arguments(offline_options):
+    offline_options.add_argument(
+        "--offline",
+        action="store_true",
+        default=False,
+        help="list the homeworks stored by the previous runs, without the tracker",
+    )
+    offline_options.add_argument(
+        "--background-sync",
+        action="store_true",
+        default=False,
+        help="with --offline: sync with the tracker after the table is shown, show it again if anything has changed",
+    )
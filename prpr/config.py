@@ -1,16 +1,293 @@
+from __future__ import annotations
+
+import sys
+from dataclasses import dataclass, field
+from datetime import timedelta
 from pathlib import Path
+from typing import Any, Optional
 
 import yaml
 from loguru import logger
 
 CONFIG_FILENAME = ".prpr.yaml"
 
+STARTREK_TOKEN_KEY_NAME = "startrek_token"
+DEFAULT_MONTH_START = 16
+DEFAULT_TRACKER_CONCURRENCY = 8
+DEFAULT_TRACKER_PAGE_SIZE = 100
+DEFAULT_CACHE_DIRECTORY = Path("~/.cache/prpr")
+DEFAULT_SEARCH_EXPIRE_AFTER = timedelta(minutes=1)
+DEFAULT_EXPIRE_AFTER = timedelta(days=1)  # components, users and the like
+DEFAULT_CHANGELOG_EXPIRE_AFTER = timedelta(days=30)  # unless the issue is updated earlier
+DEFAULT_ZIP_WORKERS = 8
+DEFAULT_CONNECTIONS_PER_HOST = 4
+SUPPORTED_BROWSERS = ("firefox",)
+DEFAULT_RUNNER = ["bash", "-c"]
+DEFAULT_PROCESS_MAX_WORKERS = 1
+DEFAULT_CONSOLE_MAX_LINES = 1000
+CONSOLE_KEEP_VALUES = ("head", "tail")
+
+_cached_config: Optional[Config] = None
+_NOT_REJECTED = object()
+_rejected_mtime: Any = _NOT_REJECTED  # of the last config edit that failed to reload, None if the file was missing
+
+
+class ConfigError(ValueError):
+    pass
+
+
+@dataclass
+class TrackerConfig:
+    concurrency: int = DEFAULT_TRACKER_CONCURRENCY
+    page_size: int = DEFAULT_TRACKER_PAGE_SIZE
+    cache_directory: Path = DEFAULT_CACHE_DIRECTORY
+    search_expire_after: timedelta = DEFAULT_SEARCH_EXPIRE_AFTER
+    expire_after: timedelta = DEFAULT_EXPIRE_AFTER
+    changelog_expire_after: timedelta = DEFAULT_CHANGELOG_EXPIRE_AFTER
+
+
+@dataclass
+class BrowserConfig:
+    type: str
+    profile_path: str
+
+
+@dataclass
+class DownloadConfig:
+    directory: Optional[Path] = None
+    browser: Optional[BrowserConfig] = None
+    zip_workers: int = DEFAULT_ZIP_WORKERS
+    connections_per_host: int = DEFAULT_CONNECTIONS_PER_HOST
+    http_extraction: bool = True  # try plain HTTP with the profile's cookies before starting a browser
+    include: list[str] = field(default_factory=list)  # globs of the archive members to extract, empty for all
+    exclude: list[str] = field(default_factory=list)  # globs of the archive members not to extract
+    link_unchanged: bool = False  # hard-link the files which are the same as in the previous iteration
+    blob_store: bool = False  # keep the extracted files once per content, in directory/.blobs
 
-def get_config():
+
+@dataclass
+class ProcessConfig:
+    runner: list[str] = field(default_factory=lambda: list(DEFAULT_RUNNER))
+    max_workers: int = DEFAULT_PROCESS_MAX_WORKERS
+    console_max_lines: Optional[int] = DEFAULT_CONSOLE_MAX_LINES  # None means no limit
+    console_keep: str = "head"
+    default: dict[str, Any] = field(default_factory=dict)  # {"steps": {...}}
+    courses: dict[str, Any] = field(default_factory=dict)  # {course: {"default": {...}, "problems": {n: {...}}}}
+
+
+@dataclass
+class Config:
+    """The contents of ~/.prpr.yaml, validated; see .prpr-example.yaml for the keys."""
+
+    startrek_token: str
+    free_work_owner: Optional[str] = None
+    month_start: int = DEFAULT_MONTH_START
+    component_suffixes: dict[str, str] = field(default_factory=dict)
+    table_appearance: dict[str, Any] = field(default_factory=dict)
+    tracker: TrackerConfig = field(default_factory=TrackerConfig)
+    download: DownloadConfig = field(default_factory=DownloadConfig)
+    process: Optional[ProcessConfig] = None
+    path: Optional[Path] = None
+    mtime: Optional[float] = None
+
+    @staticmethod
+    def from_dict(raw: dict[str, Any]) -> Config:
+        if not isinstance(raw, dict):
+            raise ConfigError("the config should be a mapping")
+        if not (token := raw.get(STARTREK_TOKEN_KEY_NAME)):
+            raise ConfigError(f"{STARTREK_TOKEN_KEY_NAME} top-level key not found")
+        month_start = _get_int(raw, "month_start", DEFAULT_MONTH_START)
+        if not 1 <= month_start <= 28:
+            raise ConfigError(f"month_start should be between 1 and 28, got {month_start}")
+        return Config(
+            startrek_token=token,
+            free_work_owner=raw.get("free_work_owner"),
+            month_start=month_start,
+            component_suffixes=_get_mapping(raw, "component_suffixes"),
+            table_appearance=_get_mapping(raw, "table_appearance"),
+            tracker=_parse_tracker_config(_get_mapping(raw, "tracker")),
+            download=_parse_download_config(_get_mapping(raw, "download")),
+            process=_parse_process_config(raw["process"]) if raw.get("process") else None,
+        )
+
+    def validate_download(self) -> None:
+        """Check the settings needed to download homeworks, before any browser is started."""
+        if self.download.directory is None:
+            raise ConfigError("download > directory is not set")
+        if self.download.browser is None:
+            raise ConfigError("download > browser is not set")
+
+
+def get_config(reload_if_changed=False) -> Config:
+    """Read and validate the config once per process; reread it if reload_if_changed and the file was modified.
+
+    A config that can't be reread keeps the previous one in use, only the first read exits on errors.
+    """
+    global _cached_config, _rejected_mtime
     config_path = Path.home() / CONFIG_FILENAME
+    if _cached_config is not None:
+        if not reload_if_changed:
+            return _cached_config
+        mtime = _get_mtime(config_path)
+        if mtime in (_cached_config.mtime, _rejected_mtime):
+            return _cached_config
+        logger.info(f"{config_path} has changed, reloading...")
+        try:
+            _cached_config = load_config(config_path)
+        except (ConfigError, OSError) as e:
+            _rejected_mtime = mtime
+            logger.warning(f"Failed to reload {config_path}: {e}, keeping the previous config 😿")
+        return _cached_config
     if not config_path.exists():
         logger.error(f"{CONFIG_FILENAME} not found in your home directory 😿")
-        exit(1)
+        sys.exit(1)
+    try:
+        _cached_config = load_config(config_path)
+    except ConfigError as e:
+        logger.error(f"Invalid {config_path}: {e} 😿")
+        sys.exit(1)
+    return _cached_config
+
+
+def load_config(config_path: Path) -> Config:
     logger.debug(f"Reading config from {config_path}...")
+    mtime = _get_mtime(config_path)
     with open(config_path) as f:
-        return yaml.load(f, Loader=yaml.SafeLoader)
+        try:
+            raw = yaml.load(f, Loader=yaml.SafeLoader)
+        except yaml.YAMLError as e:
+            raise ConfigError(str(e)) from e
+    config = Config.from_dict(raw or {})
+    config.path = config_path
+    config.mtime = mtime
+    return config
+
+
+def _get_mtime(path: Path) -> Optional[float]:
+    try:
+        return path.stat().st_mtime
+    except FileNotFoundError:
+        return None
+
+
+def _parse_tracker_config(raw: dict[str, Any]) -> TrackerConfig:
+    cache = _get_mapping(raw, "cache", "tracker > ")
+    return TrackerConfig(
+        concurrency=_get_int(raw, "concurrency", DEFAULT_TRACKER_CONCURRENCY, "tracker > ", minimum=1),
+        page_size=_get_int(raw, "page_size", DEFAULT_TRACKER_PAGE_SIZE, "tracker > ", minimum=1),
+        cache_directory=Path(cache.get("directory", DEFAULT_CACHE_DIRECTORY)),
+        search_expire_after=timedelta(
+            seconds=_get_int(
+                cache, "search_expire_after", DEFAULT_SEARCH_EXPIRE_AFTER.total_seconds(), "tracker > cache > "
+            )
+        ),
+        expire_after=timedelta(
+            seconds=_get_int(cache, "expire_after", DEFAULT_EXPIRE_AFTER.total_seconds(), "tracker > cache > ")
+        ),
+        changelog_expire_after=timedelta(
+            seconds=_get_int(
+                cache, "changelog_expire_after", DEFAULT_CHANGELOG_EXPIRE_AFTER.total_seconds(), "tracker > cache > "
+            )
+        ),
+    )
+
+
+def _parse_download_config(raw: dict[str, Any]) -> DownloadConfig:
+    browser = None
+    if browser_raw := _get_mapping(raw, "browser", "download > "):
+        browser_type = browser_raw.get("type")
+        if browser_type not in SUPPORTED_BROWSERS:
+            raise ConfigError(f"download > browser > type is {browser_type}, only {SUPPORTED_BROWSERS} are supported")
+        if not (profile_path := browser_raw.get("profile_path")):
+            raise ConfigError("download > browser > profile_path is not set")
+        browser = BrowserConfig(type=browser_type, profile_path=profile_path)
+    directory = raw.get("directory")
+    return DownloadConfig(
+        directory=Path(directory).expanduser() if directory else None,
+        browser=browser,
+        zip_workers=_get_int(raw, "zip_workers", DEFAULT_ZIP_WORKERS, "download > ", minimum=1),
+        connections_per_host=_get_int(
+            raw, "connections_per_host", DEFAULT_CONNECTIONS_PER_HOST, "download > ", minimum=1
+        ),
+        http_extraction=_get_bool(raw, "http_extraction", True, "download > "),
+        include=_get_globs(raw, "include", "download > "),
+        exclude=_get_globs(raw, "exclude", "download > "),
+        link_unchanged=_get_bool(raw, "link_unchanged", False, "download > "),
+        blob_store=_get_bool(raw, "blob_store", False, "download > "),
+    )
+
+
+def _parse_process_config(raw: dict[str, Any]) -> ProcessConfig:
+    if not isinstance(raw, dict):
+        raise ConfigError("process should be a mapping")
+    runner = raw.get("runner", DEFAULT_RUNNER)
+    if not isinstance(runner, list) or not all(isinstance(part, str) for part in runner):
+        raise ConfigError(f"process > runner should be a list of strings, got {runner!r}")
+    console_output = _get_mapping(raw, "console_output", "process > ")
+    console_max_lines = console_output.get("max_lines", DEFAULT_CONSOLE_MAX_LINES)
+    if console_max_lines is not None and (not isinstance(console_max_lines, int) or console_max_lines < 0):
+        raise ConfigError("process > console_output > max_lines should be a non-negative integer or null")
+    console_keep = console_output.get("keep", "head")
+    if console_keep not in CONSOLE_KEEP_VALUES:
+        raise ConfigError(f"process > console_output > keep should be one of {CONSOLE_KEEP_VALUES}")
+    default = _get_mapping(raw, "default", "process > ")
+    _validate_steps(default, "process > default")
+    courses = _get_mapping(raw, "courses", "process > ")
+    for course in courses:
+        course_config = _get_mapping(courses, course, "process > courses > ")
+        location = f"process > courses > {course}"
+        _validate_steps(_get_mapping(course_config, "default", f"{location} > "), f"{location} > default")
+        problems = _get_mapping(course_config, "problems", f"{location} > ")
+        for problem in problems:
+            _validate_steps(
+                _get_mapping(problems, problem, f"{location} > problems > "), f"{location} > problems > {problem}"
+            )
+    return ProcessConfig(
+        runner=runner,
+        max_workers=_get_int(raw, "max_workers", DEFAULT_PROCESS_MAX_WORKERS, "process > ", minimum=1),
+        console_max_lines=console_max_lines,
+        console_keep=console_keep,
+        default=default,
+        courses=courses,
+    )
+
+
+def _validate_steps(steps_batch: dict[str, Any], location: str) -> None:
+    for step_name, step in _get_mapping(steps_batch, "steps", f"{location} > ").items():
+        if isinstance(step, dict):
+            if not isinstance(step.get("command"), str):
+                raise ConfigError(f"{location} > steps > {step_name} > command should be a string")
+        elif not isinstance(step, str):
+            raise ConfigError(f"{location} > steps > {step_name} should be a string or a mapping")
+
+
+def _get_mapping(raw: dict[str, Any], key: str, location: str = "") -> dict[str, Any]:
+    value = raw.get(key) or {}
+    if not isinstance(value, dict):
+        raise ConfigError(f"{location}{key} should be a mapping")
+    return value
+
+
+def _get_int(raw: dict[str, Any], key: str, default, location: str = "", minimum: Optional[int] = None) -> int:
+    value = raw.get(key, default)
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool):
+        raise ConfigError(f"{location}{key} should be an integer, got {value!r}")
+    if minimum is not None and value < minimum:
+        raise ConfigError(f"{location}{key} should be at least {minimum}, got {value}")
+    return value
+
+
+def _get_bool(raw: dict[str, Any], key: str, default: bool, location: str = "") -> bool:
+    value = raw.get(key, default)
+    if not isinstance(value, bool):
+        raise ConfigError(f"{location}{key} should be true or false, got {value!r}")
+    return value
+
+
+def _get_globs(raw: dict[str, Any], key: str, location: str = "") -> list[str]:
+    value = raw.get(key) or []
+    if not isinstance(value, list) or not all(isinstance(glob, str) for glob in value):
+        raise ConfigError(f"{location}{key} should be a list of globs, got {value!r}")
+    return value
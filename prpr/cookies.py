@@ -0,0 +1,38 @@
+"""Cookies of a browser profile, to make the requests a logged-in browser would make without starting it."""
+
+from __future__ import annotations
+
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from loguru import logger
+from requests.cookies import RequestsCookieJar
+
+FIREFOX_COOKIES_FILENAME = "cookies.sqlite"
+
+
+def load_firefox_cookies(profile_path: str) -> Optional[RequestsCookieJar]:
+    """The persistent cookies of the profile, None if there's no cookie store or it can't be read.
+
+    Session cookies are kept by Firefox in memory only, so they are not here.
+    """
+    cookies_path = Path(profile_path).expanduser() / FIREFOX_COOKIES_FILENAME
+    if not cookies_path.exists():
+        logger.debug(f"{cookies_path} not found.")
+        return None
+    # Firefox holds a lock on the database while running, immutable mode reads it regardless of the lock.
+    try:
+        connection = sqlite3.connect(f"{cookies_path.as_uri()}?immutable=1", uri=True)
+        try:
+            rows = connection.execute("SELECT name, value, host, path, isSecure FROM moz_cookies").fetchall()
+        finally:
+            connection.close()
+    except sqlite3.Error as e:
+        logger.warning(f"Failed to read cookies from {cookies_path}: {e}")
+        return None
+    jar = RequestsCookieJar()
+    for name, value, host, path, is_secure in rows:
+        jar.set(name, value, domain=host, path=path, secure=bool(is_secure))
+    logger.debug(f"Loaded {len(jar)} cookies from {cookies_path}.")
+    return jar
@@ -1,120 +1,343 @@
 from __future__ import annotations
 
+import fnmatch
 import os
 import re
+import shutil
 import sys
+import threading
+import time
 import zipfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from enum import Enum, auto
-from pathlib import Path
-from typing import Iterable, Optional, Tuple
+from functools import lru_cache
+from pathlib import Path, PurePosixPath
+from queue import Empty, Queue
+from typing import Callable, Iterable, Optional, Tuple
+from urllib.parse import urlsplit
 
 import requests
 from loguru import logger
-from pyfiglet import Figlet
+from requests.adapters import HTTPAdapter
+from requests.cookies import RequestsCookieJar
 from rich import print as rprint
 from selenium import webdriver
-from selenium.common.exceptions import NoSuchElementException
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
 from selenium.webdriver import ActionChains
 
+from prpr.blob_store import BlobStore
+from prpr.config import BrowserConfig, Config, DownloadConfig
+from prpr.cookies import load_firefox_cookies
+from prpr.download_mode import DownloadMode  # noqa: F401 (re-exported)
 from prpr.homework import Homework
+from prpr.homework_db import HomeworkDatabase
+from prpr.parsing import parse_version_id, parse_zip_urls
 
 PAGE_LOAD_TIMEOUT = 60
 DRIVER_TIMEOUT = 110
+ZIP_REQUEST_TIMEOUT = 60
+ZIP_DOWNLOAD_ATTEMPTS = 5
+ZIP_DOWNLOAD_BACKOFF = 1  # seconds, doubled after every failed attempt
+ZIP_CHUNK_SIZE = 64 * 1024
+PARTIAL_DOWNLOAD_SUFFIX = ".part"
+EXTRACT_WORKERS = 4
+PARALLEL_EXTRACT_MIN_SIZE = 4 * 1024 * 1024  # bytes unzipped, smaller archives are extracted in one thread
 YOUR_DESCRIPTION_HERE = "your_description_here"
 
 HISTORY_TAB_XPATH = "//article[text()='История']"
 REVIEW_TAB_XPATH = "//article[text()='Код-ревью']"
 
 
-class DownloadMode(Enum):
-    ONE = auto()
-    ALL = auto()
-    # TODAY = auto() TODO: add customizable day end
-    INTERACTIVE = auto()
-    INTERACTIVE_ALL = auto()
-
-    def __str__(self):
-        return self.name.lower().replace("_", "-")
+def download(homework: Homework, config: Config, headless=False):
+    logger.debug(homework)
+    download_config = config.download
+    logger.debug(f"{download_config=}")
 
-    def __repr__(self):
-        return str(self)
+    homework_directory = _get_homework_directory(homework, download_config)
 
-    @staticmethod
-    def from_string(mode: str) -> DownloadMode:
+    urls = _get_zip_urls_over_http(homework.revisor_url, _load_cookies(download_config))
+    if urls is None:
+        driver = configure_driver(download_config, headless=headless)
         try:
-            return DownloadMode[mode.upper().replace("-", "_")]
-        except KeyError:
-            logger.error(f"Unexpected PostProcessMode mode: '{mode}' 😿")
-            return mode
+            urls = get_zip_urls(driver, homework.revisor_url)
+        except RevisorPageError as e:
+            logger.error(e)
+            sys.exit(1)
 
+    with _make_zip_executor(download_config) as zip_executor:
+        return _download_zips(urls, homework_directory, homework, zip_executor, download_config)
 
-def download(homework: Homework, config, headless=False):
-    logger.debug(homework)
-    download_config = config.get("download", {})
-    logger.debug(f"{download_config=}")
 
-    homework_directory = _get_homework_directory(homework, download_config)
+def _make_zip_executor(download_config: DownloadConfig) -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(max_workers=download_config.zip_workers, thread_name_prefix="zip")
 
-    driver = configure_driver(download_config, headless=headless)
-    urls = get_zip_urls(driver, homework.revisor_url)
 
+def _download_zips(
+    urls: list[str],
+    homework_directory: Path,
+    homework: Homework,
+    zip_executor: ThreadPoolExecutor,
+    download_config: DownloadConfig,
+    quiet=False,
+    cancelled: Optional[threading.Event] = None,
+) -> list[DownloadedResult]:
+    """Download and unzip all the iterations at once, return the results in the order of iterations.
+
+    The iterations which haven't started by the time cancelled is set are skipped, raising PrefetchCancelled.
+    """
     logger.debug(f"Got {len(urls)} urls:")
-    results = []
+
+    def download_iteration(iteration: int, url: str) -> DownloadedResult:
+        if cancelled is not None and cancelled.is_set():
+            raise PrefetchCancelled(f"Skipped iteration {iteration} of {homework}.")
+        return _download_zip(url, homework_directory, iteration, homework, download_config, quiet)
+
+    futures = []
     for iteration, url in enumerate(urls, 1):
         logger.debug(f"{iteration}: {url}")
-        results.append(_download_zip(url, homework_directory, iteration, homework))
-    return results
+        futures.append(zip_executor.submit(download_iteration, iteration, url))
+    return [future.result() for future in futures]
+
+
+class PrefetchCancelled(Exception):
+    pass
+
+
+class RevisorPageError(Exception):
+    """The Revisor page has no review to get the zip urls from, e.g. not logged in or no VPN."""
 
 
 class BatchDownloader:
-    def __init__(self, config, headless=True):
-        self.download_config = config.get("download", {})
-        self.driver = configure_driver(self.download_config, headless=headless)
-        pass
+    """Downloads homeworks, reading Revisor pages over HTTP and with a pool of browser drivers if that fails.
+
+    Every driver gets its own copy of the configured profile (that's what FirefoxProfile does),
+    so several of them can be run at once.
+    The drivers are started when first needed and serve all the batches until the downloader is exited,
+    a driver whose browser has died is replaced with a new one.
+    With a database, the zip urls are remembered per homework, and Revisor isn't asked again
+    until the status history shows a new iteration or some of the iterations are missing on disk.
+    """
+
+    def __init__(self, config: Config, headless=True, workers=1, database: Optional[HomeworkDatabase] = None):
+        self.download_config = config.download
+        self.database = database
+        self.headless = headless
+        self.workers = max(workers, 1)
+        self.drivers = []
+        self.idle_drivers = Queue()
+        self.browser_slots = threading.BoundedSemaphore(self.workers)
+        self.lock = threading.Lock()
+        self.cookies = _load_cookies(self.download_config)
 
     def __enter__(self):
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
-        pass
+        self.close()
+
+    def close(self) -> None:
+        if self.drivers:
+            logger.debug(f"Stopping {len(self.drivers)} drivers...")
+        for driver in self.drivers:
+            _quit_driver(driver)
+        self.drivers = []
+
+    def _start_driver(self):
+        return configure_driver(self.download_config, headless=self.headless)
 
     def download_batch(self, homeworks: Iterable[Homework], print_banner=True):
-        with self.driver as driver:
+        """Yield the results in the order of homeworks, while the following ones are being downloaded."""
+        homeworks = list(homeworks)
+        # Zips of all the homeworks share one pool, so that they are fetched while the next pages are loading.
+        with _make_zip_executor(self.download_config) as zip_executor:
+            with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="download") as executor:
+                futures = [
+                    executor.submit(
+                        self._download_homework,
+                        homework,
+                        # Directories are created here, not in parallel.
+                        _get_homework_directory(homework, self.download_config),
+                        zip_executor,
+                    )
+                    for homework in homeworks
+                ]
+                try:
+                    for homework, future in zip(homeworks, futures):
+                        if print_banner:
+                            _print_banner(homework)
+                        try:
+                            yield future.result()
+                        except RevisorPageError as e:
+                            logger.error(e)
+                            sys.exit(1)
+                finally:
+                    for future in futures:
+                        future.cancel()
+
+    def _download_homework(
+        self,
+        homework: Homework,
+        homework_directory: Path,
+        zip_executor: ThreadPoolExecutor,
+        quiet=False,
+        cancelled: Optional[threading.Event] = None,
+        use_browser=True,
+    ) -> list[DownloadedResult]:
+        """Without use_browser, a homework whose Revisor page can't be read over HTTP is skipped."""
+        (logger.debug if quiet else logger.info)(f"Downloading {homework}...")
+        if (urls := self._get_known_zip_urls(homework, homework_directory)) is None:
+            urls = _get_zip_urls_over_http(homework.revisor_url, self.cookies)
+            if urls is None:
+                if not use_browser:
+                    logger.debug(f"Skipping {homework}, it needs the browser.")
+                    return []
+                urls = self._get_zip_urls_with_browser(homework.revisor_url)
+            if urls and self.database is not None and homework.iteration:
+                self.database.save_zip_urls(homework.issue_key, homework.iteration, urls)
+        return _download_zips(
+            urls, homework_directory, homework, zip_executor, self.download_config, quiet, cancelled=cancelled
+        )
+
+    def prefetch(self, homeworks: Iterable[Homework]) -> Prefetch:
+        """Start downloading the homeworks one by one in the background, without printing anything.
+
+        Exit (or cancel) the returned Prefetch before downloading any of them in the foreground.
+        """
+        return Prefetch(self._prefetch, list(homeworks))
+
+    def _prefetch(self, homeworks: list[Homework], cancelled: threading.Event) -> None:
+        with ThreadPoolExecutor(
+            max_workers=self.download_config.zip_workers, thread_name_prefix="prefetch-zip"
+        ) as zip_executor:
             for homework in homeworks:
-                if print_banner:
-                    _print_banner(homework)
-                logger.info(f"Downloading {homework}...")
-                homework_directory = _get_homework_directory(homework, self.download_config)
-                urls = _get_zip_urls(driver, homework.revisor_url)
-                logger.debug(f"Got {len(urls)} urls:")
-                results = []
-                for iteration, url in enumerate(urls, 1):
-                    logger.debug(f"{iteration}: {url}")
-
-                    results.append(_download_zip(url, homework_directory, iteration, homework))
-                yield results
-
-
-def _get_homework_directory(homework: Homework, download_config) -> Path:
-    if not (root_directory := download_config.get("directory")):
+                if cancelled.is_set():
+                    logger.debug("Prefetch cancelled.")
+                    return
+                try:
+                    homework_directory = _get_homework_directory(homework, self.download_config, quiet=True)
+                    # The browser window would pop up over the prompt, so it's left to the foreground download.
+                    self._download_homework(
+                        homework, homework_directory, zip_executor, quiet=True, cancelled=cancelled, use_browser=False
+                    )
+                except PrefetchCancelled:
+                    logger.debug("Prefetch cancelled.")
+                    return
+                except RevisorPageError as e:
+                    logger.debug(f"Failed to prefetch {homework}: {e}")
+                except Exception as e:  # it will be downloaded in the foreground if chosen, and fail loudly there
+                    logger.debug(f"Failed to prefetch {homework}: {e!r}")
+        logger.debug(f"Prefetched {len(homeworks)} homeworks.")
+
+    def _get_known_zip_urls(self, homework: Homework, homework_directory: Path) -> Optional[list[str]]:
+        """The zip urls read before, if the homework has no new iterations since then and all of them are on disk.
+
+        The zips are required as well as the iterations: the urls may have expired, so they are never fetched again.
+        """
+        if self.database is None or not homework.iteration:
+            return None
+        if not (known := self.database.get_zip_urls(homework.issue_key)):
+            return None
+        iteration, urls = known
+        if iteration != homework.iteration:
+            logger.debug(f"{homework.issue_key} has a new iteration since its zip urls were read.")
+            return None
+        for n, url in enumerate(urls, 1):
+            version_id = _extract_version_id(_extract_filename(url))
+            if not (homework_directory / _build_iteration_directory_name(n, version_id)).exists():
+                logger.debug(f"Iteration {n} of {homework.issue_key} is missing on disk.")
+                return None
+            if not zipfile.is_zipfile(homework_directory / _extract_filename(url)):
+                logger.debug(f"The zip of iteration {n} of {homework.issue_key} is missing on disk.")
+                return None
+        logger.debug(f"All the iterations of {homework.issue_key} are on disk, Revisor is not asked.")
+        return urls
+
+    def _get_zip_urls_with_browser(self, revisor_url: str) -> list[str]:
+        with self.browser_slots:
+            try:
+                driver = self._get_live_driver(self.idle_drivers.get_nowait())
+            except Empty:
+                driver = self._start_driver()
+                with self.lock:
+                    self.drivers.append(driver)
+            try:
+                return _get_zip_urls(driver, revisor_url)
+            finally:
+                self.idle_drivers.put(driver)
+
+    def _get_live_driver(self, driver):
+        """The driver itself if its browser still responds, a freshly started one otherwise."""
+        if _is_alive(driver):
+            return driver
+        logger.warning("The browser has died, restarting it...")
+        _quit_driver(driver)
+        restarted = self._start_driver()
+        with self.lock:
+            self.drivers[self.drivers.index(driver)] = restarted
+        return restarted
+
+
+class Prefetch:
+    """A background download started by BatchDownloader.prefetch.
+
+    Cancelling waits for the zips being downloaded, so that none is downloaded twice at once;
+    the rest of the homework and the following ones are skipped.
+    """
+
+    def __init__(self, target: Callable[[list[Homework], threading.Event], None], homeworks: list[Homework]):
+        self.cancelled = threading.Event()
+        self.thread = threading.Thread(target=target, args=(homeworks, self.cancelled), name="prefetch", daemon=True)
+        if homeworks:
+            logger.debug(f"Prefetching {len(homeworks)} homeworks...")
+            self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.cancel()
+
+    def cancel(self) -> None:
+        self.cancelled.set()
+        if self.thread.is_alive():
+            self.thread.join()
+
+
+def _is_alive(driver) -> bool:
+    try:
+        driver.current_window_handle
+    except WebDriverException:
+        return False
+    return True
+
+
+def _quit_driver(driver) -> None:
+    try:
+        driver.quit()
+    except WebDriverException:
+        logger.debug("Failed to quit the driver, it must have died already.")
+
+
+def _get_homework_directory(homework: Homework, download_config: DownloadConfig, quiet=False) -> Path:
+    if not (download_root := download_config.directory):
         logger.error("Download directory not set in .prpr 😿")
         sys.exit(1)
-    download_root = Path(root_directory).expanduser()
+    warn = logger.debug if quiet else logger.warning
     course_directory = download_root / homework.course
     logger.debug(f"course = {homework.course}, course_directory = {course_directory}")
     if not course_directory.exists():
-        logger.warning(f"{course_directory} doesn't exist, creating now...")
+        warn(f"{course_directory} doesn't exist, creating now...")
         course_directory.mkdir(parents=True)
-    problem_directory = _get_problem_directory(homework, course_directory)
+    problem_directory = _get_problem_directory(homework, course_directory, quiet)
     homework_directory = problem_directory / _build_directory_name(homework)
     if not homework_directory.exists():
-        logger.warning(f"{homework_directory} doesn't exist, creating now...")
+        warn(f"{homework_directory} doesn't exist, creating now...")
         homework_directory.mkdir(parents=True)
     return homework_directory
 
 
-def _get_problem_directory(homework: Homework, course_directory: Path) -> Path:
+def _get_problem_directory(homework: Homework, course_directory: Path, quiet=False) -> Path:
     problem_directory_name_prefix = f"hw_{homework.problem:02d}_"
     for p in course_directory.iterdir():
         if p.is_dir() and p.name.startswith(problem_directory_name_prefix):
@@ -125,7 +348,7 @@ def _get_problem_directory(homework: Homework, course_directory: Path) -> Path:
         course_directory / problem_directory_name_prefix
         problem_directory_name = f"{problem_directory_name_prefix}{YOUR_DESCRIPTION_HERE}"
         problem_directory = course_directory / problem_directory_name
-        logger.warning(
+        (logger.debug if quiet else logger.warning)(
             f"Directory for {homework.problem:02d} of {homework.course} is not found, "
             f"creating now ({problem_directory}; '{YOUR_DESCRIPTION_HERE}' can be replaced)..."
         )
@@ -141,19 +364,32 @@ def _extract_filename(url: str) -> str:
     return url.rsplit("/")[-1]
 
 
-def _download_zip(url: str, homework_directory: Path, iteration: int, homework: Homework) -> DownloadedResult:
+def _download_zip(
+    url: str,
+    homework_directory: Path,
+    iteration: int,
+    homework: Homework,
+    download_config: DownloadConfig,
+    quiet=False,
+) -> DownloadedResult:
     filename = _extract_filename(url)
     logger.debug(f"{url=} -> {filename=}")
 
+    log = logger.debug if quiet else logger.info
+    warn = logger.debug if quiet else logger.warning
     zip_full_path = homework_directory / filename
-    if zip_full_path.exists():  # TODO: add force download
-        logger.info(f"{str(zip_full_path)} exists, skipping.")
+    if zipfile.is_zipfile(zip_full_path):  # TODO: add force download
+        log(f"{str(zip_full_path)} exists, skipping.")
     else:
-        r = requests.get(url, allow_redirects=True)  # TODO: add retries
-        with open(zip_full_path, "wb") as f:
-            f.write(r.content)
-        logger.info(f"Written to {zip_full_path}.")
-    iteration_directory, version_id = _unzip_homework_file(zip_full_path, iteration, homework)
+        if zip_full_path.exists():
+            warn(f"{zip_full_path} is not a valid zip file, downloading again...")
+            zip_full_path.unlink()
+        with _get_host_semaphore(url, download_config.connections_per_host):
+            _fetch_zip(url, zip_full_path, quiet=quiet)
+        log(f"Written to {zip_full_path}.")
+    iteration_directory, version_id = _unzip_homework_file(
+        zip_full_path, iteration, homework, download_config=download_config, quiet=quiet
+    )
     return DownloadedResult(
         zipfile=zip_full_path,
         iteration_directory=iteration_directory,
@@ -163,10 +399,87 @@ def _download_zip(url: str, homework_directory: Path, iteration: int, homework:
     )
 
 
-def configure_driver(download_config, headless=False):
+_host_semaphores: dict[str, threading.Semaphore] = {}
+_host_semaphores_lock = threading.Lock()
+
+
+def _get_host_semaphore(url: str, connections_per_host: int) -> threading.Semaphore:
+    host = urlsplit(url).netloc
+    with _host_semaphores_lock:
+        if host not in _host_semaphores:
+            _host_semaphores[host] = threading.BoundedSemaphore(connections_per_host)
+        return _host_semaphores[host]
+
+
+@lru_cache(maxsize=None)
+def _get_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_maxsize=16)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _fetch_zip(
+    url: str, zip_full_path: Path, attempts=ZIP_DOWNLOAD_ATTEMPTS, backoff=ZIP_DOWNLOAD_BACKOFF, quiet=False
+) -> None:
+    """Download to a partial file resuming it if present, check the archive and move it to zip_full_path."""
+    partial_path = zip_full_path.with_name(zip_full_path.name + PARTIAL_DOWNLOAD_SUFFIX)
+    warn = logger.debug if quiet else logger.warning
+    for attempt in range(1, attempts + 1):
+        try:
+            _stream_to_file(url, partial_path)
+        except requests.RequestException as e:
+            response = getattr(e, "response", None)
+            if attempt == attempts or (response is not None and response.status_code < 500):
+                (logger.debug if quiet else logger.error)(f"Failed to download {url}: {e} 😿")
+                raise
+            delay = backoff * 2 ** (attempt - 1)
+            warn(f"Failed to download {url}: {e}, retrying in {delay}s ({attempt}/{attempts})...")
+            time.sleep(delay)
+            continue
+        if _is_intact_zip(partial_path):
+            os.replace(partial_path, zip_full_path)
+            return
+        warn(f"Downloaded {partial_path} is broken, starting over ({attempt}/{attempts})...")
+        partial_path.unlink()
+    raise zipfile.BadZipFile(f"Failed to download a valid zip file from {url} 😿")
+
+
+def _stream_to_file(url: str, partial_path: Path) -> None:
+    offset = partial_path.stat().st_size if partial_path.exists() else 0
+    headers = {"Range": f"bytes={offset}-"} if offset else {}
+    with _get_session().get(
+        url, headers=headers, stream=True, allow_redirects=True, timeout=ZIP_REQUEST_TIMEOUT
+    ) as response:
+        if offset and response.status_code == requests.codes.requested_range_not_satisfiable:
+            logger.debug(f"{partial_path} seems to be complete already.")
+            return
+        response.raise_for_status()
+        resumed = offset and response.status_code == requests.codes.partial_content
+        if resumed:
+            logger.debug(f"Resuming {url} from {offset} bytes...")
+        elif offset:
+            logger.debug(f"{url} can't be resumed, downloading from scratch...")
+        with open(partial_path, "ab" if resumed else "wb") as f:
+            for chunk in response.iter_content(chunk_size=ZIP_CHUNK_SIZE):
+                f.write(chunk)
+
+
+def _is_intact_zip(path: Path) -> bool:
+    if not zipfile.is_zipfile(path):
+        return False
+    try:
+        with zipfile.ZipFile(path) as archive:
+            return archive.testzip() is None
+    except (zipfile.BadZipFile, EOFError, OSError, zlib.error):
+        return False
+
+
+def configure_driver(download_config: DownloadConfig, headless=False):
     logger.debug("Configuring Selenium driver...")
-    browser_settings = download_config["browser"]
-    browser_type = browser_settings["type"]
+    browser_settings = download_config.browser
+    browser_type = browser_settings.type
     logger.debug(f"Browser = {browser_type}, headless = {headless}.")
     mapping = {
         "firefox": _configure_firefox_driver,
@@ -177,8 +490,8 @@ def configure_driver(download_config, headless=False):
     return mapping[browser_type](browser_settings, headless=headless)
 
 
-def _configure_firefox_driver(browser_settings, headless=False):
-    profile_path = browser_settings["profile_path"]
+def _configure_firefox_driver(browser_settings: BrowserConfig, headless=False):
+    profile_path = browser_settings.profile_path
     firefox_options = webdriver.FirefoxOptions()
     firefox_options.headless = headless
     fp = webdriver.FirefoxProfile(profile_path)
@@ -203,10 +516,10 @@ def _get_zip_urls(driver, revisor_url: str) -> list[str]:
         try:
             element = driver.find_element_by_xpath(REVIEW_TAB_XPATH)
         except NoSuchElementException:
-            logger.error(
-                f"Failed to find element with XPath='{REVIEW_TAB_XPATH}'. Are you logged in? Is the VPN connected?"
-            )
-            sys.exit(1)
+            raise RevisorPageError(
+                f"Failed to find element with XPath='{REVIEW_TAB_XPATH}' at {revisor_url}. "
+                "Are you logged in? Is the VPN connected?"
+            ) from None
     # Simple element.click() doesn't work here for some reason.
     action = ActionChains(driver)
     action.move_to_element(element).click().perform()
@@ -214,35 +527,195 @@ def _get_zip_urls(driver, revisor_url: str) -> list[str]:
     return _extract_zip_urls(driver.page_source, revisor_url)
 
 
-def _extract_zip_urls(page_source: str, revisor_url: str) -> Optional[str]:
-    if ms := re.findall(r"\"homework_url\":\s?\"(?P<url>[\w\\\-\_:\u002F\.]+\.zip)\"", page_source):
-        urls = {m.replace(r"\u002F", "/") for m in ms}
-        return sorted(urls, key=_extract_version_id)
+def _load_cookies(download_config: DownloadConfig) -> Optional[RequestsCookieJar]:
+    if not download_config.http_extraction or download_config.browser is None:
+        return None
+    return load_firefox_cookies(download_config.browser.profile_path)
+
+
+def _get_zip_urls_over_http(revisor_url: str, cookies: Optional[RequestsCookieJar]) -> Optional[list[str]]:
+    """The zip urls from the Revisor page fetched without a browser, None if that didn't work out."""
+    if cookies is None:
+        return None
+    logger.debug(f"Fetching {revisor_url} over HTTP...")
+    try:
+        response = _get_session().get(revisor_url, cookies=cookies, timeout=PAGE_LOAD_TIMEOUT)
+        response.raise_for_status()
+    except requests.RequestException as e:
+        logger.debug(f"Failed to fetch {revisor_url} over HTTP ({e}), falling back to the browser...")
+        return None
+    if urls := parse_zip_urls(response.text):
+        return urls
+    logger.debug(f"No zip urls in {revisor_url} fetched over HTTP (not logged in?), falling back to the browser...")
+    return None
+
+
+def _extract_zip_urls(page_source: str, revisor_url: str) -> list[str]:
+    if urls := parse_zip_urls(page_source):
+        return urls
     logger.error("Failed to extract zip urls from {} 😿", revisor_url)
     return []
 
 
-def _unzip_homework_file(homework_zip: Path, iteration: int, homework: Homework) -> Tuple[Path, str]:
+def _unzip_homework_file(
+    homework_zip: Path, iteration: int, homework: Homework, download_config: DownloadConfig, quiet=False
+) -> Tuple[Path, str]:
     assert homework_zip.suffix == ".zip", f"Unexpected extension {homework_zip.suffix} for {homework_zip} 😿"
     homework_directory = homework_zip.parent
     version_id = _extract_version_id(homework_zip.name)
-    iteration_directory = homework_directory / f"it_{iteration:02d}_{version_id}"
+    iteration_directory = homework_directory / _build_iteration_directory_name(iteration, version_id)
     if iteration_directory.exists():
-        logger.info(f"Target {iteration_directory} exists")
+        (logger.debug if quiet else logger.info)(f"Target {iteration_directory} exists")
     else:
-        zipfile.ZipFile(homework_zip).extractall(path=iteration_directory)
-        rprint(f"Fetched [bold]{iteration_directory.absolute()}[/bold] for [bold]{homework}[/bold].")
+        _extract_iteration(homework_zip, iteration_directory, iteration, download_config)
+        if quiet:
+            logger.debug(f"Fetched {iteration_directory.absolute()} for {homework}.")
+        else:
+            rprint(f"Fetched [bold]{iteration_directory.absolute()}[/bold] for [bold]{homework}[/bold].")
     return iteration_directory, version_id
 
 
+def _extract_iteration(
+    homework_zip: Path, iteration_directory: Path, iteration: int, download_config: DownloadConfig
+) -> None:
+    """Extract the selected members next to iteration_directory and move them in place when all are written.
+
+    So an interrupted extraction is started over, and a previous iteration found on disk is complete.
+    """
+    partial_directory = iteration_directory.with_name(iteration_directory.name + PARTIAL_DOWNLOAD_SUFFIX)
+    if partial_directory.exists():
+        shutil.rmtree(partial_directory)
+    partial_directory.mkdir()
+    with zipfile.ZipFile(homework_zip) as archive:
+        members = archive.infolist()
+        selected = [
+            m for m in members if _is_selected(m.filename, download_config.include, download_config.exclude)
+        ]
+        unchanged = (
+            _find_unchanged_members(selected, homework_zip.parent, iteration) if download_config.link_unchanged else {}
+        )
+        blob_store = (
+            BlobStore.for_download_directory(download_config.directory) if download_config.blob_store else None
+        )
+        # Names escaping the directory are sanitized by ZipFile.extract, such members are rare and extracted first.
+        unusual = [m for m in selected if not _is_plain_name(m.filename)]
+        plain = [m for m in selected if _is_plain_name(m.filename)]
+        for member in unusual:
+            archive.extract(member, path=partial_directory)
+        # Created beforehand, so that the members can be extracted in any order.
+        directories = {partial_directory / m.filename for m in plain if m.is_dir()}
+        directories.update((partial_directory / m.filename).parent for m in plain)
+        for directory in sorted(directories):
+            directory.mkdir(parents=True, exist_ok=True)
+        files = [m for m in plain if not m.is_dir()]
+
+        def extract(member: zipfile.ZipInfo) -> None:
+            target = partial_directory / member.filename
+            if (previous := unchanged.get(member.filename)) is not None:
+                try:
+                    os.link(previous, target)
+                    return
+                except OSError as e:
+                    logger.debug(f"Failed to link {previous} to {target}: {e}, extracting...")
+            if blob_store is None:
+                archive.extract(member, path=partial_directory)
+            else:
+                with archive.open(member) as source:
+                    blob_store.put(source, target)
+
+        if sum(m.file_size for m in files) >= PARALLEL_EXTRACT_MIN_SIZE and len(files) > 1:
+            with ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="unzip") as executor:
+                list(executor.map(extract, files))
+        else:
+            for member in files:
+                extract(member)
+    os.replace(partial_directory, iteration_directory)
+    logger.debug(
+        f"Extracted {len(selected)} of {len(members)} members of {homework_zip} to {iteration_directory}, "
+        f"{sum(m.filename in unchanged for m in files)} of them linked to the previous iteration."
+    )
+
+
+def _is_selected(name: str, include: list[str], exclude: list[str]) -> bool:
+    """A glob matches a member if it matches its whole path in the archive or any part of the path."""
+    if exclude and _matches(name, _compile_globs(tuple(exclude))):
+        return False
+    return not include or _matches(name, _compile_globs(tuple(include)))
+
+
+def _matches(name: str, pattern: re.Pattern) -> bool:
+    return bool(pattern.match(name)) or any(pattern.match(part) for part in name.split("/"))
+
+
+@lru_cache(maxsize=None)
+def _compile_globs(globs: tuple[str, ...]) -> re.Pattern:
+    return re.compile("|".join(fnmatch.translate(glob) for glob in globs))
+
+
+def _is_plain_name(name: str) -> bool:
+    path = PurePosixPath(name)
+    return not path.is_absolute() and ".." not in path.parts and "\\" not in name and ":" not in name
+
+
+def _find_unchanged_members(
+    members: list[zipfile.ZipInfo], homework_directory: Path, iteration: int
+) -> dict[str, Path]:
+    """The members whose CRC and size are the same as in the previous iteration, mapped to its extracted files.
+
+    The extracted files are checked as well, as they may have been changed in place since.
+    """
+    if iteration < 2:
+        return {}
+    for previous_directory in homework_directory.glob(_build_iteration_directory_name(iteration - 1, "*")):
+        if previous_directory.is_dir() and not previous_directory.name.endswith(PARTIAL_DOWNLOAD_SUFFIX):
+            break
+    else:
+        return {}
+    previous_version_id = previous_directory.name.split("_", 2)[-1]
+    for previous_zip in homework_directory.glob("*.zip"):
+        if parse_version_id(previous_zip.name) == previous_version_id:
+            break
+    else:
+        return {}
+    try:
+        with zipfile.ZipFile(previous_zip) as previous_archive:
+            previous_members = {m.filename: (m.CRC, m.file_size) for m in previous_archive.infolist()}
+    except zipfile.BadZipFile:
+        return {}
+    unchanged = {}
+    for member in members:
+        if member.is_dir() or previous_members.get(member.filename) != (member.CRC, member.file_size):
+            continue
+        previous_file = previous_directory / member.filename
+        try:
+            if previous_file.stat().st_size == member.file_size and _crc32(previous_file) == member.CRC:
+                unchanged[member.filename] = previous_file
+        except OSError:
+            pass  # excluded or removed since
+    return unchanged
+
+
+def _crc32(path: Path) -> int:
+    crc = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(ZIP_CHUNK_SIZE):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _build_iteration_directory_name(iteration: int, version_id: str) -> str:
+    return f"it_{iteration:02d}_{version_id}"
+
+
 def _extract_version_id(homework_zip_filename: str) -> str:
-    if m := re.search(r".*?_(?P<id>\d+).zip", homework_zip_filename):
-        group_dict = m.groupdict()
-        logger.debug("{} {} {}", homework_zip_filename, group_dict, group_dict["id"])
-        return group_dict["id"]
+    version_id = parse_version_id(homework_zip_filename)
+    logger.debug("{} {}", homework_zip_filename, version_id)
+    return version_id
 
 
 def _print_banner(homework):
+    from pyfiglet import Figlet  # only needed for batches, loading the fonts is not free
+
     f = Figlet(font="slant")
     print(f.renderText(f"{homework.second_name_slug} {homework.problem}.{homework.iteration}"))
     print(homework.issue_url)
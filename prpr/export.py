@@ -0,0 +1,102 @@
+from __future__ import annotations
+
+import csv
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Any, Iterable, Optional, TextIO
+
+from prpr.date_utils import LOCAL_TIMEZONE
+from prpr.homework import Homework
+
+
+class OutputFormat(Enum):
+    TABLE = "table"
+    JSONL = "jsonl"
+    CSV = "csv"
+    TSV = "tsv"
+
+    def __str__(self):
+        return self.value
+
+
+FIELDS = (
+    "issue_key",
+    "number",
+    "url",
+    "course",
+    "problem",
+    "iteration",
+    "lesson_name",
+    "student_name",
+    "student_email",
+    "cohort",
+    "status",
+    "status_updated",
+    "deadline",
+    "left_seconds",
+    "deadline_missed",
+    "sla_id",
+    "sla_started_at",
+    "sla_fail_at",
+    "revisor_url",
+)
+
+
+def to_record(homework: Homework, now: datetime) -> dict[str, Any]:
+    """Everything the homework knows, as JSON-compatible values; the dates are in ISO format."""
+    sla = homework.sla
+    return {
+        "issue_key": homework.issue_key,
+        "number": homework.number,
+        "url": homework.issue_url,
+        "course": homework.course,
+        "problem": homework.problem,
+        "iteration": homework.iteration,
+        "lesson_name": homework.lesson_name,
+        "student_name": homework.student_name,
+        "student_email": homework.student_email,
+        "cohort": homework.cohort,
+        "status": homework.status.name.lower(),
+        "status_updated": _isoformat(homework.status_updated),
+        "deadline": _isoformat(homework.deadline),
+        "left_seconds": homework.left_seconds_at(now),
+        "deadline_missed": homework.deadline_missed_at(now),
+        "sla_id": sla and sla.id_,
+        "sla_started_at": _isoformat(sla and sla.started_at),
+        "sla_fail_at": _isoformat(sla and sla.fail_at),
+        "revisor_url": homework.revisor_url,
+    }
+
+
+def export_homeworks(
+    homeworks: Iterable[Homework],
+    output_format: OutputFormat,
+    stream: TextIO,
+    now: Optional[datetime] = None,
+) -> int:
+    """Write a record per homework as soon as it's produced, return the number of records.
+
+    All the records are computed for the same moment, `now`.
+    """
+    now = now or datetime.now(LOCAL_TIMEZONE)
+    count = 0
+    if output_format == OutputFormat.JSONL:
+        for homework in homeworks:
+            stream.write(json.dumps(to_record(homework, now), ensure_ascii=False))
+            stream.write("\n")
+            count += 1
+    elif output_format in (OutputFormat.CSV, OutputFormat.TSV):
+        dialect = csv.excel_tab if output_format == OutputFormat.TSV else csv.excel
+        writer = csv.DictWriter(stream, fieldnames=FIELDS, dialect=dialect)
+        writer.writeheader()
+        for homework in homeworks:
+            writer.writerow(to_record(homework, now))
+            count += 1
+    else:
+        raise ValueError(f"Unexpected output format: {output_format} 😿")
+    return count
+
+
+def _isoformat(value: Optional[datetime]) -> Optional[str]:
+    return value and value.isoformat()
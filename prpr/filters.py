@@ -1,16 +1,21 @@
 from __future__ import annotations
 
 import datetime as dt
+import json
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from dataclasses import dataclass, fields
 from enum import Enum, auto
-from typing import Any, Iterable, Optional, Union
+from typing import Any, Callable, Iterable, Optional
 
 from dateutil.relativedelta import relativedelta
 from loguru import logger
 
-from prpr.date_utils import month_start_and_end
+from prpr.config import Config
+from prpr.date_utils import LOCAL_TIMEZONE, month_start_and_end
 from prpr.homework import CLOSED_STATUSES, OPEN_STATUSES, Homework, Status
 
-DEFAULT_MONTH_START = 16
+INDEX_MAX_SELECTIVITY = 0.25
 
 
 class FilterMode(Enum):
@@ -40,14 +45,20 @@ def filter_homeworks(
     homeworks: list[Homework],
     *,
     mode: FilterMode,
-    config: dict[str, Union[str, int, dict[str, Any]]],
+    config: Config,
     problems: Optional[list[int]] = None,
     no: Optional[int] = None,
     student: Optional[str] = None,
-    cohorts: Optional[str] = None,
+    cohorts: Optional[list[str]] = None,
     from_date: Optional[dt.date] = None,
     to_date: Optional[dt.date] = None,
+    homework_filter: Optional[HomeworkFilter] = None,
+    index: Optional[HomeworkIndex] = None,
 ) -> list[Homework]:
+    """Filter in a single pass; pass the index of the homeworks when the same ones are filtered repeatedly.
+
+    The filters may be compiled beforehand with HomeworkFilter.compile, then the filter arguments are ignored.
+    """
     # TODO: return description as well to be used in the table title
     if no:
         result = [h for h in homeworks if h.number == no]
@@ -56,43 +67,205 @@ def filter_homeworks(
             exit(1)
         return result
 
+    if homework_filter is None:
+        homework_filter = HomeworkFilter.compile(
+            mode,
+            config=config,
+            problems=problems,
+            student=student,
+            cohorts=cohorts,
+            from_date=from_date,
+            to_date=to_date,
+        )
+    if index is not None:
+        return index.select(homework_filter)
+    return homework_filter.apply(homeworks)
+
+
+def get_date_range(
+    mode: FilterMode,
+    config: Config,
+    from_date: Optional[dt.date] = None,
+    to_date: Optional[dt.date] = None,
+) -> tuple[Optional[dt.date], Optional[dt.date]]:
+    """The dates the status should be updated within: the "month" for the monthly modes, the given ones otherwise."""
+    if mode not in (FilterMode.CLOSED_THIS_MONTH, FilterMode.CLOSED_PREVIOUS_MONTH):
+        return from_date, to_date
+    if from_date or to_date:
+        logger.warning(f"date filters are ignored for mode {mode} ⚠️")
+    day_in_month = dt.date.today()
+    if mode == FilterMode.CLOSED_PREVIOUS_MONTH:
+        day_in_month = day_in_month + relativedelta(months=-1)
+    from_date, to_date = month_start_and_end(day_in_month, month_start=config.month_start)
+    logger.info(f"Chosen 'month' is {from_date:%Y-%m-%d} -- {to_date:%Y-%m-%d}.")
+    return from_date, to_date
+
+
+def get_statuses(mode: FilterMode) -> tuple[Optional[frozenset[Status]], bool]:
+    """The statuses to be shown in the mode, None for any; True if the statuses are to be excluded instead."""
     if mode == FilterMode.STANDARD:
-        result = _filter_homeworks_by_status(homeworks, CLOSED_STATUSES, invert=True)
-    elif mode == FilterMode.ALL:
-        result = homeworks
-    elif mode == FilterMode.OPEN:
-        result = _filter_homeworks_by_status(homeworks, OPEN_STATUSES)
-    elif mode == FilterMode.CLOSED:
-        result = _filter_homeworks_by_status(homeworks, CLOSED_STATUSES)
-    elif mode in (FilterMode.CLOSED_THIS_MONTH, FilterMode.CLOSED_PREVIOUS_MONTH):
-        if from_date or to_date:
-            logger.warning(f"date filters are ignored for mode {mode} ⚠️")
-        result = _filter_homeworks_by_status(homeworks, CLOSED_STATUSES)
-        month_start = config.get("month_start", DEFAULT_MONTH_START)
-        day_in_month = dt.date.today()
-        if mode == FilterMode.CLOSED_PREVIOUS_MONTH:
-            day_in_month = day_in_month + relativedelta(months=-1)
-        from_date, to_date = month_start_and_end(day_in_month, month_start=month_start)
-        logger.info(f"Chosen 'month' is {from_date:%Y-%m-%d} -- {to_date:%Y-%m-%d}.")
-    else:
-        logger.error(f"{mode=}")
-
-    if problems:
-        result = [h for h in result if h.problem in problems]
-    if student:
-        result = [h for h in result if student.lower() in h.student.lower()]
-    if cohorts:
-        result = [h for h in result if h.cohort in cohorts]
-    if from_date:
-        from_date = dt.datetime.combine(from_date, dt.time.min).astimezone()
-        result = [h for h in result if from_date <= h.status_updated]
-    if to_date:
-        to_date = dt.datetime.combine(to_date, dt.time.max).astimezone()
-        result = [h for h in result if h.status_updated <= to_date]
-    return result
-
-
-def _filter_homeworks_by_status(homeworks: Iterable[Homework], statuses: set[Status], invert: bool = False):
-    if not invert:
-        return [h for h in homeworks if h.status in statuses]
-    return [h for h in homeworks if h.status not in statuses]
+        return frozenset(CLOSED_STATUSES), True
+    if mode == FilterMode.ALL:
+        return None, False
+    if mode == FilterMode.OPEN:
+        return frozenset(OPEN_STATUSES), False
+    if mode in (FilterMode.CLOSED, FilterMode.CLOSED_THIS_MONTH, FilterMode.CLOSED_PREVIOUS_MONTH):
+        return frozenset(CLOSED_STATUSES), False
+    logger.error(f"{mode=}")
+    return None, False
+
+
+@dataclass
+class HomeworkFilter:
+    """All the CLI filters compiled into a single predicate; None means the filter isn't active."""
+
+    statuses: Optional[frozenset[Status]] = None
+    exclude_statuses: bool = False
+    problems: Optional[frozenset[int]] = None
+    student_key: Optional[str] = None  # lowercased, to be found in Homework.student_key
+    cohorts: Optional[frozenset[str]] = None
+    updated_from: Optional[dt.datetime] = None
+    updated_to: Optional[dt.datetime] = None
+
+    @staticmethod
+    def compile(
+        mode: FilterMode,
+        *,
+        config: Config,
+        problems: Optional[Iterable[int]] = None,
+        student: Optional[str] = None,
+        cohorts: Optional[Iterable[str]] = None,
+        from_date: Optional[dt.date] = None,
+        to_date: Optional[dt.date] = None,
+    ) -> HomeworkFilter:
+        statuses, exclude_statuses = get_statuses(mode)
+        from_date, to_date = get_date_range(mode, config, from_date, to_date)
+        return HomeworkFilter(
+            statuses=statuses,
+            exclude_statuses=exclude_statuses,
+            problems=frozenset(problems) if problems else None,
+            student_key=student.lower() if student else None,
+            cohorts=frozenset(cohorts) if cohorts else None,
+            updated_from=_local_datetime(from_date, dt.time.min) if from_date else None,
+            updated_to=_local_datetime(to_date, dt.time.max) if to_date else None,
+        )
+
+    def __post_init__(self):
+        self.predicates: list[Callable[[Homework], bool]] = self._build_predicates()
+        self.matches: Callable[[Homework], bool] = _all_of(self.predicates)
+
+    def __call__(self, homework: Homework) -> bool:
+        return self.matches(homework)
+
+    def apply(self, homeworks: Iterable[Homework]) -> list[Homework]:
+        matches = self.matches
+        return [h for h in homeworks if matches(h)]
+
+    @property
+    def scope(self) -> str:
+        """The same string for the equal filters in any run, to tell which listing the stored homeworks come from."""
+        return json.dumps({field.name: _canonical(getattr(self, field.name)) for field in fields(self)})
+
+    def _build_predicates(self) -> list[Callable[[Homework], bool]]:
+        """The checks of the active filters, the most selective first, so that a homework fails early.
+
+        A student is a handful of homeworks, a few cohorts or problems are a fraction of them, a date range is
+        usually wider, and a mode keeps either the open or the closed ones.
+        """
+        predicates = []
+        if (student_key := self.student_key) is not None:
+            predicates.append(lambda h: student_key in h.student_key)
+        if (cohorts := self.cohorts) is not None:
+            predicates.append(lambda h: h.cohort in cohorts)
+        if (problems := self.problems) is not None:
+            predicates.append(lambda h: h.problem in problems)
+        if (updated_from := self.updated_from) is not None:
+            predicates.append(lambda h: updated_from <= h.status_updated)
+        if (updated_to := self.updated_to) is not None:
+            predicates.append(lambda h: h.status_updated <= updated_to)
+        if (statuses := self.statuses) is not None:
+            if self.exclude_statuses:
+                predicates.append(lambda h: h.status not in statuses)
+            else:
+                predicates.append(lambda h: h.status in statuses)
+        return predicates
+
+
+class HomeworkIndex:
+    """Secondary indexes over a fixed list of homeworks, for filtering it repeatedly.
+
+    The filter is only checked against the homeworks from the most selective index,
+    the result keeps the order of the list.
+    """
+
+    def __init__(self, homeworks: list[Homework]):
+        self.homeworks = homeworks
+        self.by_status: dict[Status, list[int]] = defaultdict(list)
+        self.by_problem: dict[int, list[int]] = defaultdict(list)
+        self.by_cohort: dict[str, list[int]] = defaultdict(list)
+        for position, homework in enumerate(homeworks):
+            self.by_status[homework.status].append(position)
+            self.by_problem[homework.problem].append(position)
+            self.by_cohort[homework.cohort].append(position)
+        self.by_date = sorted(range(len(homeworks)), key=lambda position: homeworks[position].status_updated)
+        self.dates = [homeworks[position].status_updated for position in self.by_date]
+
+    def __len__(self):
+        return len(self.homeworks)
+
+    def select(self, homework_filter: HomeworkFilter) -> list[Homework]:
+        candidates = self._get_candidates(homework_filter)
+        if candidates is None:
+            return homework_filter.apply(self.homeworks)
+        homeworks = self.homeworks
+        return homework_filter.apply([homeworks[position] for position in sorted(candidates)])
+
+    def _get_candidates(self, homework_filter: HomeworkFilter) -> Optional[list[int]]:
+        """The positions from the smallest of the indexes matching the filter, None if no index helps."""
+        options = []
+        if (statuses := homework_filter.statuses) is not None:
+            if homework_filter.exclude_statuses:
+                statuses = self.by_status.keys() - statuses
+            options.append(_chain_positions(self.by_status, statuses))
+        if homework_filter.problems is not None:
+            options.append(_chain_positions(self.by_problem, homework_filter.problems))
+        if homework_filter.cohorts is not None:
+            options.append(_chain_positions(self.by_cohort, homework_filter.cohorts))
+        if homework_filter.updated_from is not None or homework_filter.updated_to is not None:
+            start = bisect_left(self.dates, homework_filter.updated_from) if homework_filter.updated_from else 0
+            end = bisect_right(self.dates, homework_filter.updated_to) if homework_filter.updated_to else len(self)
+            options.append(self.by_date[start:end])
+        if not options:
+            return None
+        candidates = min(options, key=len)
+        if len(candidates) > len(self) * INDEX_MAX_SELECTIVITY:
+            return None  # sorting the positions back costs more than checking every homework
+        return candidates
+
+
+def _all_of(predicates: list[Callable[[Homework], bool]]) -> Callable[[Homework], bool]:
+    """Chain the predicates with `and`: a call per checked predicate, cheaper than all() over a generator."""
+    if not predicates:
+        return lambda h: True
+    first, *rest = predicates
+    if not rest:
+        return first
+    check_rest = _all_of(rest)
+    return lambda h: first(h) and check_rest(h)
+
+
+def _canonical(value: Any) -> Any:
+    if isinstance(value, frozenset):
+        return sorted(getattr(item, "name", item) for item in value)
+    if isinstance(value, dt.datetime):
+        return value.isoformat()
+    return value
+
+
+def _local_datetime(date: dt.date, time: dt.time) -> dt.datetime:
+    # Homework dates have the very same tzinfo, so they are compared without computing the offsets.
+    return dt.datetime.combine(date, time).astimezone(LOCAL_TIMEZONE)
+
+
+def _chain_positions(index: dict[Any, list[int]], keys: Iterable[Any]) -> list[int]:
+    return [position for key in keys for position in index.get(key, ())]
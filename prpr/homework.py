@@ -1,6 +1,5 @@
 from __future__ import annotations
 
-import re
 from dataclasses import dataclass
 from datetime import datetime, timedelta
 from enum import IntEnum
@@ -10,6 +9,7 @@ from loguru import logger
 from transliterate import slugify
 
 from prpr.date_utils import LOCAL_TIMEZONE, parse_datetime
+from prpr.parsing import parse_lesson_name, parse_revisor_url, parse_summary, split_student_info
 
 
 class Status(IntEnum):
@@ -44,6 +44,36 @@ CLOSED_STATUSES = {Status.CLOSED, Status.RESOLVED}
 
 
 class Homework:
+    """A review ticket.
+
+    Everything that doesn't depend on the current time is computed once, at construction or on the first access;
+    the ticket texts are parsed by prpr.parsing.
+    The time-relative values are computed for an explicit `now` by the *_at methods, so that a table
+    is rendered for a single moment; the properties of the same names use the current time.
+    """
+
+    __slots__ = (
+        "number",
+        "lesson_name",
+        "status_updated",
+        "description",
+        "problem",
+        "student",
+        "student_key",
+        "student_name",
+        "student_email",
+        "cohort",
+        "status",
+        "issue_key",
+        "course",
+        "_iteration",
+        "last_opened",
+        "sla",
+        "deadline",
+        "_revisor_url",
+        "_second_name_slug",
+    )
+
     SECONDS_PER_MINUTE = 60
     SECONDS_PER_HOUR = 3600
     DEADLINE_FORMAT = "%A, %H:%M"  # TODO: move these to settings
@@ -59,18 +89,18 @@ class Homework:
         status: str,  # e.g. "open"
         status_updated: str,  # e.g. "2020-09-23T22:14:37.658+0000"
         description: str,
-        number: int,  # the ordinal number in of all one's tickets sorted by issue key
+        number: int,  # the number of the issue key, e.g. 100 for PCR-100
         course: str,  # e.g. "backend-developer"
         transitions: Optional[list[StatusTransition]] = None,
         sla: Optional[dict[str, Any]] = None,
     ):
         self.number = number
-        self.lesson_name = self._extract_lesson_name(lesson_name)
+        self.lesson_name = parse_lesson_name(lesson_name)
         self.status_updated = parse_datetime(status_updated)
         self.description = description
-        problem, student = self._extract_problem_and_student(summary)
-        self.problem = problem
-        self.student = student
+        self.problem, self.student = parse_summary(summary)
+        self.student_key = self.student.lower()  # for the case-insensitive search
+        self.student_name, self.student_email = split_student_info(self.student)
         self.cohort = cohort
         self.status = Status.from_string(status)
         self.issue_key = issue_key
@@ -82,14 +112,11 @@ class Homework:
             started_at=parse_datetime(sla['startedAt']),
             fail_at=parse_datetime(sla['failAt']),
         )
-
-    @staticmethod
-    def _extract_lesson_name(lesson_name):
-        pattern = r'спринта: (.+)$'
-        match = re.search(pattern, lesson_name)
-        if match:
-            return match.group(1)
-        return lesson_name
+        self.deadline: Optional[datetime] = self._compute_deadline(
+            self.status_updated, self.status, self.last_opened, self.sla and self.sla.fail_at
+        )
+        self._revisor_url = _NOT_COMPUTED
+        self._second_name_slug = _NOT_COMPUTED
 
     @property
     def iteration(self):
@@ -100,10 +127,6 @@ class Homework:
         # We could retrieve iterations here, lazily. I don't want to inject the client instance though.
         # Suggestions are welcome.
 
-    @property
-    def deadline(self) -> Optional[datetime]:
-        return self._compute_deadline(self.status_updated, self.status, self.last_opened, self.sla and self.sla.fail_at)
-
     @property
     def deadline_string(self) -> Optional[str]:
         if self.deadline is None:
@@ -118,50 +141,65 @@ class Homework:
     def open_or_in_review(self) -> bool:
         return self.status in OPEN_STATUSES
 
-    @property
-    def updated_string(self) -> Optional[str]:
+    def updated_string_at(self, now: datetime) -> Optional[str]:
         if self.status_updated is None or self.deadline:
             return None
-        age = datetime.now(LOCAL_TIMEZONE) - self.status_updated
+        age = now - self.status_updated
         if age > timedelta(days=7):
             return f"{self.status_updated:{self.UPDATED_LONG_AGO_FORMAT}} ({age.days} days ago)"
         return f"{self.status_updated:{self.UPDATED_FORMAT}}"
 
     @property
-    def _left_seconds(self) -> Optional[int]:
+    def updated_string(self) -> Optional[str]:
+        return self.updated_string_at(_now())
+
+    def left_seconds_at(self, now: datetime) -> Optional[int]:
         """Seconds to deadline. Negative for missed deadlines"""
         if self.deadline is None:
             return None
-        td = self.deadline - datetime.now(LOCAL_TIMEZONE)
+        td = self.deadline - now
         return int(td.total_seconds())
 
     @property
-    def _left_hours_and_minutes(self) -> Optional[Tuple[int, int, bool]]:
+    def _left_seconds(self) -> Optional[int]:
+        return self.left_seconds_at(_now())
+
+    def _left_hours_and_minutes_at(self, now: datetime) -> Optional[Tuple[int, int, bool]]:
         """Return hours, minutes and True if deadline is missed, False otherwise"""
-        if self.deadline is None:
+        total_seconds = self.left_seconds_at(now)
+        if total_seconds is None:
             return None
-        total_seconds = self._left_seconds
         hours, seconds = divmod(abs(total_seconds), self.SECONDS_PER_HOUR)
         minutes = seconds // self.SECONDS_PER_MINUTE
         return hours, minutes, total_seconds < 0
 
     @property
-    def left(self) -> Optional[str]:
+    def _left_hours_and_minutes(self) -> Optional[Tuple[int, int, bool]]:
+        return self._left_hours_and_minutes_at(_now())
+
+    def left_at(self, now: datetime) -> Optional[str]:
         """E.g. "1:03"."""
-        if self.deadline is None:
+        if (left := self._left_hours_and_minutes_at(now)) is None:
             return None
-        hours, minutes, missed = self._left_hours_and_minutes
+        hours, minutes, missed = left
         if missed:
             return f"-{hours:d}:{minutes:02d}"
         return f"{hours:d}:{minutes:02d}"
 
     @property
-    def deadline_missed(self):
-        return self._left_seconds is not None and self._left_seconds < 0
+    def left(self) -> Optional[str]:
+        return self.left_at(_now())
+
+    def deadline_missed_at(self, now: datetime) -> bool:
+        left_seconds = self.left_seconds_at(now)
+        return left_seconds is not None and left_seconds < 0
 
     @property
-    def pretty_status(self) -> str:
-        if self.deadline_missed and self.status == Status.OPEN:
+    def deadline_missed(self):
+        return self.deadline_missed_at(_now())
+
+    def pretty_status_at(self, now: datetime) -> str:
+        if self.status == Status.OPEN and self.deadline_missed_at(now):
             return "🙀"
         return {
             Status.IN_REVIEW: "🔎",
@@ -171,6 +209,10 @@ class Homework:
             Status.CLOSED: "✔️",
         }.get(self.status, "⁉️")
 
+    @property
+    def pretty_status(self) -> str:
+        return self.pretty_status_at(_now())
+
     @staticmethod
     def _compute_deadline(
         status_updated: Optional[datetime],
@@ -191,12 +233,6 @@ class Homework:
             problem = f"{self.problem}"
         return f"{self.issue_key}, no {self.number}: {problem} {self.student} ({self.status.name})"
 
-    @staticmethod
-    def _extract_problem_and_student(summary) -> Tuple[int, str]:
-        if m := re.match(r"\[(?P<problem>\d+)( \(back_cohort_(?P<cohort>\d+)\))?\] (?P<student>.*)", summary):
-            return int(m.group("problem")), m.group("student")
-        raise ValueError(f"Couldn't parse summary '{summary}' 😿")
-
     @property
     def issue_url(self) -> str:
         return f"https://st.yandex-team.ru/{self.issue_key}"
@@ -212,14 +248,12 @@ class Homework:
         return self.to_issue_key_number(self.issue_key)
 
     @property
-    def revisor_url(self) -> str:
-        if m := re.search(
-            r"==(?P<url>https://(?:admin\.praktikum|pra(c|k)ti(k|c)um-admin)\.yandex-team\.ru/office/revisor-review/(\d+)/(\w+))\b",
-            self.description,
-        ):
-            return m.group("url")
-        logger.warning(f"Failed to extract Revisor url from '{self.description}' 😿")
-        return None
+    def revisor_url(self) -> Optional[str]:
+        if self._revisor_url is _NOT_COMPUTED:
+            self._revisor_url = parse_revisor_url(self.description or "")
+            if self._revisor_url is None:
+                logger.warning(f"Failed to extract Revisor url for {self.issue_key} from '{self.description}' 😿")
+        return self._revisor_url
 
     @staticmethod
     def order_key(homework: Homework) -> Tuple[int, datetime]:
@@ -227,7 +261,9 @@ class Homework:
 
     @property
     def second_name_slug(self):
-        return slugify(self.student.rsplit(maxsplit=3)[-2].lower(), "ru")
+        if self._second_name_slug is _NOT_COMPUTED:
+            self._second_name_slug = slugify(self.student.rsplit(maxsplit=3)[-2].lower(), "ru")
+        return self._second_name_slug
 
     def __eq__(self, o: object) -> bool:
         if self is o:
@@ -239,6 +275,13 @@ class Homework:
     # __hash__ should probably be overridden as well
 
 
+_NOT_COMPUTED = object()
+
+
+def _now() -> datetime:
+    return datetime.now(LOCAL_TIMEZONE)
+
+
 @dataclass
 class StatusTransition:
     from_: Optional[Status]
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+import threading
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from loguru import logger
+
+from prpr.date_utils import LOCAL_TIMEZONE
+from prpr.homework import Homework, Status, StatusTransition
+
+DATABASE_NAME = "homeworks.sqlite"
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS issues (
+    owner TEXT NOT NULL,  -- the assignee the issue was fetched for, "" for oneself
+    issue_key TEXT NOT NULL,
+    key_number INTEGER NOT NULL,
+    updated_at TEXT NOT NULL,  -- updatedAt of the issue, in tracker format
+    summary TEXT NOT NULL,
+    lesson_name TEXT NOT NULL,
+    cohort TEXT NOT NULL,
+    status TEXT NOT NULL,
+    status_updated TEXT NOT NULL,
+    description TEXT,
+    course TEXT NOT NULL,
+    has_transitions INTEGER NOT NULL,  -- the status history is only fetched for open issues
+    sla_id TEXT,
+    sla_started_at TEXT,
+    sla_fail_at TEXT,
+    PRIMARY KEY (owner, issue_key)
+);
+CREATE TABLE IF NOT EXISTS listings (
+    owner TEXT NOT NULL,
+    scope TEXT NOT NULL,  -- HomeworkFilter.scope of the listing
+    synced_at TEXT NOT NULL,  -- when the listing was last stored and reconciled
+    PRIMARY KEY (owner, scope)
+);
+CREATE TABLE IF NOT EXISTS transitions (
+    owner TEXT NOT NULL,
+    issue_key TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    from_status TEXT,
+    to_status TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    PRIMARY KEY (owner, issue_key, position)
+);
+CREATE TABLE IF NOT EXISTS downloads (  -- the iterations found under download.directory
+    issue_key TEXT NOT NULL,
+    iteration INTEGER NOT NULL,
+    directory TEXT NOT NULL,
+    downloaded_at TEXT NOT NULL,
+    PRIMARY KEY (issue_key, iteration)
+);
+CREATE TABLE IF NOT EXISTS zip_urls (
+    issue_key TEXT PRIMARY KEY,
+    iteration INTEGER NOT NULL,  -- the iteration of the issue when its Revisor page was read
+    urls TEXT NOT NULL,  -- newline-separated, in the order of iterations
+    scraped_at TEXT NOT NULL
+);
+"""
+ISSUE_COLUMNS = (
+    "issue_key",
+    "summary",
+    "lesson_name",
+    "cohort",
+    "status",
+    "status_updated",
+    "description",
+    "course",
+)
+ISSUE_KEY_PREFIX = "PCR-"
+# <download.directory>/<course>/hw_NN_<problem>/<key number>_<second name>/it_NN_<version id>, see prpr.download
+HOMEWORK_DIRECTORY_PATTERN = re.compile(r"(?P<key_number>\d+)_")
+ITERATION_DIRECTORY_PATTERN = re.compile(r"it_(?P<iteration>\d+)_[^.]+")  # not the .part directories
+
+
+class HomeworkDatabase:
+    """The issues seen by the previous runs, to list homeworks without the tracker (--offline).
+
+    The issues are stored with what's needed to build their homeworks: the arguments of Homework,
+    the status transitions and the SLA; plus the iterations downloaded so far and the zip urls read from Revisor.
+    The database is only as fresh as the last run which fetched the issues; the filters are applied on load.
+    A listing is recorded as synced once the stored issues it should have returned but didn't are reconciled,
+    so the homeworks matching its filter are as of that time, see get_last_sync.
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Used by one thread at a time, but not necessarily by the one which opened it (see --background-sync).
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.executescript(SCHEMA)
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def open(directory: Path) -> HomeworkDatabase:
+        return HomeworkDatabase(Path(directory).expanduser() / DATABASE_NAME)
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def save(
+        self,
+        owner: str,
+        updated_at: str,
+        fields: dict[str, Any],  # see ISSUE_COLUMNS, plus "sla"
+        transitions: Optional[list[StatusTransition]],
+    ) -> bool:
+        """Store the issue unless it's stored already; return True if it's new or updated. Call commit after."""
+        issue_key = fields["issue_key"]
+        with self.lock:
+            stored = self.connection.execute(
+                "SELECT updated_at FROM issues WHERE owner = ? AND issue_key = ?", (owner, issue_key)
+            ).fetchone()
+            if stored and stored[0] == updated_at:
+                return False
+            sla = fields.get("sla")
+            self.connection.execute(
+                f"INSERT OR REPLACE INTO issues "
+                f"(owner, key_number, updated_at, {', '.join(ISSUE_COLUMNS)}, "
+                f"has_transitions, sla_id, sla_started_at, sla_fail_at) "
+                f"VALUES (?, ?, ?, {', '.join('?' * len(ISSUE_COLUMNS))}, ?, ?, ?, ?)",
+                (
+                    owner,
+                    Homework.to_issue_key_number(issue_key),
+                    updated_at,
+                    *(fields[column] for column in ISSUE_COLUMNS),
+                    transitions is not None,
+                    sla and sla["id"],
+                    sla and sla["startedAt"],
+                    sla and sla["failAt"],
+                ),
+            )
+            self.connection.execute("DELETE FROM transitions WHERE owner = ? AND issue_key = ?", (owner, issue_key))
+            self.connection.executemany(
+                "INSERT INTO transitions (owner, issue_key, position, from_status, to_status, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    (owner, issue_key, position, _status_name(t.from_), t.to.name, t.timestamp.isoformat())
+                    for position, t in enumerate(transitions or [])
+                ),
+            )
+        return True
+
+    def save_downloads(self, issue_key: str, iterations: Iterable[tuple[int, Path]]) -> None:
+        with self.lock, self.connection:
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO downloads (issue_key, iteration, directory, downloaded_at) "
+                "VALUES (?, ?, ?, ?)",
+                (
+                    (issue_key, iteration, str(directory), datetime.now(LOCAL_TIMEZONE).isoformat())
+                    for iteration, directory in iterations
+                ),
+            )
+
+    def scan_downloads(self, download_directory: Path) -> int:
+        """Replace the recorded downloads with the iterations found on disk, return their count."""
+        found = []
+        for iteration_directory in Path(download_directory).expanduser().glob("*/hw_*/*/it_*"):
+            homework_match = HOMEWORK_DIRECTORY_PATTERN.match(iteration_directory.parent.name)
+            iteration_match = ITERATION_DIRECTORY_PATTERN.fullmatch(iteration_directory.name)
+            if homework_match and iteration_match and iteration_directory.is_dir():
+                found.append(
+                    (
+                        ISSUE_KEY_PREFIX + homework_match["key_number"],
+                        int(iteration_match["iteration"]),
+                        str(iteration_directory),
+                        datetime.fromtimestamp(iteration_directory.stat().st_mtime, LOCAL_TIMEZONE).isoformat(),
+                    )
+                )
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM downloads")
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO downloads (issue_key, iteration, directory, downloaded_at) "
+                "VALUES (?, ?, ?, ?)",
+                found,
+            )
+        logger.debug(f"Found {len(found)} downloaded iterations in {download_directory}.")
+        return len(found)
+
+    def delete(self, owner: str, issue_keys: Iterable[str]) -> None:
+        """Forget the issues of the owner, e.g. the reassigned ones. Call commit after."""
+        rows = [(owner, issue_key) for issue_key in issue_keys]
+        with self.lock:
+            self.connection.executemany("DELETE FROM issues WHERE owner = ? AND issue_key = ?", rows)
+            self.connection.executemany("DELETE FROM transitions WHERE owner = ? AND issue_key = ?", rows)
+
+    def commit(self, owner: Optional[str] = None, scope: Optional[str] = None) -> None:
+        """Commit the saved issues; pass the owner and the scope of a complete listing to record the sync time."""
+        with self.lock:
+            if owner is not None and scope is not None:
+                self.connection.execute(
+                    "INSERT OR REPLACE INTO listings (owner, scope, synced_at) VALUES (?, ?, ?)",
+                    (owner, scope, datetime.now(LOCAL_TIMEZONE).isoformat()),
+                )
+            self.connection.commit()
+
+    def load(self, owner: str) -> list[Homework]:
+        """The stored homeworks of the owner, in the order of their keys."""
+        with self.lock:
+            transitions: dict[str, list[StatusTransition]] = {}
+            for issue_key, from_status, to_status, timestamp in self.connection.execute(
+                "SELECT issue_key, from_status, to_status, timestamp FROM transitions "
+                "WHERE owner = ? ORDER BY issue_key, position",
+                (owner,),
+            ):
+                transitions.setdefault(issue_key, []).append(
+                    StatusTransition(
+                        from_status and Status[from_status], Status[to_status], datetime.fromisoformat(timestamp)
+                    )
+                )
+            rows = self.connection.execute(
+                f"SELECT key_number, {', '.join(ISSUE_COLUMNS)}, has_transitions, sla_id, sla_started_at, sla_fail_at "
+                f"FROM issues WHERE owner = ? ORDER BY key_number",
+                (owner,),
+            ).fetchall()
+        homeworks = []
+        for number, *row in rows:
+            fields = dict(zip(ISSUE_COLUMNS, row))
+            has_transitions, sla_id, sla_started_at, sla_fail_at = row[len(ISSUE_COLUMNS):]
+            sla = sla_id and {"id": sla_id, "startedAt": sla_started_at, "failAt": sla_fail_at}
+            issue_transitions = transitions.get(fields["issue_key"], []) if has_transitions else None
+            homeworks.append(Homework(**fields, number=number, transitions=issue_transitions, sla=sla))
+        logger.debug(f"Loaded {len(homeworks)} homeworks from {self.path}.")
+        return homeworks
+
+    def get_last_sync(self, owner: str, scope: str) -> Optional[datetime]:
+        """When the listing with the scope was last synced, None if never.
+
+        The homeworks matching the filter of another listing may be older, they are only updated when seen.
+        """
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT synced_at FROM listings WHERE owner = ? AND scope = ?", (owner, scope)
+            ).fetchone()
+        return row and datetime.fromisoformat(row[0])
+
+    def get_downloaded_iterations(self, issue_key: str) -> dict[int, Path]:
+        with self.lock:
+            rows = self.connection.execute(
+                "SELECT iteration, directory FROM downloads WHERE issue_key = ? ORDER BY iteration", (issue_key,)
+            ).fetchall()
+        return {iteration: Path(directory) for iteration, directory in rows}
+
+    def save_zip_urls(self, issue_key: str, iteration: int, urls: list[str]) -> None:
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO zip_urls (issue_key, iteration, urls, scraped_at) VALUES (?, ?, ?, ?)",
+                (issue_key, iteration, "\n".join(urls), datetime.now(LOCAL_TIMEZONE).isoformat()),
+            )
+
+    def get_zip_urls(self, issue_key: str) -> Optional[tuple[int, list[str]]]:
+        """The iteration the zip urls of the issue were read at and the urls, None if they were never read."""
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT iteration, urls FROM zip_urls WHERE issue_key = ?", (issue_key,)
+            ).fetchone()
+        return row and (row[0], row[1].split("\n"))
+
+
+def _status_name(status: Optional[Status]) -> Optional[str]:
+    return None if status is None else status.name  # Status.IN_REVIEW is falsy
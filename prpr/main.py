@@ -2,40 +2,44 @@
 from __future__ import annotations
 
 import sys
-import webbrowser
+import threading
+from contextlib import ExitStack
 from enum import Enum
+from functools import partial
 from operator import itemgetter
-from typing import Union, Optional
+from typing import Any, Iterable, Iterator, Optional, Union
 
-import questionary
 from loguru import logger
+from rich import print as rprint
+from yandex_tracker_client.exceptions import TrackerClientError
 from yandex_tracker_client.objects import Resource
 
-from prpr.cli import DOWNLOAD, INTERACTIVE, POST_PROCESS, configure_arg_parser
-from prpr.config import get_config
-from prpr.download import BatchDownloader, DownloadMode
-from prpr.filters import filter_homeworks
-from prpr.homework import Homework
-from prpr.post_process import post_process_homework
-from prpr.startrack_client import get_startack_client
+from prpr.cli import DOWNLOAD, GC, INTERACTIVE, POST_PROCESS, PREFETCH, WATCH, configure_arg_parser
+from prpr.config import Config, ConfigError, get_config
+from prpr.download_mode import DownloadMode
+from prpr.export import OutputFormat, export_homeworks
+from prpr.filters import HomeworkFilter, filter_homeworks
+from prpr.homework import Homework, StatusTransition
+from prpr.homework_db import HomeworkDatabase
+from prpr.startrack_client import UNKNOWN_COHORT, IssueStore, PraktikTrackerClient, get_startack_client
 from prpr.table import DISPLAYED_TAIL_LENGTH, print_issue_table
 
-COMPONENT_SUFFIXES = "component_suffixes"
+# Selenium, questionary, pyfiglet, webbrowser, the post-processing and --watch are imported where they're used:
+# the plain listing doesn't need them, and importing them is a noticeable part of its run time.
 
 
 class InteractiveCommand(Enum):
     CHECK_AGAIN = "🔁 Check again"
 
 
-def get_cohort(cohort, components, config):
-    cohort = str(cohort) if cohort else "?"
+def get_cohort(cohort, components, config: Config):
+    cohort = str(cohort) if cohort else UNKNOWN_COHORT
     if not components:
         return cohort
 
     first_component = components[0]
     component_name = first_component.name
-    suffix_mapper = config.get(COMPONENT_SUFFIXES, {})
-    return cohort + suffix_mapper.get(component_name, "")
+    return cohort + config.component_suffixes.get(component_name, "")
 
 
 def sort_homeworks(homeworks: list[Homework]) -> list[Homework]:
@@ -48,6 +52,8 @@ def choose_to_download(to_download: list[Homework]) -> Union[list[Homework], Int
     if len(to_download) == 1:
         logger.debug("Just one homework to be choose from, choosing it.")
         return to_download
+    import questionary
+
     hw_strings = [str(hw) for hw in to_download]
     check_again_string = InteractiveCommand.CHECK_AGAIN.value
     chosen_title = questionary.select(
@@ -75,99 +81,156 @@ def main():
     logger.debug(f"{args=}")
 
     config = get_config()
-    client = get_startack_client(config)
+    if args.command == GC:
+        collect_garbage(config)
+        return
+    if args.download:
+        try:
+            config.validate_download()
+        except ConfigError as e:
+            logger.error(f"Can't download: {e} 😿")
+            sys.exit(1)
+    client = get_startack_client(config, use_cache=not args.no_cache, refresh_cache=args.refresh)
 
     user = args.user
     work_owner = f"{user}'s" if user else "My"
     if args.free:
         if user:
             logger.warning("Requested free tickets list, user parameter ignored")
-        user = config["free_work_owner"]
+        user = config.free_work_owner
         work_owner = "Free"
     table_title = f"{work_owner} Praktikum Review Tickets"
+    owner = user or ""
+    database = HomeworkDatabase.open(config.tracker.cache_directory)
+
+    if args.offline:
+        if args.download or args.watch is not None:
+            logger.warning("--offline ignores {}.", _join_passed((DOWNLOAD, args.download), (WATCH, args.watch)))
+        show_offline(client, database, args, user, table_title)
+        return
+    if args.background_sync:
+        logger.warning("--background-sync is ignored without --offline.")
+
+    if args.format != OutputFormat.TABLE:
+        if args.download or args.watch is not None:
+            passed = _join_passed((DOWNLOAD, args.download), (WATCH, args.watch))
+            logger.warning("--format {} is ignored with {}.", args.format, passed)
+        else:
+            export_issues(client, args, user, config, database)
+            return
+
+    if args.watch is not None:
+        if args.download or args.no:
+            logger.warning("{} is ignored with {}.", WATCH, _join_passed((DOWNLOAD, args.download), ("--no", args.no)))
+        else:
+            from prpr.watch import Watcher
+
+            Watcher(
+                client,
+                user=user,
+                mode=args.mode,
+                compile_filter=partial(compile_homework_filter, args),
+                build_homework=build_homework,
+                interval=args.watch,
+                title=table_title,
+            ).run()
+            return
+
+    interactive = args.interactive or args.download in {DownloadMode.INTERACTIVE, DownloadMode.INTERACTIVE_ALL}
+    if args.prefetch and not interactive:
+        logger.warning("{} is ignored without interactive {}.", PREFETCH, DOWNLOAD)
 
     should_run = True
     last_processed = None
-    while should_run:
-        issues = client.get_issues(user=user, mode=args.mode)
-        logger.debug(f"Got {len(issues)} homeworks.")
-        homeworks = [
-            Homework(
-                issue_key=issue.key,
-                summary=issue.summary,
-                lesson_name=getattr(issue, "lesson_name", ""),
-                cohort=get_cohort(issue.cohort, issue.components, config),
-                status=issue.status.key,
-                status_updated=issue.statusStartTime,
-                description=issue.description,
-                number=number,
-                course=extract_course(issue),
-                transitions=client.get_status_history(issue),
-                sla=_extract_sla_dict(issue)
+    issue_store = IssueStore()
+    with ExitStack() as session:
+        if args.download:
+            from prpr.download import BatchDownloader
+
+            # The browsers are started when first needed and live for the whole interactive session.
+            downloader = session.enter_context(
+                BatchDownloader(config, headless=not args.head, workers=args.workers, database=database)
             )
-            for number, issue in enumerate(issues, 1)
-        ]
-        filtered_homeworks = filter_homeworks(
-            homeworks,
-            mode=args.mode,
-            config=config,
-            problems=args.problems,
-            no=args.no,
-            student=args.student,
-            cohorts=args.cohorts,
-            from_date=args.from_date,
-            to_date=args.to_date,
-        )
-        sorted_homeworks = sort_homeworks(filtered_homeworks)
-        print_issue_table(
-            sorted_homeworks,
-            mode=args.mode,
-            last=DISPLAYED_TAIL_LENGTH,
-            last_processed=last_processed,
-            title=table_title,
-        )
-        if not args.download and args.open:
-            open_pages_for_first(sorted_homeworks)
-        if not args.download:
-            if args.post_process:
-                logger.warning("{} is ignored without {} at the moment.", POST_PROCESS, DOWNLOAD)
-            if args.interactive:
-                logger.warning("{} is ignored without {} at the moment", INTERACTIVE, DOWNLOAD)
-            should_run = False
-        else:
-            if open_or_in_review := [hw for hw in sorted_homeworks if hw.open_or_in_review]:
+        while should_run:
+            config = get_config(reload_if_changed=True)
+            homework_filter = compile_homework_filter(args, config)
+            server_filter = None if args.no else homework_filter
+            if args.download:
+                issues, status_histories = client.sync_issues(
+                    issue_store, user=user, mode=args.mode, homework_filter=server_filter
+                )
+                logger.debug(f"Got {len(issues)} homeworks.")
+                issues_with_histories = zip(issues, status_histories)
+            else:
+                # A single listing: the homeworks are built as the pages arrive, sorted for the table below.
+                issues_with_histories = client.stream_issues(user=user, mode=args.mode, homework_filter=server_filter)
+            issues_with_histories = save_issues(
+                issues_with_histories,
+                database,
+                owner,
+                config,
+                client=client,
+                user=user,
+                scope=get_listing_scope(args, config, homework_filter),
+                scan_downloads=bool(args.download),
+            )
+            homeworks = [build_homework(issue, transitions, config) for issue, transitions in issues_with_histories]
+            filtered_homeworks = filter_homeworks(
+                homeworks, mode=args.mode, config=config, no=args.no, homework_filter=homework_filter
+            )
+            sorted_homeworks = sort_homeworks(filtered_homeworks)
+            print_issue_table(
+                sorted_homeworks,
+                mode=args.mode,
+                last=DISPLAYED_TAIL_LENGTH,
+                last_processed=last_processed,
+                title=table_title,
+            )
+            if not args.download and args.open:
+                open_pages_for_first(sorted_homeworks)
+            if not args.download:
+                if args.post_process:
+                    logger.warning("{} is ignored without {} at the moment.", POST_PROCESS, DOWNLOAD)
                 if args.interactive:
-                    logger.warning(
-                        "--interactive is deprecated and to be removed, use `--download interactive` instead."
-                    )
-                    to_download = choose_to_download(open_or_in_review)
-                    if to_download == InteractiveCommand.CHECK_AGAIN:
-                        should_run = args.download
-                        continue
-                    if to_download:
-                        assert len(to_download) == 1
-                        last_processed = to_download[0]
-                elif args.download == DownloadMode.ALL:
-                    to_download = open_or_in_review
-                elif args.download == DownloadMode.ONE:
-                    to_download = open_or_in_review[:1]
-                elif args.download == DownloadMode.INTERACTIVE or args.download == DownloadMode.INTERACTIVE_ALL:
-                    # TODO: deprecate --interactive
-                    to_download = choose_to_download(open_or_in_review)
-                    if to_download == InteractiveCommand.CHECK_AGAIN:
-                        should_run = True
+                    logger.warning("{} is ignored without {} at the moment", INTERACTIVE, DOWNLOAD)
+                should_run = False
+            else:
+                if open_or_in_review := [hw for hw in sorted_homeworks if hw.open_or_in_review]:
+                    if args.interactive:
+                        logger.warning(
+                            "--interactive is deprecated and to be removed, use `--download interactive` instead."
+                        )
+                        with downloader.prefetch(open_or_in_review[: args.prefetch]):
+                            to_download = choose_to_download(open_or_in_review)
+                        if to_download == InteractiveCommand.CHECK_AGAIN:
+                            should_run = args.download
+                            continue
+                        if to_download:
+                            assert len(to_download) == 1
+                            last_processed = to_download[0]
+                    elif args.download == DownloadMode.ALL:
+                        to_download = open_or_in_review
+                    elif args.download == DownloadMode.ONE:
+                        to_download = open_or_in_review[:1]
+                    elif args.download == DownloadMode.INTERACTIVE or args.download == DownloadMode.INTERACTIVE_ALL:
+                        # TODO: deprecate --interactive
+                        with downloader.prefetch(open_or_in_review[: args.prefetch]):
+                            to_download = choose_to_download(open_or_in_review)
+                        if to_download == InteractiveCommand.CHECK_AGAIN:
+                            should_run = True
+                            continue
+                        if to_download:
+                            last_processed = to_download[0]
+                    else:
+                        raise ValueError(f"Unexpected download mode: {args.download} 😿")
+                    if not to_download:
+                        logger.warning("Nothing to download.")
+                        should_run = False
                         continue
-                    if to_download:
-                        last_processed = to_download[0]
-                else:
-                    raise ValueError(f"Unexpected download mode: {args.download} 😿")
-                if not to_download:
-                    logger.warning("Nothing to download.")
-                    should_run = False
-                    continue
-                hw_noun = "homeworks" if len(to_download) > 1 else "homework"
-                logger.info("Downloading {} {}...", len(to_download), hw_noun)
-                with BatchDownloader(config, headless=not args.head) as downloader:
+                    hw_noun = "homeworks" if len(to_download) > 1 else "homework"
+                    logger.info("Downloading {} {}...", len(to_download), hw_noun)
+                    from prpr.post_process import post_process_homework
+
                     print_banner = len(open_or_in_review) > 1 and args.download in {
                         DownloadMode.ALL,
                         DownloadMode.INTERACTIVE_ALL,
@@ -176,18 +239,222 @@ def main():
                         downloader.download_batch(to_download, print_banner=print_banner),
                         to_download,
                     ):
+                        if results:
+                            downloaded = [(result.iteration, result.iteration_directory) for result in results]
+                            database.save_downloads(homework.issue_key, downloaded)
                         if args.post_process and results:
                             logger.info(f"Post-processing {homework}...")
-                            post_process_homework(results, homework, config=config)
+                            post_process_homework(results, homework, config=config, force_steps=args.force_steps)
                         if args.open:
                             _open_pages_for_homework(homework)
-                should_run = args.download == DownloadMode.INTERACTIVE_ALL and len(open_or_in_review) >= 2
-            else:
-                logger.warning(
-                    "There's nothing to download. Consider relaxing the filters if that's not what you expect."
-                )
-                should_run = False
-                continue
+                    should_run = args.download == DownloadMode.INTERACTIVE_ALL and len(open_or_in_review) >= 2
+                else:
+                    logger.warning(
+                        "There's nothing to download. Consider relaxing the filters if that's not what you expect."
+                    )
+                    should_run = False
+                    continue
+
+
+def _join_passed(*flags: tuple[str, Any]) -> str:
+    """The flags which were passed (their values aren't None), for the warnings about them."""
+    return " and ".join(flag for flag, value in flags if value is not None)
+
+
+def collect_garbage(config: Config) -> None:
+    if not (download_directory := config.download.directory):
+        logger.error("download > directory is not set, there's nothing to collect 😿")
+        sys.exit(1)
+    from prpr.blob_store import BlobStore
+
+    blob_store = BlobStore.for_download_directory(download_directory)
+    removed, freed = blob_store.collect_garbage()
+    rprint(f"Removed [bold]{removed}[/bold] unused files from {blob_store.directory}, {freed / 2**20:.1f} MiB freed.")
+
+
+def export_issues(
+    client: PraktikTrackerClient, args, user: Optional[str], config: Config, database: HomeworkDatabase
+) -> None:
+    """Stream the records of the homeworks matching the filters to stdout, in the tracker's order of the keys."""
+    homework_filter = compile_homework_filter(args, config)
+    server_filter = None if args.no else homework_filter
+    issues_with_histories = save_issues(
+        client.stream_issues(user=user, mode=args.mode, homework_filter=server_filter),
+        database,
+        user or "",
+        config,
+        client=client,
+        user=user,
+        scope=get_listing_scope(args, config, homework_filter),
+    )
+    homeworks = (build_homework(issue, transitions, config) for issue, transitions in issues_with_histories)
+    if args.no:
+        matching = (h for h in homeworks if h.number == args.no)
+    else:
+        matching = (h for h in homeworks if homework_filter(h))
+    count = export_homeworks(matching, args.format, sys.stdout)
+    logger.info(f"Exported {count} homeworks as {args.format}.")
+
+
+def get_listing_scope(args, config: Config, homework_filter: Optional[HomeworkFilter] = None) -> HomeworkFilter:
+    """The filter all the matching homeworks of the listing are returned for: the mode only with --no."""
+    if args.no:
+        return HomeworkFilter.compile(args.mode, config=config)
+    return homework_filter or compile_homework_filter(args, config)
+
+
+def compile_homework_filter(args, config: Config) -> HomeworkFilter:
+    return HomeworkFilter.compile(
+        args.mode,
+        config=config,
+        problems=args.problems,
+        student=args.student,
+        cohorts=args.cohorts,
+        from_date=args.from_date,
+        to_date=args.to_date,
+    )
+
+
+def build_homework(issue: Resource, transitions: Optional[list[StatusTransition]], config: Config) -> Homework:
+    # Numbered by the key, not by the position in the listing: the listing depends on the filters the tracker applied.
+    number = Homework.to_issue_key_number(issue.key)
+    return Homework(**get_homework_fields(issue, config), number=number, transitions=transitions)
+
+
+def get_homework_fields(issue: Resource, config: Config) -> dict[str, Any]:
+    """The arguments of Homework which come from the issue itself."""
+    return dict(
+        issue_key=issue.key,
+        summary=issue.summary,
+        lesson_name=getattr(issue, "lesson_name", ""),
+        cohort=get_cohort(issue.cohort, issue.components, config),
+        status=issue.status.key,
+        status_updated=issue.statusStartTime,
+        description=issue.description,
+        course=extract_course(issue),
+        sla=_extract_sla_dict(issue),
+    )
+
+
+def save_issues(
+    issues_with_histories: Iterable[tuple[Resource, Optional[list[StatusTransition]]]],
+    database: HomeworkDatabase,
+    owner: str,
+    config: Config,
+    *,
+    client: PraktikTrackerClient,
+    user: Optional[str],
+    scope: HomeworkFilter,
+    scan_downloads: bool = False,
+) -> Iterator[tuple[Resource, Optional[list[StatusTransition]]]]:
+    """Store the issues in the database as they pass by; the listing is committed as a whole once it's over.
+
+    With scan_downloads, the downloaded iterations are recorded from download.directory as well.
+    """
+    listed = set()
+    for issue, transitions in issues_with_histories:
+        database.save(owner, issue.updatedAt, get_homework_fields(issue, config), transitions)
+        listed.add(issue.key)
+        yield issue, transitions
+    _finish_listing(client, database, owner, user, scope, listed, config, scan_downloads=scan_downloads)
+
+
+def sync_database(client: PraktikTrackerClient, database: HomeworkDatabase, args, user: Optional[str], owner: str):
+    """Store the current listing, return the number of the new, updated and forgotten issues."""
+    config = get_config()
+    scope = get_listing_scope(args, config)
+    changed = 0
+    listed = set()
+    issues_with_histories = client.stream_issues(user=user, mode=args.mode, homework_filter=None if args.no else scope)
+    for issue, transitions in issues_with_histories:
+        changed += database.save(owner, issue.updatedAt, get_homework_fields(issue, config), transitions)
+        listed.add(issue.key)
+    return changed + _finish_listing(client, database, owner, user, scope, listed, config)
+
+
+def _finish_listing(
+    client: PraktikTrackerClient,
+    database: HomeworkDatabase,
+    owner: str,
+    user: Optional[str],
+    scope: HomeworkFilter,
+    listed: set[str],
+    config: Config,
+    *,
+    scan_downloads: bool = False,
+) -> int:
+    """Reconcile the stored homeworks with a complete listing and commit it; return the number of the changes.
+
+    A stored homework which matches the scope but wasn't listed has changed since it was stored (e.g. it was closed
+    or reassigned): it's fetched again by its key, or forgotten if it's no longer assigned to the owner.
+    """
+    unlisted = [h.issue_key for h in scope.apply(database.load(owner)) if h.issue_key not in listed]
+    changed = 0
+    if unlisted:
+        logger.debug(f"{len(unlisted)} stored homeworks weren't listed, fetching them again...")
+        try:
+            issues, status_histories = client.get_assigned_issues(unlisted, user)
+        except TrackerClientError as e:
+            logger.warning(f"Failed to fetch the homeworks which weren't listed: {e} 😿")
+            database.commit()
+            return changed
+        for issue, transitions in zip(issues, status_histories):
+            changed += database.save(owner, issue.updatedAt, get_homework_fields(issue, config), transitions)
+        forgotten = set(unlisted) - {issue.key for issue in issues}
+        database.delete(owner, forgotten)
+        changed += len(forgotten)
+    if scan_downloads and (download_directory := config.download.directory):
+        database.scan_downloads(download_directory)
+    database.commit(owner, scope.scope)
+    return changed
+
+
+def show_offline(client: PraktikTrackerClient, database: HomeworkDatabase, args, user: Optional[str], title: str):
+    owner = user or ""
+    config = get_config()
+    homeworks = database.load(owner)
+    if synced_at := database.get_last_sync(owner, get_listing_scope(args, config).scope):
+        offline_title = f"{title} as of {synced_at:%m-%d %H:%M}"
+    else:
+        logger.warning(
+            "This listing wasn't stored yet, run it without --offline first; the stored homeworks may be outdated."
+        )
+        offline_title = title
+    if args.format != OutputFormat.TABLE:
+        if args.background_sync:
+            logger.warning("--background-sync is ignored with --format {}.", args.format)
+        homework_filter = compile_homework_filter(args, config)
+        export_homeworks(
+            filter_homeworks(homeworks, mode=args.mode, config=config, no=args.no, homework_filter=homework_filter),
+            args.format,
+            sys.stdout,
+        )
+        return
+
+    changes = []
+    sync_thread = None
+    if args.background_sync:
+        sync_thread = threading.Thread(
+            target=lambda: changes.append(sync_database(client, database, args, user, owner)),
+            name="sync",
+            daemon=True,
+        )
+        sync_thread.start()
+    _print_filtered(homeworks, args, config, offline_title)
+    if sync_thread is not None:
+        logger.info("Syncing with the tracker...")
+        sync_thread.join()
+        if changes and changes[0]:
+            logger.info(f"{changes[0]} homeworks are new or updated.")
+            _print_filtered(database.load(owner), args, config, title)
+        elif changes:
+            logger.info("Nothing has changed.")
+
+
+def _print_filtered(homeworks: list[Homework], args, config: Config, title: str) -> None:
+    homework_filter = compile_homework_filter(args, config)
+    filtered = filter_homeworks(homeworks, mode=args.mode, config=config, no=args.no, homework_filter=homework_filter)
+    print_issue_table(sort_homeworks(filtered), mode=args.mode, last=DISPLAYED_TAIL_LENGTH, title=title)
 
 
 def extract_course(issue):
@@ -204,6 +471,8 @@ def open_pages_for_first(sorted_homeworks: list[Homework]) -> None:
 
 
 def _open_pages_for_homework(homework_to_open):
+    import webbrowser
+
     startrek_url = homework_to_open.issue_url
     logger.info(f"Opening {startrek_url} ...")
     webbrowser.open(startrek_url)
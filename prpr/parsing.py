@@ -0,0 +1,72 @@
+"""Parsing of tracker tickets and Revisor pages.
+
+The patterns are compiled once. The summary and the lesson name are parsed when a Homework is built,
+the Revisor url is only looked up when it's needed.
+"""
+from __future__ import annotations
+
+import re
+from typing import Optional, Tuple
+
+SUMMARY_PATTERN = re.compile(r"\[(?P<problem>\d+)( \(back_cohort_(?P<cohort>\d+)\))?\] (?P<student>.*)")
+LESSON_NAME_PATTERN = re.compile(r"спринта: (.+)$")
+STUDENT_INFO_PATTERN = re.compile(r"^(?P<name>.*?) \((?P<email>.*)\)$")
+REVISOR_URL_PATTERN = re.compile(
+    r"==(?P<url>https://(?:admin\.praktikum|pra(c|k)ti(k|c)um-admin)\.yandex-team\.ru"
+    r"/office/revisor-review/(\d+)/(\w+))\b"
+)
+ZIP_URL_PATTERN = re.compile(r"\"homework_url\":\s?\"(?P<url>[\w\\\-\_:\u002F\.]+\.zip)\"")
+VERSION_ID_PATTERN = re.compile(r".*?_(?P<id>\d+).zip")
+
+
+def parse_summary(summary: str) -> Tuple[int, str]:
+    """E.g. "[1] Даниил Хармс (yuvachev@yandex.ru)" -> 1, "Даниил Хармс (yuvachev@yandex.ru)"."""
+    if m := SUMMARY_PATTERN.match(summary):
+        return int(m.group("problem")), m.group("student")
+    raise ValueError(f"Couldn't parse summary '{summary}' 😿")
+
+
+def parse_lesson_name(lesson_name: str) -> str:
+    """E.g. "Финальное задание спринта: служба доставки" -> "служба доставки"."""
+    if match := LESSON_NAME_PATTERN.search(lesson_name):
+        return match.group(1)
+    return lesson_name
+
+
+def split_student_info(student: str) -> tuple[str, str]:
+    """
+    Split the student's information into name and email.
+
+    Args:
+        student (str): The student's information in the format 'name lastname (email)'.
+
+    Returns:
+        tuple[str, str]: A tuple containing the student's name and email.
+    """
+    if match := STUDENT_INFO_PATTERN.match(student):
+        # e.g. 'name lastname (email)'
+        student_name = match.group("name").strip()
+        student_email = match.group("email").strip()
+    else:
+        student_name = student
+        student_email = ""
+    return student_name, student_email
+
+
+def parse_revisor_url(description: str) -> Optional[str]:
+    if m := REVISOR_URL_PATTERN.search(description):
+        return m.group("url")
+    return None
+
+
+def parse_zip_urls(page_source: str) -> list[str]:
+    """Extract the unique zip urls from a Revisor page, ordered by version id."""
+    urls = {m.replace(r"\u002F", "/") for m in ZIP_URL_PATTERN.findall(page_source)}
+    return sorted(urls, key=parse_version_id)
+
+
+def parse_version_id(homework_zip_filename: str) -> Optional[str]:
+    """E.g. "homework_12345.zip" -> "12345"."""
+    if m := VERSION_ID_PATTERN.search(homework_zip_filename):
+        return m.group("id")
+    return None
@@ -1,45 +1,281 @@
 from __future__ import annotations
 
+import hashlib
+import json
+import os
 import subprocess
-from typing import Optional, Union
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import BinaryIO, Iterable, Optional
 
 from loguru import logger
 
+from prpr.config import DEFAULT_CONSOLE_MAX_LINES, DEFAULT_PROCESS_MAX_WORKERS, Config, ProcessConfig
 from prpr.download import DownloadedResult
 from prpr.homework import Homework
 
 DEFAULT = "default"
-PROCESS = "process"
-RUNNER = "runner"
-COURSES = "courses"
 PROBLEMS = "problems"
+STEPS = "steps"
+COMMAND = "command"
+DEPENDS_ON = "depends_on"
+HEAD = "head"
+TAIL = "tail"
+OUTPUT_CHUNK_SIZE = 64 * 1024  # the longest "line" read from a step at once
 
 PREV_KEYS = {"{it_prev}", "{it_prev_}", "{it_prev_zip}", "{it_prev_zip_}"}
+STEP_CACHE_FILENAME = ".prpr_steps.json"
+HASH_CHUNK_SIZE = 1024 * 1024
 
 
 def post_process_homework(
     results: list[DownloadedResult],
     homework: Optional[Homework] = None,
-    config=None,
+    config: Optional[Config] = None,
     print_step_output=True,
+    force_steps=False,
 ):
-    if not (process_config := config.get(PROCESS, {})):
+    if not (process_config := config.process):
         logger.error("Aaaaa")  # TODO
         return
-    runner = process_config.get(RUNNER, ["bash", "-c"])
-    if default_processing := process_config.get(DEFAULT, {}):
-        run_steps(default_processing, runner, results, DEFAULT, print_step_output)
-    if homework and (course_config := process_config.get(COURSES, {}).get(homework.course)):
+    runner = process_config.runner
+    max_workers = process_config.max_workers
+    console_output = ConsoleOutput.from_config(process_config, enabled=print_step_output)
+    step_cache = StepCache(results[-1].homework_directory, force=force_steps)
+    if default_processing := process_config.default:
+        run_steps(default_processing, runner, results, DEFAULT, max_workers, console_output, step_cache)
+    if homework and (course_config := process_config.courses.get(homework.course)):
         default_course_processing = course_config.get(DEFAULT, {})
-        run_steps(default_course_processing, runner, results, f"{homework.course}.{DEFAULT}", print_step_output)
+        run_steps(
+            default_course_processing,
+            runner,
+            results,
+            f"{homework.course}.{DEFAULT}",
+            max_workers,
+            console_output,
+            step_cache,
+        )
         if problem_processing := course_config.get(PROBLEMS, {}).get(pr := homework.problem):
-            run_steps(problem_processing, runner, results, f"{homework.course}.{PROBLEMS}.{pr}", print_step_output)
+            run_steps(
+                problem_processing,
+                runner,
+                results,
+                f"{homework.course}.{PROBLEMS}.{pr}",
+                max_workers,
+                console_output,
+                step_cache,
+            )
+
+
+@dataclass
+class ConsoleOutput:
+    """How much of the step output is echoed to the terminal; the log files always get all of it."""
+
+    max_lines: Optional[int] = DEFAULT_CONSOLE_MAX_LINES  # None means no limit
+    keep: str = HEAD  # which lines are echoed when there are too many of them: the first ones or the last ones
+    enabled: bool = True
+
+    @staticmethod
+    def from_config(process_config: ProcessConfig, enabled=True) -> ConsoleOutput:
+        return ConsoleOutput(process_config.console_max_lines, process_config.console_keep, enabled)
+
+
+@dataclass
+class StepOutput:
+    log_path: Path
+    returncode: int
+    echoed_lines: list[str]
+    omitted_lines: int
+
+    def print(self) -> None:
+        if self.echoed_lines:
+            print("".join(self.echoed_lines), end="")
+        if self.omitted_lines:
+            print(f"... {self.omitted_lines} more lines in {self.log_path}")
+        print()
+
+
+@dataclass
+class Step:
+    name: str
+    command: str
+    diff: bool
+    result_last: DownloadedResult
+    result_prev: Optional[DownloadedResult]
+    depends_on: set[str] = field(default_factory=set)
+    # The iteration directories and zips the command refers to, None if it refers to none and can't be cached.
+    inputs: Optional[list[Path]] = field(default_factory=list)
+    dependency_outputs: list[Path] = field(default_factory=list)  # the logs of the steps in depends_on
+
+    @property
+    def output_path(self) -> Path:
+        return _get_step_output_path(self.diff, self.result_last, self.result_prev, self.name)
+
+
+class StepCache:
+    """Remembers which command and inputs produced every step log of a homework.
+
+    The key of a step is a hash of the runner, the interpolated command, the contents
+    of the iteration directories and zips it refers to and the logs of the steps it depends on;
+    a step with a known key is not run again. The steps referring to no iteration are always run.
+    """
+
+    def __init__(self, homework_directory: Path, force=False):
+        self.path = homework_directory / STEP_CACHE_FILENAME
+        self.force = force
+        self._lock = threading.Lock()
+        self._input_hashes: dict[Path, str] = {}
+        try:
+            self.entries: dict[str, dict] = json.loads(self.path.read_text())
+        except FileNotFoundError:
+            self.entries = {}
+        except ValueError:
+            logger.warning(f"Failed to read {self.path}, all the steps will be run 😿")
+            self.entries = {}
+
+    def compute_key(self, step: Step, runner: list[str]) -> str:
+        digest = hashlib.sha256()
+        digest.update(json.dumps([runner, step.command]).encode())
+        for path in step.inputs:
+            digest.update(self._hash_input(path).encode())
+        for path in step.dependency_outputs:
+            # Not memoized: the log may have been rewritten by this very batch.
+            file_digest = hashlib.sha256()
+            if path.exists():
+                _update_digest(file_digest, path)
+            digest.update(file_digest.hexdigest().encode())
+        return digest.hexdigest()
+
+    def lookup(self, step: Step, key: str) -> Optional[int]:
+        """Return the exit code of the cached run if there's one."""
+        if self.force:
+            return None
+        with self._lock:
+            entry = self.entries.get(step.output_path.name)
+        if entry and entry["key"] == key and step.output_path.exists():
+            return entry["returncode"]
+        return None
+
+    def store(self, step: Step, key: str, returncode: int) -> None:
+        with self._lock:
+            self.entries[step.output_path.name] = {"key": key, "returncode": returncode}
+            self.path.write_text(json.dumps(self.entries, indent=2))
+
+    def _hash_input(self, path: Path) -> str:
+        with self._lock:
+            if cached := self._input_hashes.get(path):
+                return cached
+        digest = hashlib.sha256()
+        if path.is_dir():
+            for root, directories, files in os.walk(path):
+                directories.sort()
+                for name in sorted(files):
+                    file_path = Path(root, name)
+                    digest.update(str(file_path.relative_to(path)).encode())
+                    _update_digest(digest, file_path)
+        elif path.exists():
+            _update_digest(digest, path)
+        hashed = digest.hexdigest()
+        with self._lock:
+            self._input_hashes[path] = hashed
+        return hashed
 
 
-def run_steps(steps_batch, runner, results, steps_batch_name, print_step_output):
+def _update_digest(digest, file_path: Path) -> None:
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+
+
+def run_steps(
+    steps_batch,
+    runner,
+    results,
+    steps_batch_name,
+    max_workers=DEFAULT_PROCESS_MAX_WORKERS,
+    console_output: Optional[ConsoleOutput] = None,
+    step_cache: Optional[StepCache] = None,
+):
+    """Run the steps, up to max_workers at once, respecting depends_on.
+
+    The output of every step is streamed into its log file. What is echoed to the terminal
+    is printed as a whole in the order of the steps in the config, or as it comes when the steps
+    are run one by one. A step waits for the steps it depends on, whatever their exit codes are;
+    if one of them couldn't be run at all (e.g. the runner is missing), the step is skipped, the others go on.
+    The steps found in step_cache are not run, their logs are printed instead.
+    """
+    console_output = console_output or ConsoleOutput()
+    live = max_workers <= 1 and console_output.keep == HEAD
     logger.info("Running steps from {}...", steps_batch_name)
-    for step_name, command_template in steps_batch["steps"].items():
-        result_last = results[-1]
+    step_configs = steps_batch.get(STEPS) or {}
+    steps = _prepare_steps(step_configs, results)
+    steps_by_name = {step.name: step for step in steps}
+    for step in steps:
+        if unknown := step.depends_on - step_configs.keys():
+            logger.warning(f"{step.name} depends on unknown steps {sorted(unknown)}, ignoring them.")
+        step.depends_on &= steps_by_name.keys()  # the skipped ones are ignored as well
+        step.dependency_outputs = [steps_by_name[name].output_path for name in sorted(step.depends_on)]
+
+    finished: dict[str, StepOutput] = {}
+    not_run: set[str] = set()  # failed to start, skipped because of them or stuck in a dependency cycle
+    running: dict[Future, Step] = {}
+    pending = list(steps)
+    printed = 0
+    with ThreadPoolExecutor(max_workers=max(max_workers, 1), thread_name_prefix="step") as executor:
+        while pending or running:
+            while blocked := [step for step in pending if step.depends_on & not_run]:
+                for step in blocked:
+                    logger.warning(f"Skipping {step.name}: {sorted(step.depends_on & not_run)} didn't run 😿")
+                    pending.remove(step)
+                    not_run.add(step.name)
+            for step in [step for step in pending if step.depends_on <= finished.keys()]:
+                pending.remove(step)
+                running[executor.submit(_run_step, step, runner, console_output, live, step_cache)] = step
+            if not running:
+                if pending:
+                    logger.error(f"Circular dependencies between {[step.name for step in pending]}, skipping them 😿")
+                    not_run.update(step.name for step in pending)
+                break
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                step = running.pop(future)
+                try:
+                    finished[step.name] = future.result()
+                except Exception as e:
+                    logger.error(f"Failed to run {step.name}: {e} 😿")
+                    not_run.add(step.name)
+            printed = _print_finished(steps, printed, finished, not_run, console_output)
+    _print_finished(steps, printed, finished, not_run, console_output)
+
+
+def _print_finished(
+    steps: list[Step],
+    printed: int,
+    finished: dict[str, StepOutput],
+    not_run: set[str],
+    console_output: ConsoleOutput,
+) -> int:
+    """Print the outputs of the steps after the printed ones up to the first unfinished one, return the new count."""
+    while printed < len(steps) and ((name := steps[printed].name) in finished or name in not_run):
+        if console_output.enabled and name in finished:
+            finished[name].print()
+        printed += 1
+    return printed
+
+
+def _prepare_steps(step_configs: dict, results: list[DownloadedResult]) -> list[Step]:
+    steps = []
+    result_last = results[-1]
+    for step_name, step_config in step_configs.items():
+        if isinstance(step_config, dict):
+            command_template = step_config[COMMAND]
+            depends_on = step_config.get(DEPENDS_ON) or []
+            depends_on = {depends_on} if isinstance(depends_on, str) else set(depends_on)
+        else:
+            command_template, depends_on = step_config, set()
         command = _interpolate(command_template, result_last)
         if diff := any(key in command_template for key in PREV_KEYS):
             if len(results) >= 2:
@@ -50,35 +286,106 @@ def run_steps(steps_batch, runner, results, steps_batch_name, print_step_output)
                 continue
         else:
             result_prev = None
-        logger.info(f"Running {step_name}...")
-        logger.debug(f"{step_name}: {command}")
-        step_process = subprocess.run(
-            runner + [command],
-            stdout=subprocess.PIPE,
-            stderr=subprocess.STDOUT,
-            check=False,
-            text=True,
-        )
-        if print_step_output:
-            print(step_process.stdout)
-        _save_step_output_to_file(diff, result_last, result_prev, step_name, step_process)
+        inputs = _get_step_inputs(command_template, result_last, result_prev)
+        steps.append(Step(step_name, command, diff, result_last, result_prev, depends_on, inputs))
+    return steps
+
+
+def _get_step_inputs(
+    command_template: str,
+    result_last: DownloadedResult,
+    result_prev: Optional[DownloadedResult],
+) -> Optional[list[Path]]:
+    """The paths the command reads, None if it refers to no iteration (e.g. only to {hw}) and they can't be told."""
+    placeholders = [
+        (("{it_last}", "{it_last_}"), result_last.iteration_directory),
+        (("{it_last_zip}", "{it_last_zip_}"), result_last.zipfile),
+    ]
+    if result_prev:
+        placeholders += [
+            (("{it_prev}", "{it_prev_}"), result_prev.iteration_directory),
+            (("{it_prev_zip}", "{it_prev_zip_}"), result_prev.zipfile),
+        ]
+    inputs = [path for keys, path in placeholders if any(key in command_template for key in keys)]
+    return inputs or None
+
+
+def _run_step(
+    step: Step,
+    runner: list[str],
+    console_output: ConsoleOutput,
+    live: bool,
+    step_cache: Optional[StepCache] = None,
+) -> StepOutput:
+    """Run the step streaming its output into the log file, keep up to console_output.max_lines for the terminal."""
+    output_path = step.output_path
+    if step_cache and step.inputs is None:
+        logger.debug(f"{step.name} doesn't refer to any iteration, it's not cached.")
+        step_cache = None
+    if step_cache:
+        key = step_cache.compute_key(step, runner)
+        if (returncode := step_cache.lookup(step, key)) is not None:
+            logger.info(f"{step.name} is up to date, replaying {output_path}...")
+            with open(output_path, "rb") as f:
+                echoed_lines, omitted_lines = _echo_output(f, console_output, live)
+            return StepOutput(output_path, returncode, echoed_lines, omitted_lines)
+    logger.info(f"Running {step.name}...")
+    logger.debug(f"{step.name}: {step.command}")
+    logger.debug("Writing results of {} to {}...", step.name, output_path)
+    with open(output_path, "wb") as f, subprocess.Popen(
+        runner + [step.command],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.STDOUT,
+    ) as step_process:
+        echoed_lines, omitted_lines = _echo_output(step_process.stdout, console_output, live, log_file=f)
+    if step_cache:
+        step_cache.store(step, key, step_process.returncode)
+    return StepOutput(output_path, step_process.returncode, echoed_lines, omitted_lines)
+
+
+def _echo_output(
+    output: BinaryIO,
+    console_output: ConsoleOutput,
+    live: bool,
+    log_file: Optional[BinaryIO] = None,
+) -> tuple[list[str], int]:
+    """Copy the output to log_file, return the lines to be echoed and the number of the omitted ones."""
+    if not console_output.enabled and not log_file:
+        return [], 0
+    max_lines = console_output.max_lines
+    echoed_lines = deque(maxlen=max_lines) if console_output.keep == TAIL else []
+    line_count = 0
+    lines: Iterable[bytes] = iter(lambda: output.readline(OUTPUT_CHUNK_SIZE), b"")
+    for line in lines:
+        if log_file:
+            log_file.write(line)
+        line_count += 1
+        if not console_output.enabled:
+            continue
+        if console_output.keep == TAIL:
+            echoed_lines.append(line.decode(errors="replace"))
+        elif max_lines is None or line_count <= max_lines:
+            if live:
+                print(line.decode(errors="replace"), end="")
+            else:
+                echoed_lines.append(line.decode(errors="replace"))
+    if not console_output.enabled:
+        return [], 0
+    echoed_count = line_count if max_lines is None else min(line_count, max_lines)
+    return list(echoed_lines), line_count - echoed_count
 
 
-def _save_step_output_to_file(
+def _get_step_output_path(
     diff,
     last: DownloadedResult,
-    prev: DownloadedResult,
+    prev: Optional[DownloadedResult],
     step_name: str,
-    step_process: Union[subprocess.CompletedProcess, subprocess.CompletedProcess[str]],
-) -> None:
+) -> Path:
     if diff:
         filename = f"{prev.iteration}_vs_{last.iteration}_{prev.id}_{last.id}_{step_name}.log"
     else:
         filename = f"{last.iteration}_{last.id}_{step_name}.log"
-    output_path = last.homework_directory / filename
-    logger.debug("Writing results of {} to {}...", step_name, output_path)
-    with open(output_path, "w") as f:
-        f.write(step_process.stdout)
+    return last.homework_directory / filename
 
 
 def _interpolate(command_template: str, result_last: DownloadedResult) -> str:
@@ -1,25 +1,99 @@
-from typing import Optional
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from itertools import islice
+from pathlib import Path
+from typing import Iterable, Iterator, Optional
 
 import requests_cache
 from loguru import logger
 from requests.utils import check_header_validity
+from requests_cache.backends.sqlite import SQLiteDict
 from yandex_tracker_client import TrackerClient
 from yandex_tracker_client.connection import Connection
 from yandex_tracker_client.exceptions import TrackerClientError
 from yandex_tracker_client.objects import Resource
 
+from prpr.config import (
+    DEFAULT_CACHE_DIRECTORY,
+    DEFAULT_CHANGELOG_EXPIRE_AFTER,
+    DEFAULT_EXPIRE_AFTER,
+    DEFAULT_SEARCH_EXPIRE_AFTER,
+    DEFAULT_TRACKER_CONCURRENCY,
+    DEFAULT_TRACKER_PAGE_SIZE,
+    Config,
+)
 from prpr.date_utils import parse_datetime
-from prpr.filters import FilterMode
+from prpr.filters import FilterMode, HomeworkFilter
 from prpr.homework import Homework, Status, StatusTransition
 
 YANDEX_ORG_ID = 0
-STARTREK_TOKEN_KEY_NAME = "startrek_token"
+HTTP_CACHE_NAME = "http_cache.sqlite"
+ISSUE_VERSIONS_TABLE_NAME = "issue_versions"
+CHANGELOG_KEYS_TABLE_NAME = "changelog_keys"
+CHANGELOG_PATH_PATTERN = re.compile(r"/issues/(?P<issue_key>[^/]+)/changelog")
+SEARCH_URL_PATTERN = "*/issues/_search"
+CHANGELOG_URL_PATTERN = "*/issues/*/changelog"
+SYNC_DROPPED_FILTERS = {"status", "statusStartTime", "cohort"}
+UPDATED_AT_FIELD = "updatedAt"  # the filters take the API field names, like statusStartTime
+UNKNOWN_COHORT = "?"
 
 
 class CachedConnection(Connection):
-    def __init__(self, token, org_id, headers=None, verify=True, **kwargs):
+    """Connection caching API responses, on disk unless persistent=False.
+
+    Issue search results expire quickly. Changelogs are kept for long: they are dropped
+    by forget_outdated_changelogs() once the issue's updatedAt moves, found by the cache keys
+    recorded per issue as the pages are fetched.
+    """
+
+    def __init__(
+        self,
+        token,
+        org_id,
+        headers=None,
+        verify=True,
+        persistent=True,
+        refresh=False,
+        cache_directory: Path = DEFAULT_CACHE_DIRECTORY,
+        search_expire_after: timedelta = DEFAULT_SEARCH_EXPIRE_AFTER,
+        expire_after: timedelta = DEFAULT_EXPIRE_AFTER,
+        changelog_expire_after: timedelta = DEFAULT_CHANGELOG_EXPIRE_AFTER,
+        **kwargs,
+    ):
         super().__init__(token, org_id, headers=headers, verify=verify, **kwargs)
-        self.session = requests_cache.CachedSession(backend='memory')
+        urls_expire_after = {
+            SEARCH_URL_PATTERN: search_expire_after,
+            CHANGELOG_URL_PATTERN: changelog_expire_after,
+        }
+        cache_settings = dict(
+            expire_after=expire_after,
+            urls_expire_after=urls_expire_after,
+            allowable_methods=("GET", "HEAD", "POST"),  # issue search is a POST
+        )
+        if persistent:
+            cache_path = Path(cache_directory).expanduser() / HTTP_CACHE_NAME
+            cache_path.parent.mkdir(parents=True, exist_ok=True)
+            logger.debug(f"Using HTTP cache at {cache_path}.")
+            self.session = requests_cache.CachedSession(cache_path, backend="sqlite", **cache_settings)
+            self.issue_versions = SQLiteDict(cache_path, table_name=ISSUE_VERSIONS_TABLE_NAME, serializer=None)
+            # issue key -> newline-separated cache keys of its changelog pages
+            self.changelog_keys = SQLiteDict(cache_path, table_name=CHANGELOG_KEYS_TABLE_NAME, serializer=None)
+        else:
+            self.session = requests_cache.CachedSession(backend="memory", **cache_settings)
+            self.issue_versions = {}
+            self.changelog_keys = {}
+        self.changelog_keys_lock = threading.Lock()  # the pages of different issues are fetched concurrently
+        if refresh:
+            logger.debug("Clearing HTTP cache...")
+            self.session.cache.clear()
+            self.issue_versions.clear()
+            self.changelog_keys.clear()
+        elif persistent:
+            self.session.cache.delete(expired=True, vacuum=False)
+        self.session.hooks["response"].append(self._remember_changelog_page)
 
         self.session.verify = verify
 
@@ -34,36 +108,302 @@ class CachedConnection(Connection):
         for header in self.session.headers.items():
             check_header_validity(header)
 
+    def forget_outdated_changelogs(self, versions: dict[str, str]) -> None:
+        """Drop cached changelogs of the issues whose updatedAt differs from the one seen before."""
+        outdated = {key: updated for key, updated in versions.items() if self.issue_versions.get(key) != updated}
+        if not outdated:
+            return
+        with self.changelog_keys_lock:
+            stale_keys = []
+            for key in outdated:
+                if cache_keys := self.changelog_keys.get(key):
+                    stale_keys.extend(cache_keys.split("\n"))
+                    del self.changelog_keys[key]
+        if stale_keys:
+            logger.debug(f"Dropping {len(stale_keys)} cached changelog pages for {len(outdated)} updated issues.")
+            for cache_key in stale_keys:
+                try:
+                    del self.session.cache.responses[cache_key]
+                except KeyError:
+                    pass  # expired already
+        for key, updated in outdated.items():
+            self.issue_versions[key] = updated
+
+    def _remember_changelog_page(self, response, *args, **kwargs):
+        if getattr(response, "from_cache", False):
+            return response
+        if not (match := CHANGELOG_PATH_PATTERN.search(response.request.path_url)):
+            return response
+        issue_key, cache_key = match["issue_key"], self.session.cache.create_key(response.request)
+        with self.changelog_keys_lock:
+            cache_keys = self.changelog_keys.get(issue_key)
+            if not cache_keys:
+                self.changelog_keys[issue_key] = cache_key
+            elif cache_key not in cache_keys.split("\n"):
+                self.changelog_keys[issue_key] = f"{cache_keys}\n{cache_key}"
+        return response
+
+
+class IssueStore:
+    """Issues seen so far along with their status histories, used for incremental syncs.
+
+    Issues which stop matching the assignee filter (reassigned or deleted ones) are removed by the sync
+    which re-checks the stored keys.
+    """
+
+    def __init__(self):
+        self.filter_expression: Optional[dict] = None
+        self.issues: dict[str, Resource] = {}
+        self.status_histories: dict[str, Optional[list[StatusTransition]]] = {}
+        self.last_sync: Optional[str] = None  # the latest updatedAt seen, in tracker format
+
+    def reset(self, filter_expression: dict) -> None:
+        self.filter_expression = filter_expression
+        self.issues = {}
+        self.status_histories = {}
+        self.last_sync = None
+
+    def merge(self, issues: Iterable[Resource]) -> list[Resource]:
+        """Store the issues, return the ones that are new or were updated since they were stored."""
+        changed = []
+        for issue in issues:
+            stored = self.issues.get(issue.key)
+            if stored is None or stored.updatedAt != issue.updatedAt:
+                changed.append(issue)
+            self.issues[issue.key] = issue
+            if self.last_sync is None or issue.updatedAt > self.last_sync:
+                self.last_sync = issue.updatedAt
+        return changed
+
+    def remove(self, keys: Iterable[str]) -> None:
+        for key in keys:
+            self.issues.pop(key, None)
+            self.status_histories.pop(key, None)
+
+    def select(self, statuses: Optional[Iterable[str]] = None) -> list[Resource]:
+        issues = self.issues.values()
+        if statuses is not None:
+            issues = [issue for issue in issues if issue.status.key in statuses]
+        return sorted(issues, key=by_issue_key)
+
 
 class PraktikTrackerClient(TrackerClient):
     def __init__(self, *args, **kwargs):
         self.connector = kwargs.pop('connector', Connection)
+        self.concurrency = kwargs.pop("concurrency", DEFAULT_TRACKER_CONCURRENCY)
+        self.component_suffixes = kwargs.pop("component_suffixes", {})
+        self.page_size = kwargs.pop("page_size", DEFAULT_TRACKER_PAGE_SIZE)
         connection = kwargs.pop('connection', None)
         if connection is None:
             connection = self.connector(*args, **kwargs)
 
         super().__init__(*args, connection=connection, **kwargs)
         self.token = kwargs["token"]
+        self.own_login: Optional[str] = None  # asked for when first needed
 
-    def _get_filter_expression(self,  mode: FilterMode, user: Optional[str] = None):
+    def _get_filter_expression(
+        self,
+        mode: FilterMode,
+        user: Optional[str] = None,
+        homework_filter: Optional[HomeworkFilter] = None,
+    ):
+        """The tracker query for the mode and as many of the filters as the tracker can apply.
+
+        The filters are applied client-side anyway, so the query may only return more issues than needed.
+        """
         server_side_filters = {
             "queue": "PCR",
             "assignee": user or "me()",
         }
+        pushed_down = []
         # Server-side filtration optimization for standard and open modes
         if mode in {FilterMode.STANDARD, FilterMode.OPEN}:
             server_side_filters["status"] = ("onTheSideOfUser", "open", "inReview",)
+            pushed_down.append("status")
+        elif mode in {FilterMode.CLOSED, FilterMode.CLOSED_THIS_MONTH, FilterMode.CLOSED_PREVIOUS_MONTH}:
+            server_side_filters["status"] = ("resolved", "closed",)
+            pushed_down.append("status")
+        if homework_filter is None:
+            return server_side_filters
+
+        status_start_time = {}
+        if homework_filter.updated_from is not None:
+            status_start_time["from"] = _format_datetime(homework_filter.updated_from)
+        if homework_filter.updated_to is not None:
+            status_start_time["to"] = _format_datetime(homework_filter.updated_to)
+        if status_start_time:
+            server_side_filters["statusStartTime"] = status_start_time
+            pushed_down.append("dates")
+        if homework_filter.cohorts is not None and (cohorts := self._get_tracker_cohorts(homework_filter.cohorts)):
+            server_side_filters["cohort"] = cohorts
+            pushed_down.append("cohorts")
+        applied_locally = [
+            name
+            for name, value in (("problems", homework_filter.problems), ("student", homework_filter.student_key))
+            if value is not None
+        ]
+        if pushed_down or applied_locally:
+            logger.info(
+                "Filters applied by the tracker: {}; applied locally only: {}.",
+                ", ".join(pushed_down) or "none",
+                ", ".join(applied_locally) or "none",
+            )
         return server_side_filters
 
-    def get_issues(self, user: Optional[str] = None, mode: FilterMode = FilterMode.STANDARD):
+    def _get_tracker_cohorts(self, cohorts: Iterable[str]) -> Optional[list[str]]:
+        """The values of the cohort field for the displayed cohorts, None if they can't be told.
+
+        The displayed ones may end with the suffix of the component, see config.component_suffixes.
+        """
+        suffixes = {suffix for suffix in self.component_suffixes.values() if suffix}
+        tracker_cohorts = set()
+        for cohort in cohorts:
+            if cohort == UNKNOWN_COHORT:
+                return None
+            tracker_cohorts.add(cohort)
+            tracker_cohorts.update(cohort.removesuffix(suffix) for suffix in suffixes if cohort.endswith(suffix))
+        return sorted(tracker_cohorts)
+
+    def get_issues(
+        self,
+        user: Optional[str] = None,
+        mode: FilterMode = FilterMode.STANDARD,
+        homework_filter: Optional[HomeworkFilter] = None,
+    ):
         logger.debug("Fetching issues...")
-        issues = self.issues.find(filter=self._get_filter_expression(mode, user))
+        issues = self.issues.find(filter=self._get_filter_expression(mode, user, homework_filter))
         sorted_issues = sorted(issues, key=by_issue_key)
         return sorted_issues
 
+    def iter_issue_pages(
+        self,
+        user: Optional[str] = None,
+        mode: FilterMode = FilterMode.STANDARD,
+        homework_filter: Optional[HomeworkFilter] = None,
+    ) -> Iterator[list[Resource]]:
+        """Yield the issues page by page, requesting a page when the previous one is used.
+
+        The tracker orders the keys as strings (PCR-10 before PCR-9), unlike by_issue_key.
+        """
+        logger.debug(f"Fetching issues, {self.page_size} per page...")
+        issues = iter(
+            self.issues.find(
+                filter=self._get_filter_expression(mode, user, homework_filter),
+                per_page=self.page_size,
+                order=["+key"],
+            )
+        )
+        while page := list(islice(issues, self.page_size)):
+            yield page
+
+    def stream_issues(
+        self,
+        user: Optional[str] = None,
+        mode: FilterMode = FilterMode.STANDARD,
+        homework_filter: Optional[HomeworkFilter] = None,
+    ) -> Iterator[tuple[Resource, Optional[list[StatusTransition]]]]:
+        """Yield the issues along with their status histories, holding no more than two pages at a time.
+
+        The next page is being downloaded while the status histories for the current one are fetched.
+        The issues come in the tracker's order of the keys, see iter_issue_pages; any other order is up to the caller.
+        Homework.number is the key number, so the order doesn't affect the numbering.
+        """
+        pages = self.iter_issue_pages(user, mode, homework_filter)
+        with ThreadPoolExecutor(max_workers=1, thread_name_prefix="issues") as executor:
+            next_page = executor.submit(next, pages, None)
+            while (page := next_page.result()) is not None:
+                next_page = executor.submit(next, pages, None)
+                yield from zip(page, self.get_status_histories(page))
+
+    def sync_issues(
+        self,
+        store: IssueStore,
+        user: Optional[str] = None,
+        mode: FilterMode = FilterMode.STANDARD,
+        homework_filter: Optional[HomeworkFilter] = None,
+    ) -> tuple[list[Resource], list[Optional[list[StatusTransition]]]]:
+        """Return the issues matching the filter and their status histories.
+
+        The first call performs the full search, the following ones only ask for the issues
+        updated since the last sync and fetch status histories for those; the stored issues which weren't
+        updated are checked to be still assigned to the user, and dropped if they aren't.
+        The issues may match the homework_filter only partially, it's up to the caller to apply it.
+        """
+        filter_expression = self._get_filter_expression(mode, user, homework_filter)
+        if store.filter_expression != filter_expression:
+            store.reset(filter_expression)
+        if store.last_sync is None:
+            logger.debug("Fetching issues...")
+            fetched = self.issues.find(filter=filter_expression)
+        else:
+            # Without the filters on what may change, to notice the issues which stopped matching them.
+            sync_filter = {key: value for key, value in filter_expression.items() if key not in SYNC_DROPPED_FILTERS}
+            sync_filter[UPDATED_AT_FIELD] = {"from": store.last_sync}
+            logger.debug(f"Fetching issues updated since {store.last_sync}...")
+            with self._cache_disabled():
+                fetched = list(self.issues.find(filter=sync_filter))
+            fetched_keys = {issue.key for issue in fetched}
+            if not_updated := [key for key in store.issues if key not in fetched_keys]:
+                assigned = {issue.key for issue in self._find_assigned_issues(not_updated, user)}
+                if gone := [key for key in not_updated if key not in assigned]:
+                    logger.debug(f"{len(gone)} issues are no longer assigned: {', '.join(gone)}.")
+                    store.remove(gone)
+        changed = store.merge(fetched)
+        logger.debug(f"{len(changed)} issues are new or updated.")
+        store.status_histories.update(zip((issue.key for issue in changed), self.get_status_histories(changed)))
+        issues = store.select(filter_expression.get("status"))
+        return issues, [store.status_histories[issue.key] for issue in issues]
+
+    def _cache_disabled(self):
+        if isinstance(self._connection, CachedConnection):
+            return self._connection.session.cache_disabled()
+        return nullcontext()
+
+    def get_assigned_issues(
+        self, keys: Iterable[str], user: Optional[str] = None
+    ) -> tuple[list[Resource], list[Optional[list[StatusTransition]]]]:
+        """The issues with the keys which are still assigned to the user (oneself by default), with their histories."""
+        issues = self._find_assigned_issues(keys, user)
+        return issues, self.get_status_histories(issues)
+
+    def _find_assigned_issues(self, keys: Iterable[str], user: Optional[str] = None) -> list[Resource]:
+        login = user or self._get_own_login()
+        with self._cache_disabled():
+            return [
+                issue
+                for issue in self.issues.find(keys=list(keys))
+                if issue.assignee is not None and issue.assignee.login == login
+            ]
+
+    def _get_own_login(self) -> str:
+        if self.own_login is None:
+            self.own_login = self.myself.login
+        return self.own_login
+
+    def get_status_histories(self, issues: Iterable) -> list[Optional[list[StatusTransition]]]:
+        """Fetch status histories concurrently, the results are in the order of issues."""
+        issues = list(issues)
+        self._forget_outdated_changelogs(issues)
+        if len(issues) <= 1 or self.concurrency <= 1:
+            return [self._get_status_history(issue) for issue in issues]
+        max_workers = min(self.concurrency, len(issues))
+        logger.debug(f"Fetching status histories for {len(issues)} issues with {max_workers} workers...")
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="changelog") as executor:
+            return list(executor.map(self._get_status_history, issues))
+
     def get_status_history(self, issue) -> Optional[list[StatusTransition]]:
-        issue_key, issue_status = issue.key, issue.status.key
-        if issue_status not in {"open", "inReview"}:  # TODO: make configurable
+        self._forget_outdated_changelogs([issue])
+        return self._get_status_history(issue)
+
+    def _forget_outdated_changelogs(self, issues: list) -> None:
+        if not isinstance(self._connection, CachedConnection):
+            return
+        versions = {issue.key: issue.updatedAt for issue in issues if _has_status_history(issue)}
+        self._connection.forget_outdated_changelogs(versions)
+
+    def _get_status_history(self, issue) -> Optional[list[StatusTransition]]:
+        issue_key = issue.key
+        if not _has_status_history(issue):
             return None
         logger.debug(f"Fetching status history for {issue_key}")
         try:
@@ -93,16 +433,31 @@ class PraktikTrackerClient(TrackerClient):
         return transitions
 
 
-def get_startack_client(config) -> PraktikTrackerClient:
-    if STARTREK_TOKEN_KEY_NAME not in config:
-        logger.error(f"{STARTREK_TOKEN_KEY_NAME} top-level key not found in config 😿")
-        exit(1)
-    token = config[STARTREK_TOKEN_KEY_NAME]
+def _format_datetime(value: datetime) -> str:
+    """E.g. "2020-09-23T22:14:37.658+0300", the way the tracker formats them."""
+    return f"{value:%Y-%m-%dT%H:%M:%S}.{value.microsecond // 1000:03}{value:%z}"
+
+
+def _has_status_history(issue) -> bool:
+    return issue.status.key in {"open", "inReview"}  # TODO: make configurable
+
+
+def get_startack_client(config: Config, use_cache=True, refresh_cache=False) -> PraktikTrackerClient:
+    tracker_config = config.tracker
     return PraktikTrackerClient(
         org_id=YANDEX_ORG_ID,
         base_url="https://st-api.yandex-team.ru",
-        token=token,
+        token=config.startrek_token,
         connector=CachedConnection,
+        concurrency=tracker_config.concurrency,
+        component_suffixes=config.component_suffixes,
+        page_size=tracker_config.page_size,
+        persistent=use_cache,
+        refresh=refresh_cache,
+        cache_directory=tracker_config.cache_directory,
+        search_expire_after=tracker_config.search_expire_after,
+        expire_after=tracker_config.expire_after,
+        changelog_expire_after=tracker_config.changelog_expire_after,
     )
 
 
@@ -1,6 +1,5 @@
-import re
 from datetime import datetime
-from typing import Optional, cast
+from typing import Collection, Optional, cast
 
 from loguru import logger
 from rich import box
@@ -9,34 +8,15 @@ from rich.padding import Padding, PaddingDimensions
 from rich.table import Table
 
 from prpr.config import get_config
+from prpr.date_utils import LOCAL_TIMEZONE
 from prpr.filters import FilterMode
 from prpr.homework import Homework, Status
 
 DISPLAYED_TAIL_LENGTH = None
 
-def _split_student_info(student: str) -> tuple[str, str]:
-    """
-    Split the student's information into name and email.
-
-    Args:
-        student (str): The student's information in the format 'name lastname (email)'.
-
-    Returns:
-        tuple[str, str]: A tuple containing the student's name and email.
-    """
-    if match := re.match(r"^(?P<name>.*?) \((?P<email>.*)\)$", student):
-        # e.g. 'name lastname (email)'
-        student_name = match.group("name").strip()
-        student_email = match.group("email").strip()
-    else:
-        student_name = student
-        student_email = ""
-    return student_name, student_email
 
 def retrieve_table_appearance() -> dict[str, str]:
-    config = get_config()
-    table_appearance = config.get("table_appearance") or {}
-    return table_appearance
+    return get_config().table_appearance
 
 
 def retrieve_box_style(table_appearance: dict[str, str], style_key: str, default: box.Box) -> box.Box:
@@ -52,31 +32,65 @@ def retrieve_box_style(table_appearance: dict[str, str], style_key: str, default
         return default
 
 
-def retrieve_padding(table_appearance: dict[str, str], style_key: str, default: PaddingDimensions) -> PaddingDimensions:
+def retrieve_padding(
+    table_appearance: dict[str, str], style_key: str, default: PaddingDimensions
+) -> PaddingDimensions:
     value = table_appearance.get(style_key, default)
     if isinstance(value, str):
         return Padding.unpack(get_padding(value))
     return default
 
+
 def get_padding(value: str) -> PaddingDimensions:
     return cast(PaddingDimensions, tuple(int(x) for x in value.split(',')))
 
-def print_issue_table(homeworks: list[Homework], mode: FilterMode, last=None, last_processed=None, title: Optional[str] = None):
+
+def print_issue_table(
+    homeworks: list[Homework],
+    mode: FilterMode,
+    last=None,
+    last_processed=None,
+    title: Optional[str] = None,
+    console: Optional[Console] = None,
+    table_appearance: Optional[dict[str, str]] = None,
+):
     if not homeworks:
         logger.warning("No homeworks for chosen filter combination.")
         return
+    table = build_issue_table(
+        homeworks,
+        mode,
+        last=last,
+        last_processed=last_processed,
+        title=title,
+        table_appearance=table_appearance,
+    )
+    console = console or Console()
+    console.print(table)
+
+
+def build_issue_table(
+    homeworks: list[Homework],
+    mode: FilterMode,
+    last=None,
+    last_processed=None,
+    title: Optional[str] = None,
+    table_appearance: Optional[dict[str, str]] = None,
+    highlighted: Collection[str] = (),  # issue keys
+) -> Table:
     is_short_table = mode in {FilterMode.STANDARD, FilterMode.OPEN}
-    table_appearance = retrieve_table_appearance()
+    if table_appearance is None:
+        table_appearance = retrieve_table_appearance()
     table = setup_table(homeworks, table_appearance, is_short_table, title)
+    now = datetime.now(LOCAL_TIMEZONE)  # all the rows are rendered for the same moment
 
     start_from = -last if last else last
     for table_number, homework in enumerate(homeworks[start_from:], 1):
         # Construct the student_display with name and email on separate lines if email exists
-        student_name, student_email = _split_student_info(homework.student)
-        student_display = student_name
-        if student_email:
+        student_display = homework.student_name
+        if homework.student_email:
             email_style = table_appearance.get("email_style", "")
-            student_display += f"\n{email_style}{student_email}"
+            student_display += f"\n{email_style}{homework.student_email}"
 
         # Construct the issue URL with lesson name if it exists
         issue_url_with_lesson = homework.issue_url
@@ -98,26 +112,32 @@ def print_issue_table(homeworks: list[Homework], mode: FilterMode, last=None, la
             homework.iteration and str(homework.iteration),
             student_display,
             homework.cohort,
-            homework.pretty_status,
+            homework.pretty_status_at(now),
             homework.deadline_string,
-            homework.left,
-            homework.updated_string,
+            homework.left_at(now),
+            homework.updated_string_at(now),
         ]
         table.add_row(
             *row_columns,
-            style=compute_style(homework, last_processed=last_processed),
+            style=compute_style(homework, last_processed=last_processed, now=now, highlighted=highlighted),
         )
-
-    console = Console()
-    console.print(table)
+    return table
 
 
-def compute_style(homework: Homework, last_processed=None):  # TODO: consider moving to Homework
+def compute_style(  # TODO: consider moving to Homework
+    homework: Homework,
+    last_processed=None,
+    now: Optional[datetime] = None,
+    highlighted: Collection[str] = (),
+):
+    now = now or datetime.now(LOCAL_TIMEZONE)
     if homework == last_processed:
         return "dim"
-    if homework.deadline_missed:
+    if homework.issue_key in highlighted:
+        return "bold green"  # new or reopened in --watch; TODO: Move to dotfile
+    if homework.deadline_missed_at(now):
         return "red"  # TODO: Move to dotfile
-    if homework.deadline and homework.deadline.date() == datetime.now().date():
+    if homework.deadline and homework.deadline.date() == now.date():
         return "bold"
     if homework.status == Status.ON_THE_SIDE_OF_USER:
         return "dim"
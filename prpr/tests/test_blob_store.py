@@ -0,0 +1,62 @@
+import io
+import os
+import time
+from unittest import mock
+
+from prpr import blob_store as blob_store_module
+from prpr.blob_store import TEMPORARY_MAX_AGE, BlobStore
+
+
+def test_put_deduplicates_and_gc_removes_unlinked(tmp_path):
+    blob_store = BlobStore(tmp_path / ".blobs")
+    first, second, other = tmp_path / "first.py", tmp_path / "second.py", tmp_path / "other.py"
+
+    blob_store.put(io.BytesIO(b"print('hello')\n"), first)
+    blob_store.put(io.BytesIO(b"print('hello')\n"), second)
+    blob_store.put(io.BytesIO(b"print('bye')\n"), other)
+
+    assert first.read_bytes() == second.read_bytes() == b"print('hello')\n"
+    assert first.stat().st_ino == second.stat().st_ino
+    assert first.stat().st_nlink == 3  # the blob and both iterations
+    blobs = [p for p in blob_store.directory.rglob("*") if p.is_file()]
+    assert len(blobs) == 2
+    assert not any(p.suffix == ".tmp" for p in blobs)
+
+    assert blob_store.collect_garbage() == (0, 0)
+    other.unlink()
+    assert blob_store.collect_garbage() == (1, len(b"print('bye')\n"))
+    assert first.read_bytes() == b"print('hello')\n"
+    assert len([p for p in blob_store.directory.rglob("*") if p.is_file()]) == 1
+
+
+def test_gc_without_store(tmp_path):
+    assert BlobStore(tmp_path / ".blobs").collect_garbage() == (0, 0)
+
+
+def test_gc_keeps_young_temporary_files(tmp_path):
+    blob_store = BlobStore(tmp_path / ".blobs")
+    blob_store.directory.mkdir()
+    young, old = blob_store.directory / "young.tmp", blob_store.directory / "old.tmp"
+    young.write_bytes(b"being written")
+    old.write_bytes(b"left")
+    stale = time.time() - TEMPORARY_MAX_AGE - 1
+    os.utime(old, (stale, stale))
+    assert blob_store.collect_garbage() == (1, len(b"left"))
+    assert young.exists()
+
+
+def test_new_blob_is_never_garbage(tmp_path):
+    blob_store = BlobStore(tmp_path / ".blobs")
+    target = tmp_path / "main.py"
+    collected = []
+    link_or_copy = blob_store_module._link_or_copy
+
+    def collect_then_link(blob, target):
+        collected.append(blob_store.collect_garbage())  # runs between storing the blob and linking the target
+        link_or_copy(blob, target)
+
+    with mock.patch.object(blob_store_module, "_link_or_copy", side_effect=collect_then_link):
+        blob_store.put(io.BytesIO(b"print('hello')\n"), target)
+    assert collected == [(0, 0)]
+    assert target.read_bytes() == b"print('hello')\n"
+    assert target.stat().st_nlink == 2
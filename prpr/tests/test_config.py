@@ -0,0 +1,108 @@
+import os
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from prpr import config as config_module
+from prpr.config import (
+    DEFAULT_CONNECTIONS_PER_HOST,
+    DEFAULT_MONTH_START,
+    DEFAULT_TRACKER_CONCURRENCY,
+    Config,
+    ConfigError,
+    get_config,
+    load_config,
+)
+
+
+def test_defaults():
+    config = Config.from_dict({"startrek_token": "token"})
+    assert config.month_start == DEFAULT_MONTH_START
+    assert config.tracker.concurrency == DEFAULT_TRACKER_CONCURRENCY
+    assert config.download.connections_per_host == DEFAULT_CONNECTIONS_PER_HOST
+    assert config.download.directory is None
+    assert config.process is None
+    with pytest.raises(ConfigError, match="directory"):
+        config.validate_download()
+
+
+def test_full_config():
+    config = Config.from_dict(
+        {
+            "startrek_token": "token",
+            "month_start": 10,
+            "tracker": {"concurrency": 2, "cache": {"search_expire_after": 30}},
+            "download": {"directory": "~/praktikum", "browser": {"type": "firefox", "profile_path": "/profile"}},
+            "process": {
+                "console_output": {"max_lines": None, "keep": "tail"},
+                "default": {"steps": {"black": "black {it_last}", "flake8": {"command": "flake8 {it_last}"}}},
+            },
+        }
+    )
+    assert config.month_start == 10
+    assert config.tracker.concurrency == 2
+    assert config.tracker.search_expire_after == timedelta(seconds=30)
+    assert config.download.directory == Path("~/praktikum").expanduser()
+    assert config.download.browser.profile_path == "/profile"
+    assert config.process.console_max_lines is None
+    assert config.process.console_keep == "tail"
+    assert list(config.process.default["steps"]) == ["black", "flake8"]
+    config.validate_download()
+
+
+@pytest.mark.parametrize(
+    "raw, message",
+    [
+        ({}, "startrek_token"),
+        ({"startrek_token": "token", "month_start": 31}, "month_start"),
+        ({"startrek_token": "token", "tracker": {"concurrency": "many"}}, "tracker > concurrency"),
+        ({"startrek_token": "token", "download": {"browser": {"type": "chrome"}}}, "download > browser > type"),
+        ({"startrek_token": "token", "download": {"zip_workers": 0}}, "download > zip_workers"),
+        ({"startrek_token": "token", "download": {"http_extraction": "yes"}}, "download > http_extraction"),
+        ({"startrek_token": "token", "download": {"exclude": "venv"}}, "download > exclude"),
+        ({"startrek_token": "token", "process": {"console_output": {"keep": "middle"}}}, "keep"),
+        ({"startrek_token": "token", "process": {"default": {"steps": {"black": ["black"]}}}}, "steps > black"),
+        ({"startrek_token": "token", "process": {"default": {"steps": ["black"]}}}, "process > default > steps"),
+        ({"startrek_token": "token", "process": {"courses": {"backend": "black"}}}, "process > courses > backend"),
+        (
+            {"startrek_token": "token", "process": {"courses": {"backend": {"default": ["black"]}}}},
+            "process > courses > backend > default",
+        ),
+        (
+            {"startrek_token": "token", "process": {"courses": {"backend": {"problems": {2: "black"}}}}},
+            "process > courses > backend > problems > 2",
+        ),
+    ],
+)
+def test_invalid_config(raw, message):
+    with pytest.raises(ConfigError, match=message):
+        Config.from_dict(raw)
+
+
+def test_load_config(tmp_path):
+    config_path = tmp_path / ".prpr.yaml"
+    config_path.write_text("startrek_token: token\nfree_work_owner: nobody\n")
+    config = load_config(config_path)
+    assert config.free_work_owner == "nobody"
+    assert config.path == config_path
+    assert config.mtime == config_path.stat().st_mtime
+
+
+def test_get_config_keeps_the_previous_config_if_reloading_fails(tmp_path):
+    config_path = tmp_path / ".prpr.yaml"
+    config_path.write_text("startrek_token: token\nfree_work_owner: nobody\n")
+    with mock.patch.object(Path, "home", return_value=tmp_path), mock.patch.object(
+        config_module, "_cached_config", None
+    ), mock.patch.object(config_module, "_rejected_mtime", config_module._NOT_REJECTED):
+        loaded = get_config()
+        mtime = config_path.stat().st_mtime
+        config_path.write_text("startrek_token: [\n")
+        os.utime(config_path, (mtime + 1, mtime + 1))
+        assert get_config(reload_if_changed=True) is loaded
+        config_path.unlink()
+        assert get_config(reload_if_changed=True) is loaded
+        config_path.write_text("startrek_token: token\nfree_work_owner: somebody\n")
+        os.utime(config_path, (mtime + 2, mtime + 2))
+        assert get_config(reload_if_changed=True).free_work_owner == "somebody"
@@ -0,0 +1,19 @@
+import sqlite3
+
+from prpr.cookies import load_firefox_cookies
+
+
+def test_load_firefox_cookies(tmp_path):
+    connection = sqlite3.connect(tmp_path / "cookies.sqlite")
+    connection.execute("CREATE TABLE moz_cookies (name TEXT, value TEXT, host TEXT, path TEXT, isSecure INTEGER)")
+    connection.execute("INSERT INTO moz_cookies VALUES ('Session_id', 'secret', '.yandex-team.ru', '/', 1)")
+    connection.commit()
+    connection.close()
+
+    jar = load_firefox_cookies(str(tmp_path))
+
+    assert jar.get("Session_id", domain=".yandex-team.ru") == "secret"
+
+
+def test_load_firefox_cookies_without_store(tmp_path):
+    assert load_firefox_cookies(str(tmp_path)) is None
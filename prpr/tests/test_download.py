@@ -0,0 +1,395 @@
+import io
+import threading
+import time
+import zipfile
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from unittest import mock
+
+import pytest
+from loguru import logger
+from requests.cookies import RequestsCookieJar
+
+from prpr import download
+from prpr.config import BrowserConfig, Config, DownloadConfig
+from prpr.download import BatchDownloader
+from prpr.homework_db import HomeworkDatabase
+
+
+@mock.patch.object(download, "_download_zip", side_effect=lambda url, *args: url)
+@mock.patch.object(download, "_get_homework_directory")
+@mock.patch.object(download, "configure_driver", side_effect=lambda *args, **kwargs: mock.MagicMock())
+def test_download_batch_keeps_order(configure_driver_mock, get_homework_directory_mock, download_zip_mock):
+    homeworks = [mock.Mock(revisor_url=f"https://revisor/{n}") for n in range(6)]
+
+    def get_zip_urls(driver, revisor_url):
+        time.sleep(0.01 * (6 - int(revisor_url.rsplit("/", 1)[-1])))  # the first ones are the slowest
+        return [f"{revisor_url}/1.zip", f"{revisor_url}/2.zip"]
+
+    with mock.patch.object(download, "_get_zip_urls", side_effect=get_zip_urls):
+        with BatchDownloader(Config(startrek_token="token"), workers=3) as downloader:
+            results = list(downloader.download_batch(homeworks, print_banner=False))
+
+    assert configure_driver_mock.call_count == 3
+    assert results == [[f"{hw.revisor_url}/1.zip", f"{hw.revisor_url}/2.zip"] for hw in homeworks]
+
+
+@mock.patch.object(download, "_download_zip", side_effect=lambda url, *args: url)
+@mock.patch.object(download, "_get_homework_directory")
+@mock.patch.object(download, "configure_driver", side_effect=lambda *args, **kwargs: mock.MagicMock())
+def test_drivers_live_through_batches_and_restart_when_dead(
+    configure_driver_mock, get_homework_directory_mock, download_zip_mock
+):
+    homeworks = [mock.Mock(revisor_url=f"https://revisor/{n}") for n in range(2)]
+
+    with mock.patch.object(download, "_get_zip_urls", side_effect=lambda driver, url: [f"{url}/1.zip"]):
+        with BatchDownloader(Config(startrek_token="token")) as downloader:
+            assert downloader.drivers == []
+            list(downloader.download_batch(homeworks[:1], print_banner=False))
+            (driver,) = downloader.drivers
+            driver.quit.assert_not_called()
+
+            type(driver).current_window_handle = mock.PropertyMock(side_effect=download.WebDriverException("dead"))
+            results = list(downloader.download_batch(homeworks[1:], print_banner=False))
+            driver.quit.assert_called_once()
+            (restarted,) = downloader.drivers
+            assert restarted is not driver
+            restarted.quit.assert_not_called()
+
+    restarted.quit.assert_called_once()
+    assert configure_driver_mock.call_count == 2
+    assert results == [["https://revisor/1/1.zip"]]
+
+
+@mock.patch.object(download, "_download_zip", side_effect=lambda url, *args: url)
+@mock.patch.object(download, "_get_homework_directory")
+@mock.patch.object(download, "configure_driver", side_effect=lambda *args, **kwargs: mock.MagicMock())
+@mock.patch.object(download, "load_firefox_cookies", return_value=RequestsCookieJar())
+def test_download_batch_reads_revisor_over_http(
+    load_cookies_mock, configure_driver_mock, get_homework_directory_mock, download_zip_mock
+):
+    config = Config(
+        startrek_token="token",
+        download=DownloadConfig(browser=BrowserConfig(type="firefox", profile_path="profile")),
+    )
+    homeworks = [mock.Mock(revisor_url=f"https://revisor/{n}") for n in range(3)]
+
+    def get(url, **kwargs):
+        # The second page is rendered by the browser only.
+        payload = "" if url.endswith("/1") else f'{{"homework_url": "{url}/homework_1.zip"}}'
+        return mock.Mock(text=payload)
+
+    with mock.patch.object(download._get_session(), "get", side_effect=get):
+        with mock.patch.object(download, "_get_zip_urls", side_effect=lambda driver, url: [f"{url}/browser.zip"]):
+            with BatchDownloader(config, workers=2) as downloader:
+                results = list(downloader.download_batch(homeworks, print_banner=False))
+
+    load_cookies_mock.assert_called_once_with("profile")
+    assert configure_driver_mock.call_count == 1
+    assert results == [
+        ["https://revisor/0/homework_1.zip"],
+        ["https://revisor/1/browser.zip"],
+        ["https://revisor/2/homework_1.zip"],
+    ]
+
+
+@mock.patch.object(download, "_download_zip", side_effect=lambda url, *args: url)
+@mock.patch.object(download, "configure_driver", side_effect=lambda *args, **kwargs: mock.MagicMock())
+def test_download_batch_reuses_known_zip_urls(configure_driver_mock, download_zip_mock, tmp_path):
+    database = HomeworkDatabase(tmp_path / "homeworks.sqlite")
+    homework = mock.Mock(revisor_url="https://revisor/1", issue_key="PCR-1", iteration=2)
+    homework_directory = tmp_path / "PCR-1"
+    (homework_directory / "it_01_1").mkdir(parents=True)
+    (homework_directory / "it_02_2").mkdir()
+    for name in ("homework_1.zip", "homework_2.zip"):
+        with zipfile.ZipFile(homework_directory / name, "w") as archive:
+            archive.writestr("README.md", "")
+    known = ["https://s3/homework_1.zip", "https://s3/homework_2.zip"]
+    database.save_zip_urls("PCR-1", 2, known)
+
+    def download_one():
+        with mock.patch.object(download, "_get_homework_directory", return_value=homework_directory):
+            with BatchDownloader(Config(startrek_token="token"), database=database) as downloader:
+                return list(downloader.download_batch([homework], print_banner=False))
+
+    scraped = known + ["https://s3/homework_3.zip"]
+    with mock.patch.object(download, "_get_zip_urls", return_value=known) as get_zip_urls_mock:
+        assert download_one() == [known]
+        get_zip_urls_mock.assert_not_called()
+
+        (homework_directory / "homework_1.zip").unlink()  # its url may have expired
+        assert download_one() == [known]
+        get_zip_urls_mock.assert_called_once()
+
+        homework.iteration = 3  # reopened, Revisor has a new zip
+        get_zip_urls_mock.return_value = scraped
+        assert download_one() == [scraped]
+        assert get_zip_urls_mock.call_count == 2
+
+    assert database.get_zip_urls("PCR-1") == (3, scraped)
+    assert configure_driver_mock.call_count == 2  # only by the downloaders which asked Revisor
+
+
+@mock.patch.object(download, "_download_zip", side_effect=lambda url, *args: url)
+@mock.patch.object(download, "_get_homework_directory")
+@mock.patch.object(download, "configure_driver", side_effect=lambda *args, **kwargs: mock.MagicMock())
+def test_prefetch_is_quiet_and_cancellable(configure_driver_mock, get_homework_directory_mock, download_zip_mock):
+    homeworks = [mock.Mock(revisor_url=f"https://revisor/{n}") for n in range(3)]
+    started, release = threading.Event(), threading.Event()
+
+    def get_zip_urls(revisor_url, cookies):
+        started.set()
+        release.wait(timeout=5)
+        return [f"{revisor_url}/1.zip"]
+
+    with mock.patch.object(download, "_get_zip_urls_over_http", side_effect=get_zip_urls) as get_zip_urls_mock:
+        with BatchDownloader(Config(startrek_token="token")) as downloader:
+            with downloader.prefetch(homeworks) as prefetch:
+                assert started.wait(timeout=5)
+                prefetch.cancelled.set()  # the choice is made while the first one is being downloaded
+                release.set()
+
+    assert not prefetch.thread.is_alive()
+    get_zip_urls_mock.assert_called_once_with("https://revisor/0", mock.ANY)
+    download_zip_mock.assert_not_called()  # the zips of the first one are skipped as well
+
+
+@mock.patch.object(download, "_get_homework_directory")
+@mock.patch.object(download, "configure_driver", side_effect=lambda *args, **kwargs: mock.MagicMock())
+def test_prefetch_is_cancelled_between_zips(configure_driver_mock, get_homework_directory_mock):
+    homework = mock.Mock(revisor_url="https://revisor/0")
+    config = Config(startrek_token="token", download=DownloadConfig(zip_workers=1))
+    started, downloaded = threading.Event(), []
+
+    def get_zip_urls(revisor_url, cookies):
+        started.wait(timeout=5)
+        return ["1.zip", "2.zip", "3.zip"]
+
+    def download_zip(url, *args):
+        downloaded.append(url)
+        prefetch.cancelled.set()  # chosen while the first zip is being downloaded
+
+    with mock.patch.object(download, "_get_zip_urls_over_http", side_effect=get_zip_urls):
+        with mock.patch.object(download, "_download_zip", side_effect=download_zip) as download_zip_mock:
+            with BatchDownloader(config) as downloader:
+                prefetch = downloader.prefetch([homework])
+                started.set()
+                prefetch.thread.join(timeout=5)
+
+    assert downloaded == ["1.zip"]
+    assert download_zip_mock.call_args.args[-1] is True  # quiet
+
+
+@mock.patch.object(download, "_get_zip_urls_over_http", return_value=None)
+@mock.patch.object(download, "_get_homework_directory")
+@mock.patch.object(download, "configure_driver")
+def test_prefetch_leaves_the_browser_to_the_foreground(
+    configure_driver_mock, get_homework_directory_mock, get_zip_urls_over_http_mock
+):
+    with mock.patch.object(download, "_get_zip_urls") as get_zip_urls_mock:
+        with BatchDownloader(Config(startrek_token="token")) as downloader:
+            with downloader.prefetch([mock.Mock(revisor_url="https://revisor/0")]) as prefetch:
+                prefetch.thread.join(timeout=5)
+    get_zip_urls_over_http_mock.assert_called_once()
+    configure_driver_mock.assert_not_called()
+    get_zip_urls_mock.assert_not_called()
+
+
+def test_prefetch_logs_nothing_above_debug(zip_url, tmp_path):
+    ZipHandler.failures = 1  # a retry
+    homework = mock.Mock(
+        revisor_url="https://revisor/0",
+        course="backend-developer",
+        problem=2,
+        issue_key="PCR-12",
+        issue_key_number=12,
+        second_name_slug="harms",
+        iteration=1,
+    )
+    config = Config(startrek_token="token", download=DownloadConfig(directory=tmp_path / "downloads"))
+    messages = []
+    sink = logger.add(messages.append, level="INFO")
+    try:
+        with mock.patch.object(download, "_get_zip_urls_over_http", return_value=[zip_url]), mock.patch.object(
+            download, "ZIP_DOWNLOAD_BACKOFF", 0
+        ):
+            with BatchDownloader(config) as downloader:
+                with downloader.prefetch([homework]) as prefetch:
+                    prefetch.thread.join(timeout=5)
+    finally:
+        logger.remove(sink)
+    assert len(ZipHandler.requests_seen) == 2
+    assert list((tmp_path / "downloads" / "backend-developer").glob("hw_02_*/12_harms/homework_123.zip"))
+    assert messages == []
+
+
+def _make_zip() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        archive.writestr("manage.py", "print('hello')\n" * 1000)
+    return buffer.getvalue()
+
+
+ZIP_CONTENT = _make_zip()
+
+
+class ZipHandler(BaseHTTPRequestHandler):
+    """Serves ZIP_CONTENT with Range support; the first `failures` requests get a 500."""
+
+    failures = 0
+    requests_seen: list = []
+
+    def do_GET(self):
+        self.requests_seen.append(self.headers.get("Range"))
+        if ZipHandler.failures:
+            ZipHandler.failures -= 1
+            self.send_error(500)
+            return
+        content, status = ZIP_CONTENT, 200
+        if range_header := self.headers.get("Range"):
+            start = int(range_header.removeprefix("bytes=").rstrip("-"))
+            content, status = ZIP_CONTENT[start:], 206
+        self.send_response(status)
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture()
+def zip_url():
+    ZipHandler.failures = 0
+    ZipHandler.requests_seen = []
+    server = HTTPServer(("127.0.0.1", 0), ZipHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}/homework_123.zip"
+    server.shutdown()
+    server.server_close()
+
+
+def test_fetch_zip(zip_url, tmp_path):
+    zip_path = tmp_path / "homework_123.zip"
+    download._fetch_zip(zip_url, zip_path)
+    assert zip_path.read_bytes() == ZIP_CONTENT
+    assert list(tmp_path.iterdir()) == [zip_path]
+
+
+def test_fetch_zip_resumes_partial_file(zip_url, tmp_path):
+    zip_path = tmp_path / "homework_123.zip"
+    (tmp_path / "homework_123.zip.part").write_bytes(ZIP_CONTENT[:100])
+    download._fetch_zip(zip_url, zip_path)
+    assert ZipHandler.requests_seen == ["bytes=100-"]
+    assert zip_path.read_bytes() == ZIP_CONTENT
+
+
+def test_fetch_zip_retries(zip_url, tmp_path):
+    ZipHandler.failures = 2
+    zip_path = tmp_path / "homework_123.zip"
+    download._fetch_zip(zip_url, zip_path, backoff=0)
+    assert len(ZipHandler.requests_seen) == 3
+    assert zip_path.read_bytes() == ZIP_CONTENT
+
+
+def test_fetch_zip_starts_over_on_broken_archive(zip_url, tmp_path):
+    zip_path = tmp_path / "homework_123.zip"
+    (tmp_path / "homework_123.zip.part").write_bytes(b"garbage")
+    download._fetch_zip(zip_url, zip_path, backoff=0)
+    assert ZipHandler.requests_seen == ["bytes=7-", None]
+    assert zip_path.read_bytes() == ZIP_CONTENT
+
+
+def test_download_zips_keeps_order_and_limits_connections(tmp_path):
+    lock = threading.Lock()
+    active, max_active = 0, 0
+
+    def fetch_zip(url, zip_full_path, **kwargs):
+        nonlocal active, max_active
+        with lock:
+            active += 1
+            max_active = max(max_active, active)
+        time.sleep(0.02)
+        with lock:
+            active -= 1
+
+    urls = [f"https://code.s3.example.net/homework_{n}.zip" for n in range(6)]
+    download_config = DownloadConfig(connections_per_host=2)
+    unzip = mock.patch.object(
+        download, "_unzip_homework_file", side_effect=lambda path, it, hw, **kwargs: (path, str(it))
+    )
+    with mock.patch.object(download, "_fetch_zip", side_effect=fetch_zip), unzip:
+        with mock.patch.object(download, "_host_semaphores", {}):
+            with download._make_zip_executor(download_config) as zip_executor:
+                results = download._download_zips(urls, tmp_path, mock.Mock(), zip_executor, download_config)
+    assert [result.iteration for result in results] == [1, 2, 3, 4, 5, 6]
+    assert [result.zipfile.name for result in results] == [f"homework_{n}.zip" for n in range(6)]
+    assert max_active == 2
+
+
+def _write_zip(path, members: dict[str, str]):
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, content in members.items():
+            archive.writestr(name, content)
+
+
+@pytest.mark.parametrize("parallel_extract_min_size", [0, 2**30])
+def test_unzip_selects_members_and_links_unchanged(tmp_path, parallel_extract_min_size):
+    download_config = DownloadConfig(exclude=["venv", "*.mp4"], link_unchanged=True)
+    homework = mock.Mock()
+    first = {
+        "app/main.py": "print(1)\n",
+        "app/util.py": "x = 1\n",
+        "app/edited.py": "y = 1\n",
+        "venv/bin/python": "elf",
+        "media/a.mp4": "...",
+    }
+    _write_zip(tmp_path / "homework_1.zip", first)
+    _write_zip(tmp_path / "homework_2.zip", {**first, "app/main.py": "print(2)\n", "app/new/__init__.py": ""})
+    (tmp_path / "it_02_2.part").mkdir()  # left by an interrupted run
+
+    with mock.patch.object(download, "PARALLEL_EXTRACT_MIN_SIZE", parallel_extract_min_size):
+        first_directory, _ = download._unzip_homework_file(
+            tmp_path / "homework_1.zip", 1, homework, download_config=download_config, quiet=True
+        )
+        (first_directory / "app/edited.py").write_text("y = 2\n")  # by a post-processing step, same size
+        second_directory, version_id = download._unzip_homework_file(
+            tmp_path / "homework_2.zip", 2, homework, download_config=download_config, quiet=True
+        )
+
+    assert version_id == "2"
+    files = sorted(str(p.relative_to(second_directory)) for p in second_directory.rglob("*") if p.is_file())
+    assert files == ["app/edited.py", "app/main.py", "app/new/__init__.py", "app/util.py"]
+    assert (second_directory / "app/main.py").read_text() == "print(2)\n"
+    assert (second_directory / "app/edited.py").read_text() == "y = 1\n"
+    assert (second_directory / "app/util.py").stat().st_ino == (first_directory / "app/util.py").stat().st_ino
+    assert (second_directory / "app/main.py").stat().st_ino != (first_directory / "app/main.py").stat().st_ino
+    assert not (tmp_path / "it_02_2.part").exists()
+
+
+def test_is_selected():
+    assert download._is_selected("app/main.py", include=[], exclude=[])
+    assert not download._is_selected("app/node_modules/x/index.js", include=[], exclude=["node_modules"])
+    assert not download._is_selected("app/static/media/a.png", include=[], exclude=["app/static/media/*"])
+    assert download._is_selected("app/main.py", include=["*.py"], exclude=["tests"])
+    assert not download._is_selected("app/tests/test_main.py", include=["*.py"], exclude=["tests"])
+    assert not download._is_selected("README.md", include=["*.py"], exclude=[])
+
+
+def test_unzip_into_blob_store(tmp_path):
+    download_config = DownloadConfig(directory=tmp_path, blob_store=True)
+    directories = []
+    for n, student in enumerate(["ivanov", "petrov"], 1):
+        homework_directory = tmp_path / student
+        homework_directory.mkdir()
+        homework_zip = homework_directory / f"homework_{n}.zip"
+        _write_zip(homework_zip, {"manage.py": "# starter\n", "app.py": f"# {student}\n"})
+        directory, _ = download._unzip_homework_file(
+            homework_zip, 1, mock.Mock(), download_config=download_config, quiet=True
+        )
+        directories.append(directory)
+
+    ivanov, petrov = directories
+    assert (petrov / "app.py").read_text() == "# petrov\n"
+    assert (ivanov / "manage.py").stat().st_ino == (petrov / "manage.py").stat().st_ino
+    assert (ivanov / "app.py").stat().st_ino != (petrov / "app.py").stat().st_ino
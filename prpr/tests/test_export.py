@@ -0,0 +1,56 @@
+import csv
+import io
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+from prpr.export import FIELDS, OutputFormat, export_homeworks
+from prpr.homework import Homework
+
+NOW = datetime(2021, 5, 11, 12, 0, tzinfo=timezone.utc)
+
+
+@pytest.fixture()
+def homeworks():
+    return [
+        Homework(
+            issue_key=f"PCR-{number}",
+            lesson_name="Финальное задание спринта: служба доставки",
+            summary=f"[{number}] Даниил Хармс (yuvachev{number}@yandex.ru)",
+            cohort="16+",
+            status="open",
+            status_updated="2021-05-11T02:13:00.000+0000",
+            description="Ревью: ==https://admin.praktikum.yandex-team.ru/office/revisor-review/123/abc456",
+            number=number,
+            course="backend-developer",
+            sla={"id": "8126", "startedAt": "2021-05-11T02:13:00.000+0000", "failAt": None},
+        )
+        for number in (1, 2)
+    ]
+
+
+def test_jsonl(homeworks):
+    stream = io.StringIO()
+    assert export_homeworks(homeworks, OutputFormat.JSONL, stream, now=NOW) == 2
+    records = [json.loads(line) for line in stream.getvalue().splitlines()]
+    assert [record["issue_key"] for record in records] == ["PCR-1", "PCR-2"]
+    record = records[0]
+    assert list(record) == list(FIELDS)
+    assert record["student_name"] == "Даниил Хармс"
+    assert record["status"] == "open"
+    assert record["left_seconds"] == 14 * 3600 + 13 * 60
+    assert record["deadline_missed"] is False
+    assert record["sla_id"] == "8126"
+    assert record["sla_fail_at"] is None
+    assert record["revisor_url"].endswith("/123/abc456")
+
+
+@pytest.mark.parametrize("output_format, delimiter", [(OutputFormat.CSV, ","), (OutputFormat.TSV, "\t")])
+def test_csv(homeworks, output_format, delimiter):
+    stream = io.StringIO()
+    export_homeworks(iter(homeworks), output_format, stream, now=NOW)
+    rows = list(csv.DictReader(io.StringIO(stream.getvalue()), delimiter=delimiter))
+    assert [row["issue_key"] for row in rows] == ["PCR-1", "PCR-2"]
+    assert rows[0]["cohort"] == "16+"
+    assert rows[0]["problem"] == "1"
@@ -1,7 +1,10 @@
+import datetime as dt
+
 import pytest
 
-from prpr.filters import filter_homeworks, FilterMode
-from prpr.homework import Homework
+from prpr.config import Config
+from prpr.filters import FilterMode, HomeworkFilter, HomeworkIndex, filter_homeworks
+from prpr.homework import CLOSED_STATUSES, OPEN_STATUSES, Homework
 
 
 @pytest.fixture()
@@ -34,3 +37,63 @@ def test_students_search(search_string, count, homeworks):
 
     result = filter_homeworks(homeworks, mode=FilterMode.ALL, config={}, student=search_string)
     assert len(result) == count
+
+
+@pytest.fixture()
+def many_homeworks():
+    statuses = ["open", "inReview", "onTheSideOfUser", "resolved", "closed"]
+    return [
+        Homework(
+            issue_key=f"PCR-{n}",
+            lesson_name="",
+            summary=f"[{n % 7 + 1}] Даниил Хармс{n % 5} (yuvachev{n}@yandex.ru)",
+            cohort=str(n % 4 + 1),
+            status=statuses[n % len(statuses)],
+            status_updated=f"2021-05-{n % 28 + 1:02}T12:00:00.000+0000",
+            description="",
+            number=n,
+            course="backend-developer",
+        )
+        for n in range(1, 200)
+    ]
+
+
+@pytest.mark.parametrize("mode", [FilterMode.STANDARD, FilterMode.ALL, FilterMode.OPEN, FilterMode.CLOSED])
+@pytest.mark.parametrize(
+    "filters",
+    [
+        {},
+        {"problems": [1, 3]},
+        {"student": "ХАРМС2"},
+        {"cohorts": ["2", "3"]},
+        {"from_date": dt.date(2021, 5, 10), "to_date": dt.date(2021, 5, 20)},
+        {"problems": [2], "cohorts": ["1"], "student": "yuvachev1", "to_date": dt.date(2021, 5, 15)},
+    ],
+)
+def test_compiled_filter_matches_naive_filtering(mode, filters, many_homeworks):
+    def naive(h):
+        if mode == FilterMode.STANDARD and h.status in CLOSED_STATUSES:
+            return False
+        if mode == FilterMode.OPEN and h.status not in OPEN_STATUSES:
+            return False
+        if mode == FilterMode.CLOSED and h.status not in CLOSED_STATUSES:
+            return False
+        if "problems" in filters and h.problem not in filters["problems"]:
+            return False
+        if "student" in filters and filters["student"].lower() not in h.student.lower():
+            return False
+        if "cohorts" in filters and h.cohort not in filters["cohorts"]:
+            return False
+        if "from_date" in filters and h.status_updated.astimezone().date() < filters["from_date"]:
+            return False
+        if "to_date" in filters and h.status_updated.astimezone().date() > filters["to_date"]:
+            return False
+        return True
+
+    config = Config(startrek_token="token")
+    expected = [h for h in many_homeworks if naive(h)]
+    assert filter_homeworks(many_homeworks, mode=mode, config=config, **filters) == expected
+    homework_filter = HomeworkFilter.compile(mode, config=config, **filters)
+    assert [h for h in many_homeworks if homework_filter(h)] == expected
+    index = HomeworkIndex(many_homeworks)
+    assert filter_homeworks(many_homeworks, mode=mode, config=config, index=index, **filters) == expected
@@ -1,6 +1,7 @@
 from datetime import datetime, timedelta, timezone
 
 import pytest
+from loguru import logger
 
 from prpr.homework import Homework
 
@@ -56,3 +57,48 @@ def test_left(status_updated, expected):
         "backend-developer",
     )
     assert homework.left == expected
+
+
+def test_time_relative_fields_use_given_now():
+    homework = Homework(
+        "PCR-12345",
+        "Финальное задание спринта: служба доставки",
+        "[1] Даниил Хармс (yuvachev@yandex.ru)",
+        "1+",
+        "open",
+        "2021-05-11T02:13:00.000+0000",
+        "",
+        1,
+        "backend-developer",
+    )
+    assert homework.deadline == datetime(2021, 5, 12, 2, 13, tzinfo=timezone.utc)
+    assert homework.left_at(NOW) == "-0:07"
+    assert homework.deadline_missed_at(NOW)
+    assert homework.pretty_status_at(NOW) == "🙀"
+    earlier = NOW - timedelta(hours=1)
+    assert homework.left_at(earlier) == "0:53"
+    assert homework.pretty_status_at(earlier) == "🔧"
+    assert (homework.student_name, homework.student_email) == ("Даниил Хармс", "yuvachev@yandex.ru")
+
+
+def test_revisor_url_is_parsed_and_reported_on_access():
+    messages = []
+    handler_id = logger.add(messages.append, level="WARNING")
+    try:
+        homework = Homework(
+            "PCR-12345",
+            "Финальное задание спринта: служба доставки",
+            "[1] Даниил Хармс (yuvachev@yandex.ru)",
+            "1+",
+            "open",
+            "2021-05-11T02:13:00.000+0000",
+            "Ссылка потерялась.",
+            1,
+            "backend-developer",
+        )
+        assert not messages
+        for _ in range(3):
+            assert homework.revisor_url is None
+    finally:
+        logger.remove(handler_id)
+    assert len(messages) == 1
@@ -0,0 +1,90 @@
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+from prpr.homework import Status, StatusTransition
+from prpr.homework_db import HomeworkDatabase
+
+
+def _fields(number, status="open", sla=None):
+    return {
+        "issue_key": f"PCR-{number}",
+        "summary": f"[2] Даниил Хармс (yuvachev{number}@yandex.ru)",
+        "lesson_name": "",
+        "cohort": "16+",
+        "status": status,
+        "status_updated": "2021-05-11T02:13:00.000+0000",
+        "description": "Ревью: ==https://admin.praktikum.yandex-team.ru/office/revisor-review/123/abc456",
+        "course": "backend-developer",
+        "sla": sla,
+    }
+
+
+@pytest.fixture()
+def database(tmp_path):
+    with HomeworkDatabase.open(tmp_path) as database:
+        yield database
+
+
+def test_save_and_load(database):
+    transitions = [
+        StatusTransition(None, Status.OPEN, datetime(2021, 5, 10, tzinfo=timezone.utc)),
+        StatusTransition(Status.OPEN, Status.IN_REVIEW, datetime(2021, 5, 10, 1, tzinfo=timezone.utc)),
+        StatusTransition(Status.IN_REVIEW, Status.OPEN, datetime(2021, 5, 11, tzinfo=timezone.utc)),
+    ]
+    sla = {"id": "8126", "startedAt": "2021-05-11T02:13:00.000+0000", "failAt": "2021-05-12T02:13:00.000+0000"}
+    assert database.save("", "2021-05-11T02:13:00.000+0000", _fields(10, sla=sla), transitions)
+    assert database.save("", "2021-05-11T02:13:00.000+0000", _fields(9, status="closed"), None)
+    assert database.save("someone", "2021-05-11T02:13:00.000+0000", _fields(8), None)
+    database.commit("", "scope")
+    assert not database.save("", "2021-05-11T02:13:00.000+0000", _fields(10, sla=sla), transitions)
+
+    homeworks = database.load("")
+    assert [(h.issue_key, h.number) for h in homeworks] == [("PCR-9", 9), ("PCR-10", 10)]
+    closed, opened = homeworks
+    assert closed.status == Status.CLOSED
+    assert closed.iteration is None
+    assert opened.iteration == 2
+    assert opened.last_opened == datetime(2021, 5, 11, tzinfo=timezone.utc)
+    assert opened.sla.id_ == "8126"
+    assert opened.cohort == "16+"
+    assert opened.revisor_url.endswith("/123/abc456")
+    assert database.get_last_sync("", "scope") is not None
+    assert database.get_last_sync("", "another scope") is None
+    assert database.get_last_sync("someone", "scope") is None
+
+
+def test_delete(database):
+    database.save("", "2021-05-11T02:13:00.000+0000", _fields(1), [])
+    database.save("", "2021-05-11T02:13:00.000+0000", _fields(2), [])
+    database.save("someone", "2021-05-11T02:13:00.000+0000", _fields(1), [])
+    database.delete("", ["PCR-1"])
+    database.commit()
+    assert [h.issue_key for h in database.load("")] == ["PCR-2"]
+    assert [h.issue_key for h in database.load("someone")] == ["PCR-1"]
+
+
+def test_downloads(database):
+    database.save_downloads("PCR-1", [(1, Path("/hw/1")), (2, Path("/hw/2"))])
+    assert database.get_downloaded_iterations("PCR-1") == {1: Path("/hw/1"), 2: Path("/hw/2")}
+
+
+def test_scan_downloads(database, tmp_path):
+    homework_directory = tmp_path / "downloads" / "backend-developer" / "hw_02_api" / "12_harms"
+    for name in ("it_01_abc", "it_02_def", "it_03_ghi.part"):
+        (homework_directory / name).mkdir(parents=True)
+    database.save_downloads("PCR-1", [(1, Path("/gone"))])
+    assert database.scan_downloads(tmp_path / "downloads") == 2
+    assert database.get_downloaded_iterations("PCR-1") == {}
+    assert database.get_downloaded_iterations("PCR-12") == {
+        1: homework_directory / "it_01_abc",
+        2: homework_directory / "it_02_def",
+    }
+
+
+def test_zip_urls(database):
+    assert database.get_zip_urls("PCR-1") is None
+    database.save_zip_urls("PCR-1", 1, ["https://s3/homework_1.zip"])
+    database.save_zip_urls("PCR-1", 2, ["https://s3/homework_1.zip", "https://s3/homework_2.zip"])
+    assert database.get_zip_urls("PCR-1") == (2, ["https://s3/homework_1.zip", "https://s3/homework_2.zip"])
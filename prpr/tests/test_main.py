@@ -0,0 +1,147 @@
+import subprocess
+import sys
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+LAZY_MODULES = (
+    "selenium",
+    "pyfiglet",
+    "questionary",
+    "webbrowser",
+    "prpr.download",
+    "prpr.post_process",
+    "prpr.watch",
+)
+REPOSITORY_ROOT = Path(__file__).parents[2]
+
+
+@pytest.fixture(scope="module")
+def main_imports() -> set[str]:
+    """Names of the modules imported by `import prpr.main`, according to `python -X importtime`."""
+    completed = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import prpr.main"],
+        stderr=subprocess.PIPE,
+        text=True,
+        check=True,
+        cwd=REPOSITORY_ROOT,
+    )
+    # e.g. "import time:       317 |        317 |   selenium.webdriver"
+    return {
+        line.rsplit("|", 1)[-1].strip()
+        for line in completed.stderr.splitlines()
+        if line.startswith("import time:")
+    }
+
+
+@pytest.mark.parametrize("lazy_module", LAZY_MODULES)
+def test_main_import_is_lazy(lazy_module, main_imports):
+    assert "prpr.main" in main_imports
+    assert lazy_module not in main_imports
+
+
+def _issue(key: str, status: str = "open", updated: str = "2021-05-11T02:13:00.000+0000") -> mock.Mock:
+    issue = mock.Mock(
+        key=key,
+        summary="[1] Даниил Хармс (yuvachev@yandex.ru)",
+        lesson_name="",
+        cohort=1,
+        components=[],
+        description="",
+        statusStartTime="2021-05-11T02:13:00.000+0000",
+        updatedAt=updated,
+        sla=None,
+    )
+    issue.status.key = status
+    return issue
+
+
+def test_homework_number_is_the_issue_key_number():
+    from prpr.config import Config
+    from prpr.main import build_homework
+
+    # The same homework whatever listing it comes from, so `--no 100` finds it with or without the filters.
+    assert build_homework(_issue("PCR-100"), None, Config(startrek_token="token")).number == 100
+
+
+@mock.patch("yandex_tracker_client.collections.Issues.find")
+def test_streamed_and_synced_homeworks_are_numbered_alike(find_mock):
+    from prpr.config import Config
+    from prpr.filters import FilterMode
+    from prpr.main import build_homework
+    from prpr.startrack_client import IssueStore, PraktikTrackerClient
+
+    config = Config(startrek_token="token")
+    client = PraktikTrackerClient(token="token", org_id="org-id")
+    # The tracker orders the keys as strings.
+    find_mock.side_effect = lambda **kwargs: iter([_issue("PCR-10"), _issue("PCR-100"), _issue("PCR-9")])
+    with mock.patch.object(client, "get_status_histories", side_effect=lambda issues: [None for _ in issues]):
+        streamed = [build_homework(issue, transitions, config) for issue, transitions in client.stream_issues()]
+        synced = [
+            build_homework(issue, transitions, config)
+            for issue, transitions in zip(*client.sync_issues(IssueStore(), mode=FilterMode.STANDARD))
+        ]
+    assert [h.issue_key for h in streamed] == ["PCR-10", "PCR-100", "PCR-9"]
+    assert [h.issue_key for h in synced] == ["PCR-9", "PCR-10", "PCR-100"]
+    assert {h.issue_key: h.number for h in streamed} == {h.issue_key: h.number for h in synced}
+
+
+@pytest.mark.parametrize(
+    "download,watch,expected",
+    (
+        ("one", None, "--download"),
+        (None, 60, "--watch"),
+        ("all", 60, "--download and --watch"),
+    ),
+)
+def test_warnings_name_only_the_passed_flags(download, watch, expected):
+    from prpr.main import _join_passed
+
+    assert _join_passed(("--download", download), ("--watch", watch)) == expected
+
+
+def test_listing_reconciles_the_stored_homeworks(tmp_path):
+    from prpr.config import Config
+    from prpr.filters import FilterMode, HomeworkFilter
+    from prpr.homework import Status
+    from prpr.homework_db import HomeworkDatabase
+    from prpr.main import save_issues
+
+    config = Config(startrek_token="token")
+    scope = HomeworkFilter.compile(FilterMode.OPEN, config=config)
+    client = mock.Mock()
+    with HomeworkDatabase.open(tmp_path) as database:
+        first = [(_issue(f"PCR-{number}"), []) for number in (1, 2, 3)]
+        list(save_issues(first, database, "", config, client=client, user=None, scope=scope))
+        client.get_assigned_issues.assert_not_called()
+
+        # PCR-2 was closed and PCR-3 was reassigned, so an open listing returns neither.
+        closed = _issue("PCR-2", "closed", "2021-05-12T00:00:00.000+0000")
+        client.get_assigned_issues.return_value = ([closed], [None])
+        second = [(_issue("PCR-1"), [])]
+        list(save_issues(second, database, "", config, client=client, user=None, scope=scope))
+        client.get_assigned_issues.assert_called_once_with(["PCR-2", "PCR-3"], None)
+        stored = [(h.issue_key, h.status) for h in database.load("")]
+        assert stored == [("PCR-1", Status.OPEN), ("PCR-2", Status.CLOSED)]
+        assert database.get_last_sync("", scope.scope) is not None
+        assert database.get_last_sync("", HomeworkFilter.compile(FilterMode.ALL, config=config).scope) is None
+
+
+@pytest.mark.parametrize("scan_downloads", (False, True))
+def test_listing_scans_the_downloads_only_when_asked(tmp_path, scan_downloads):
+    from prpr.config import Config, DownloadConfig
+    from prpr.filters import FilterMode, HomeworkFilter
+    from prpr.homework_db import HomeworkDatabase
+    from prpr.main import save_issues
+
+    config = Config(startrek_token="token", download=DownloadConfig(directory=tmp_path / "downloads"))
+    scope = HomeworkFilter.compile(FilterMode.OPEN, config=config)
+    with HomeworkDatabase.open(tmp_path) as database, mock.patch.object(database, "scan_downloads") as scan:
+        issues = [(_issue("PCR-1"), [])]
+        list(
+            save_issues(
+                issues, database, "", config, client=mock.Mock(), user=None, scope=scope, scan_downloads=scan_downloads
+            )
+        )
+        assert scan.called == scan_downloads
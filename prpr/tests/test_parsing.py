@@ -0,0 +1,72 @@
+import pytest
+
+from prpr.parsing import (
+    parse_lesson_name,
+    parse_revisor_url,
+    parse_summary,
+    parse_zip_urls,
+    split_student_info,
+)
+
+REVISOR_URL = "https://admin.praktikum.yandex-team.ru/office/revisor-review/123/abc456"
+
+
+@pytest.mark.parametrize(
+    "summary, expected",
+    [
+        ("[1] Даниил Хармс (yuvachev@yandex.ru)", (1, "Даниил Хармс (yuvachev@yandex.ru)")),
+        ("[12 (back_cohort_3)] Даниил Хармс (yuvachev@yandex.ru)", (12, "Даниил Хармс (yuvachev@yandex.ru)")),
+    ],
+)
+def test_parse_summary(summary, expected):
+    assert parse_summary(summary) == expected
+
+
+def test_parse_summary_fails():
+    with pytest.raises(ValueError):
+        parse_summary("Даниил Хармс")
+
+
+@pytest.mark.parametrize(
+    "lesson_name, expected",
+    [
+        ("Финальное задание спринта: служба доставки", "служба доставки"),
+        ("Проект", "Проект"),
+    ],
+)
+def test_parse_lesson_name(lesson_name, expected):
+    assert parse_lesson_name(lesson_name) == expected
+
+
+@pytest.mark.parametrize(
+    "student, expected",
+    [
+        ("Даниил Хармс (yuvachev@yandex.ru)", ("Даниил Хармс", "yuvachev@yandex.ru")),
+        ("Даниил Хармс", ("Даниил Хармс", "")),
+    ],
+)
+def test_split_student_info(student, expected):
+    assert split_student_info(student) == expected
+
+
+@pytest.mark.parametrize(
+    "description, expected",
+    [
+        (f"Ревью: =={REVISOR_URL}\nещё текст", REVISOR_URL),
+        ("Ссылка потерялась.", None),
+    ],
+)
+def test_parse_revisor_url(description, expected):
+    assert parse_revisor_url(description) == expected
+
+
+def test_parse_zip_urls():
+    page_source = (
+        r'{"homework_url": "https://code.s3.yandex.net/homework_2.zip"},'
+        r'{"homework_url":"https://code.s3.yandex.net/homework_1.zip"},'
+        r'{"homework_url":"https://code.s3.yandex.net/homework_1.zip"}'
+    )
+    assert parse_zip_urls(page_source) == [
+        "https://code.s3.yandex.net/homework_1.zip",
+        "https://code.s3.yandex.net/homework_2.zip",
+    ]
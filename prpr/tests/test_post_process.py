@@ -0,0 +1,149 @@
+from pathlib import Path
+from unittest import mock
+
+import pytest
+
+from prpr import post_process
+from prpr.download import DownloadedResult
+from prpr.post_process import TAIL, ConsoleOutput, StepCache, run_steps
+
+RUNNER = ["bash", "-c"]
+
+
+def _result(homework_directory: Path, iteration: int) -> DownloadedResult:
+    iteration_directory = homework_directory / f"it_{iteration:02d}_{iteration}"
+    iteration_directory.mkdir()
+    return DownloadedResult(
+        zipfile=homework_directory / f"homework_{iteration}.zip",
+        iteration_directory=iteration_directory,
+        homework_directory=homework_directory,
+        iteration=iteration,
+        id=str(iteration),
+    )
+
+
+@pytest.fixture()
+def results(tmp_path):
+    return [_result(tmp_path, 1), _result(tmp_path, 2)]
+
+
+@pytest.mark.parametrize("max_workers", (1, 4))
+def test_run_steps_prints_output_in_config_order(max_workers, results, capsys):
+    steps = {
+        "steps": {
+            "slow": "sleep 0.2 && echo slow",
+            "fast": "echo fast",
+            "diff": "echo {it_prev_} {it_last_}",
+        }
+    }
+    run_steps(steps, RUNNER, results, "default", max_workers=max_workers)
+    assert capsys.readouterr().out.split() == ["slow", "fast", "it_01_1", "it_02_2"]
+    homework_directory = results[-1].homework_directory
+    assert (homework_directory / "2_2_fast.log").read_text() == "fast\n"
+    assert (homework_directory / "1_vs_2_1_2_diff.log").read_text() == "it_01_1 it_02_2\n"
+
+
+def test_run_steps_respects_depends_on(results, capsys):
+    steps = {
+        "steps": {
+            "read": {"command": "cat {hw}/marker", "depends_on": "write"},
+            "write": "sleep 0.1 && echo written > {hw}/marker",
+        }
+    }
+    run_steps(steps, RUNNER, results, "default", max_workers=4)
+    assert capsys.readouterr().out.split() == ["written"]
+
+
+def test_run_steps_prints_finished_steps_after_circular_ones(results, capsys):
+    steps = {
+        "steps": {
+            "egg": {"command": "echo egg", "depends_on": "chicken"},
+            "chicken": {"command": "echo chicken", "depends_on": "egg"},
+            "after": "echo after",
+        }
+    }
+    run_steps(steps, RUNNER, results, "default", max_workers=2)
+    assert capsys.readouterr().out.split() == ["after"]
+
+
+def test_run_steps_goes_on_after_step_fails_to_start(results, capsys):
+    steps = {
+        "steps": {
+            "broken": "echo broken",
+            "after_broken": {"command": "echo after_broken", "depends_on": "broken"},
+            "independent": "echo independent",
+        }
+    }
+    run_step = post_process._run_step
+
+    def fail_broken(step, *args, **kwargs):
+        if step.name == "broken":
+            raise FileNotFoundError("no such runner")
+        return run_step(step, *args, **kwargs)
+
+    with mock.patch.object(post_process, "_run_step", side_effect=fail_broken):
+        run_steps(steps, RUNNER, results, "default", max_workers=2)
+    assert capsys.readouterr().out.split() == ["independent"]
+
+
+def test_run_steps_skips_dependencies_of_first_iteration(results, capsys):
+    steps = {
+        "steps": {
+            "diff": "echo {it_prev}",
+            "after_diff": {"command": "echo after", "depends_on": ["diff"]},
+        }
+    }
+    run_steps(steps, RUNNER, results[:1], "default", max_workers=2)
+    assert capsys.readouterr().out.split() == ["after"]
+
+
+@pytest.mark.parametrize("max_workers", (1, 2))
+@pytest.mark.parametrize("keep,expected", (("head", ["1", "2", "3"]), (TAIL, ["998", "999", "1000"])))
+def test_run_steps_truncates_console_output(max_workers, keep, expected, results, capsys):
+    steps = {"steps": {"long": "seq 1000"}}
+    run_steps(steps, RUNNER, results, "default", max_workers, ConsoleOutput(max_lines=3, keep=keep))
+    log_path = results[-1].homework_directory / "2_2_long.log"
+    assert capsys.readouterr().out.split("\n")[:4] == expected + [f"... 997 more lines in {log_path}"]
+    assert log_path.read_text().split() == [str(n) for n in range(1, 1001)]
+
+
+def test_run_steps_replays_cached_steps(results, capsys):
+    homework_directory = results[-1].homework_directory
+    steps = {"steps": {"count": "echo run >> {hw}/runs && ls {it_last}"}}
+    (results[-1].iteration_directory / "a.py").write_text("")
+
+    def run(force=False):
+        run_steps(steps, RUNNER, results, "default", step_cache=StepCache(homework_directory, force=force))
+        return capsys.readouterr().out.split()
+
+    assert run() == ["a.py"]
+    assert run() == ["a.py"]
+    assert (homework_directory / "runs").read_text().split() == ["run"]
+
+    (results[-1].iteration_directory / "b.py").write_text("")
+    assert run() == ["a.py", "b.py"]
+    assert run(force=True) == ["a.py", "b.py"]
+    assert (homework_directory / "runs").read_text().split() == ["run", "run", "run"]
+
+
+def test_run_steps_replays_dependent_steps_only_if_dependencies_are_unchanged(results, capsys):
+    homework_directory = results[-1].homework_directory
+    steps = {
+        "steps": {
+            "list": "ls {it_last}",
+            # Keyed on the zip which doesn't change, the rest of the key is the log of "list".
+            "count": {"command": "cat {hw}/2_2_list.log | wc -l; : {it_last_zip}", "depends_on": "list"},
+            "whole": "echo whole >> {hw}/runs",
+        }
+    }
+    (results[-1].iteration_directory / "a.py").write_text("")
+
+    def run():
+        run_steps(steps, RUNNER, results, "default", step_cache=StepCache(homework_directory))
+        return capsys.readouterr().out.split()
+
+    assert run() == ["a.py", "1"]
+    assert run() == ["a.py", "1"]
+    (results[-1].iteration_directory / "b.py").write_text("")
+    assert run() == ["a.py", "b.py", "2"]
+    assert (homework_directory / "runs").read_text().split() == ["whole"] * 3  # refers to no iteration
@@ -1,14 +1,22 @@
+import datetime as dt
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest import mock
 
 import pytest
 from loguru import logger
 
-from prpr.startrack_client import PraktikTrackerClient
+from prpr.config import Config
+from prpr.filters import FilterMode, HomeworkFilter
+from prpr.startrack_client import CachedConnection, IssueStore, PraktikTrackerClient
 
 
 @pytest.fixture()
 def client():
-    return PraktikTrackerClient(token="fake-token", org_id="fake-org-id")
+    client = PraktikTrackerClient(token="fake-token", org_id="fake-org-id")
+    client.own_login = "reviewer"
+    return client
 
 
 @pytest.mark.parametrize("user,assignee", (
@@ -30,3 +38,203 @@ def test_get_issues(find_mock, user, filter_queue, client):
     client.get_issues(user)
     logger.enable("prpr.startrack_client")
     find_mock.assert_called_once_with(filter=filter_queue)
+
+
+def test_get_status_histories_keeps_issue_order():
+    client = PraktikTrackerClient(token="fake-token", org_id="fake-org-id", concurrency=4)
+    issues = [mock.Mock(key=f"PCR-{n}") for n in range(10)]
+    with mock.patch.object(client, "_get_status_history", side_effect=lambda issue: issue.key):
+        assert client.get_status_histories(issues) == [issue.key for issue in issues]
+
+
+def _issue(number, status="open", updated="2021-05-11T02:13:00.000+0000", assignee="reviewer"):
+    issue = mock.Mock(key=f"PCR-{number}", updatedAt=updated)
+    issue.status.key = status
+    issue.assignee.login = assignee
+    return issue
+
+
+class FakeTracker:
+    """Issues.find: the listed issues for a filter, the current state of the issues for keys."""
+
+    def __init__(self, *issues):
+        self.listed = list(issues)
+        self.by_key = {issue.key: issue for issue in issues}
+
+    def find(self, filter=None, keys=None, **kwargs):
+        if keys is not None:
+            return [self.by_key[key] for key in keys if key in self.by_key]
+        return list(self.listed)
+
+
+def _filters(find_mock) -> list[dict]:
+    return [call.kwargs["filter"] for call in find_mock.call_args_list if "filter" in call.kwargs]
+
+
+@mock.patch("yandex_tracker_client.collections.Issues.find")
+def test_sync_issues_fetches_only_updated(find_mock, client):
+    store = IssueStore()
+    first, second = _issue(2), _issue(1)
+    tracker = FakeTracker(first, second)
+    find_mock.side_effect = tracker.find
+    with mock.patch.object(client, "get_status_histories", side_effect=lambda issues: [i.key for i in issues]):
+        issues, histories = client.sync_issues(store, mode=FilterMode.STANDARD)
+        assert [i.key for i in issues] == ["PCR-1", "PCR-2"]
+        assert histories == ["PCR-1", "PCR-2"]
+
+        resolved = _issue(2, status="resolved", updated="2021-05-12T02:13:00.000+0000")
+        tracker.listed = [resolved]
+        issues, histories = client.sync_issues(store, mode=FilterMode.STANDARD)
+        assert client.get_status_histories.call_args.args == ([resolved],)
+    assert _filters(find_mock)[-1] == {
+        "queue": "PCR",
+        "assignee": "me()",
+        "updatedAt": {"from": "2021-05-11T02:13:00.000+0000"},
+    }
+    assert [i.key for i in issues] == ["PCR-1"]
+    assert histories == ["PCR-1"]
+
+
+def test_get_filter_expression_pushes_filters_down():
+    client = PraktikTrackerClient(token="fake-token", org_id="fake-org-id", component_suffixes={"python": "+"})
+    homework_filter = HomeworkFilter.compile(
+        FilterMode.CLOSED,
+        config=Config(startrek_token="fake-token"),
+        problems=[1],
+        cohorts=["16+", "17"],
+        from_date=dt.date(2021, 5, 1),
+        to_date=dt.date(2021, 5, 15),
+    )
+    query = client._get_filter_expression(FilterMode.CLOSED, homework_filter=homework_filter)
+    assert query["status"] == ("resolved", "closed")
+    assert query["cohort"] == ["16", "16+", "17"]
+    assert query["statusStartTime"]["from"].startswith("2021-05-01T00:00:00.000")
+    assert query["statusStartTime"]["to"].startswith("2021-05-15T23:59:59.999")
+    assert "summary" not in query
+
+
+def test_get_filter_expression_keeps_unknown_cohort_local(client):
+    homework_filter = HomeworkFilter.compile(FilterMode.ALL, config=Config(startrek_token="t"), cohorts=["?", "1"])
+    assert "cohort" not in client._get_filter_expression(FilterMode.ALL, homework_filter=homework_filter)
+
+
+@mock.patch("yandex_tracker_client.collections.Issues.find")
+def test_sync_issues_drops_changing_filters(find_mock, client):
+    store = IssueStore()
+    homework_filter = HomeworkFilter.compile(
+        FilterMode.CLOSED, config=Config(startrek_token="t"), from_date=dt.date(2021, 5, 1)
+    )
+    find_mock.side_effect = FakeTracker(_issue(1, status="closed")).find
+    with mock.patch.object(client, "get_status_histories", side_effect=lambda issues: [None for _ in issues]):
+        client.sync_issues(store, mode=FilterMode.CLOSED, homework_filter=homework_filter)
+        assert "statusStartTime" in find_mock.call_args.kwargs["filter"]
+        client.sync_issues(store, mode=FilterMode.CLOSED, homework_filter=homework_filter)
+    assert _filters(find_mock)[-1] == {
+        "queue": "PCR",
+        "assignee": "me()",
+        "updatedAt": {"from": "2021-05-11T02:13:00.000+0000"},
+    }
+
+
+@mock.patch("yandex_tracker_client.collections.Issues.find")
+def test_sync_issues_drops_issues_gone_from_the_tracker(find_mock, client):
+    store = IssueStore()
+    kept, reassigned, deleted = _issue(1), _issue(2), _issue(3)
+    tracker = FakeTracker(kept, reassigned, deleted)
+    find_mock.side_effect = tracker.find
+    with mock.patch.object(client, "get_status_histories", side_effect=lambda issues: [None for _ in issues]):
+        issues, _ = client.sync_issues(store, mode=FilterMode.STANDARD)
+        assert [i.key for i in issues] == ["PCR-1", "PCR-2", "PCR-3"]
+
+        # Neither is returned by the incremental search, which filters by the assignee.
+        reassigned.assignee.login = "someone"
+        del tracker.by_key["PCR-3"]
+        tracker.listed = []
+        issues, _ = client.sync_issues(store, mode=FilterMode.STANDARD)
+    assert find_mock.call_args.kwargs == {"keys": ["PCR-1", "PCR-2", "PCR-3"]}
+    assert [i.key for i in issues] == ["PCR-1"]
+    assert list(store.issues) == ["PCR-1"]
+
+
+@mock.patch("yandex_tracker_client.collections.Issues.find")
+def test_stream_issues_pages(find_mock):
+    client = PraktikTrackerClient(token="fake-token", org_id="fake-org-id", page_size=2)
+    issues = [_issue(number) for number in range(1, 6)]
+    find_mock.return_value = iter(issues)
+    pages = []
+
+    def get_status_histories(page):
+        pages.append([issue.key for issue in page])
+        return [issue.key for issue in page]
+
+    with mock.patch.object(client, "get_status_histories", side_effect=get_status_histories):
+        streamed = list(client.stream_issues(mode=FilterMode.ALL))
+    assert find_mock.call_args.kwargs["per_page"] == 2
+    assert find_mock.call_args.kwargs["order"] == ["+key"]
+    assert pages == [["PCR-1", "PCR-2"], ["PCR-3", "PCR-4"], ["PCR-5"]]
+    assert streamed == [(issue, issue.key) for issue in issues]
+
+
+@mock.patch("yandex_tracker_client.collections.Issues.find")
+def test_get_assigned_issues_skips_reassigned(find_mock, client):
+    kept, reassigned, unassigned = _issue(1), _issue(2), _issue(3)
+    kept.assignee.login = "reviewer"
+    reassigned.assignee.login = "someone"
+    unassigned.assignee = None
+    find_mock.return_value = [kept, reassigned, unassigned]
+    with mock.patch.object(client, "get_status_histories", side_effect=lambda issues: [None for _ in issues]):
+        issues, histories = client.get_assigned_issues(["PCR-1", "PCR-2", "PCR-3"], "reviewer")
+    find_mock.assert_called_once_with(keys=["PCR-1", "PCR-2", "PCR-3"])
+    assert issues == [kept]
+    assert histories == [None]
+
+
+class ChangelogHandler(BaseHTTPRequestHandler):
+    paths_seen: list[str] = []
+
+    def do_GET(self):
+        self.paths_seen.append(self.path)
+        body = json.dumps([{"id": str(len(self.paths_seen))}]).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture()
+def tracker_url():
+    ChangelogHandler.paths_seen = []
+    server = HTTPServer(("127.0.0.1", 0), ChangelogHandler)
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.01}, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_cached_connection_serves_changelogs_from_disk_until_issue_updates(tracker_url, tmp_path):
+    def connect():
+        return CachedConnection("token", "org", base_url=tracker_url, cache_directory=tmp_path, retries=0)
+
+    connection = connect()
+    connection.forget_outdated_changelogs({"PCR-1": "2026-10-01T10:00:00.000+0000"})  # seen for the first time
+    first = connection.get("/v2/issues/PCR-1/changelog")
+    assert connect().get("/v2/issues/PCR-1/changelog") == first  # another run, same cache
+    assert len(ChangelogHandler.paths_seen) == 1
+
+    connection.forget_outdated_changelogs({"PCR-1": "2026-10-01T10:00:00.000+0000"})  # not updated
+    connection.get("/v2/issues/PCR-1/changelog")
+    assert len(ChangelogHandler.paths_seen) == 1
+
+    cached = list(connection.session.cache.responses.values())
+    assert [response.expires is not None for response in cached] == [True]  # so that the cache stays bounded
+
+    # The pages to be dropped are found by the issue key, without reading the whole cache.
+    with mock.patch.object(connection.session.cache, "filter", side_effect=AssertionError):
+        connection.forget_outdated_changelogs({"PCR-1": "2026-10-02T10:00:00.000+0000"})  # updated
+    assert connection.get("/v2/issues/PCR-1/changelog") != first
+    assert len(ChangelogHandler.paths_seen) == 2
@@ -0,0 +1,58 @@
+from unittest import mock
+
+from rich.table import Table
+
+from prpr.config import Config
+from prpr.filters import FilterMode, HomeworkFilter
+from prpr.homework import Homework
+from prpr.watch import Watcher
+
+
+def _issue(number, status="open", updated="2021-05-11T02:13:00.000+0000"):
+    issue = mock.Mock(key=f"PCR-{number}", updatedAt=updated, statusStartTime=updated)
+    issue.status.key = status
+    return issue
+
+
+def _build_homework(issue, transitions, config):
+    return Homework(
+        issue_key=issue.key,
+        lesson_name="",
+        summary=f"[1] Даниил Хармс (yuvachev{issue.key}@yandex.ru)",
+        cohort="1",
+        status=issue.status.key,
+        status_updated=issue.statusStartTime,
+        description="",
+        number=Homework.to_issue_key_number(issue.key),
+        course="backend-developer",
+    )
+
+
+def test_poll_updates_homeworks_in_place_and_highlights_new_and_reopened():
+    config = Config(startrek_token="token")
+    client = mock.Mock()
+    watcher = Watcher(
+        client,
+        user=None,
+        mode=FilterMode.ALL,
+        compile_filter=lambda config: HomeworkFilter.compile(FilterMode.ALL, config=config),
+        build_homework=mock.Mock(side_effect=_build_homework),
+        interval=60,
+    )
+    client.sync_issues.return_value = ([_issue(1), _issue(2, status="onTheSideOfUser")], [None, None])
+    with mock.patch("prpr.watch.get_config", return_value=config):
+        watcher.poll()
+        unchanged = watcher.homeworks["PCR-1"]
+        assert watcher.highlighted == set()
+
+        updated = "2021-05-12T02:13:00.000+0000"
+        client.sync_issues.return_value = (
+            [_issue(1), _issue(2, updated=updated), _issue(3, updated=updated)],
+            [None, None, None],
+        )
+        watcher.poll()
+    assert watcher.homeworks["PCR-1"] is unchanged
+    assert watcher.build_homework.call_count == 4
+    assert watcher.highlighted == {"PCR-2", "PCR-3"}
+    assert [h.issue_key for h in watcher.shown] == ["PCR-1", "PCR-2", "PCR-3"]
+    assert isinstance(watcher.render(), Table)
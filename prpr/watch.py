@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+import time
+from typing import Callable, Optional
+
+from loguru import logger
+from requests import RequestException
+from rich.console import Console, RenderableType
+from rich.live import Live
+from rich.text import Text
+from yandex_tracker_client.exceptions import TrackerClientError
+from yandex_tracker_client.objects import Resource
+
+from prpr.config import Config, get_config
+from prpr.filters import FilterMode, HomeworkFilter, HomeworkIndex
+from prpr.homework import Homework, StatusTransition
+from prpr.startrack_client import IssueStore, PraktikTrackerClient
+from prpr.table import build_issue_table
+
+RENDER_INTERVAL = 60  # seconds, "left" and "updated" are shown in minutes
+
+HomeworkBuilder = Callable[[Resource, Optional[list[StatusTransition]], Config], Homework]
+
+
+class Watcher:
+    """Keeps the review table on screen, updated in place.
+
+    Only the issues updated since the previous poll are fetched (see PraktikTrackerClient.sync_issues)
+    and only their homeworks are rebuilt; between the polls the table is re-rendered every minute
+    for the countdowns, without asking the tracker.
+    New tickets and the ones back to open or in review are highlighted while they stay open or in review.
+    """
+
+    def __init__(
+        self,
+        client: PraktikTrackerClient,
+        *,
+        user: Optional[str],
+        mode: FilterMode,
+        compile_filter: Callable[[Config], HomeworkFilter],
+        build_homework: HomeworkBuilder,
+        interval: int,
+        title: Optional[str] = None,
+        console: Optional[Console] = None,
+    ):
+        self.client = client
+        self.user = user
+        self.mode = mode
+        self.compile_filter = compile_filter
+        self.build_homework = build_homework
+        self.interval = max(interval, 1)
+        self.title = title
+        self.console = console or Console()
+        self.config: Optional[Config] = None
+        self.homework_filter: Optional[HomeworkFilter] = None
+        self.store = IssueStore()
+        self.homeworks: dict[str, Homework] = {}
+        self.versions: dict[str, str] = {}  # issue key -> updatedAt of the issue its homework was built from
+        self.highlighted: set[str] = set()
+        self.shown: Optional[list[Homework]] = None  # filtered and sorted, None until the first poll
+        self.index: Optional[HomeworkIndex] = None  # of the homeworks, built when they are refiltered unchanged
+        self.polls = 0
+
+    def run(self) -> None:
+        next_poll = time.monotonic()
+        with Live(console=self.console, auto_refresh=False) as live:
+            try:
+                while True:
+                    if time.monotonic() >= next_poll:
+                        self._poll_safely()
+                        next_poll = time.monotonic() + self.interval
+                    live.update(self.render(), refresh=True)
+                    seconds_to_next_minute = RENDER_INTERVAL - time.time() % RENDER_INTERVAL
+                    time.sleep(max(min(next_poll - time.monotonic(), seconds_to_next_minute), 0))
+            except KeyboardInterrupt:
+                pass
+
+    def _poll_safely(self) -> None:
+        try:
+            self.poll()
+        except (RequestException, TrackerClientError):
+            logger.exception("Failed to check the tracker, showing the last known tickets 😿")
+
+    def poll(self) -> None:
+        """Sync the issues, rebuild the homeworks of the new and updated ones."""
+        self.config = get_config(reload_if_changed=True)
+        previous_filter, self.homework_filter = self.homework_filter, self.compile_filter(self.config)
+        issues, status_histories = self.client.sync_issues(
+            self.store, user=self.user, mode=self.mode, homework_filter=self.homework_filter
+        )
+        homeworks = {}
+        changed = False
+        for issue, transitions in zip(issues, status_histories):
+            homework = self.homeworks.get(issue.key)
+            if homework is None or self.versions[issue.key] != issue.updatedAt:
+                previous, homework = homework, self.build_homework(issue, transitions, self.config)
+                self.versions[issue.key] = issue.updatedAt
+                if self.polls and homework.open_or_in_review and not (previous and previous.open_or_in_review):
+                    self.highlighted.add(issue.key)
+                changed = True
+            homeworks[issue.key] = homework
+        changed = changed or homeworks.keys() != self.homeworks.keys()
+        self.homeworks = homeworks
+        self.highlighted = {key for key in self.highlighted if key in homeworks and homeworks[key].open_or_in_review}
+        if changed or self.shown is None:
+            self.index = None
+            self.shown = sorted(self.homework_filter.apply(homeworks.values()), key=Homework.order_key)
+        elif self.homework_filter != previous_filter:
+            if self.index is None:
+                self.index = HomeworkIndex(list(homeworks.values()))
+            self.shown = sorted(self.index.select(self.homework_filter), key=Homework.order_key)
+        self.polls += 1
+        logger.debug(f"Poll #{self.polls}: {len(homeworks)} homeworks, {len(self.highlighted)} highlighted.")
+
+    def render(self) -> RenderableType:
+        if self.shown is None:
+            return Text("Checking the tracker...")
+        if not (homeworks := self.shown):
+            return Text("No homeworks for chosen filter combination.")
+        return build_issue_table(
+            homeworks,
+            self.mode,
+            title=self.title,
+            table_appearance=self.config.table_appearance,
+            highlighted=self.highlighted,
+        )